@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from param_sweep import ParameterSweep
+
+
+class AllocationOptimizer:
+    """
+    invest_planの投資比率(グライドパス)を探索し、target_yearにasset_thresholdを超える確率を
+    最大化する(各年の破産率の最大値がcrash_ratio_cap以下という制約付き)
+    - 投資比率はn_knots個の年(等間隔)での各銘柄の比率を線形補間し、各年で合計1に正規化する
+      (n_knots=2で開始年から最終年への直線のグライドパス、n_knots=年数で毎年の比率)
+    - 乱数(各銘柄の利回り)は最初に一度だけ引いて全候補で共通に使う(共通乱数法)
+    - 座標探索: 各パラメータを±stepした候補をまとめて配列で計算し、最も良い候補に移る。
+      改善がなければstepを半分にし、min_step未満になるかmax_iterで終了する
+    - 制約はペナルティ(penalty×超過分)として目的関数から引く
+    """
+
+    def __init__(self,
+                 return_distribution_dict,
+                 invest_plan,
+                 asset_plan,
+                 initial_year,
+                 initial_cash,
+                 initial_invest_asset,
+                 inflation_rate,
+                 rng=None,
+                 joint_return_distribution=None,
+                 sampling="random",
+                 stratified_groups=10,
+                 compiled_plan=None):
+        self.sweep = ParameterSweep(return_distribution_dict,
+                                    invest_plan,
+                                    asset_plan,
+                                    initial_year,
+                                    initial_cash,
+                                    initial_invest_asset,
+                                    inflation_rate,
+                                    rng=rng,
+                                    joint_return_distribution=
+                                    joint_return_distribution,
+                                    sampling=sampling,
+                                    stratified_groups=stratified_groups,
+                                    compiled_plan=compiled_plan)
+        self.stock_list = self.sweep.stock_list
+
+    def _get_knot_idx(self, n_years: int, n_knots: int):
+        return np.linspace(0, n_years - 1, n_knots)
+
+    def get_weight_path(self, knot_weights, n_years: int):
+        """
+        (n_knots, 銘柄数)の比率を線形補間して(年数, 銘柄数)の投資比率にする
+        """
+        knot_idx = self._get_knot_idx(n_years, len(knot_weights))
+        year_idx = np.arange(n_years)
+        weight_path = np.column_stack([
+            np.interp(year_idx, knot_idx, knot_weights[:, j])
+            for j in range(len(self.stock_list))
+        ])
+        total = weight_path.sum(axis=1, keepdims=True)
+        # 全銘柄0の年は均等にする
+        return np.where(total > 0, weight_path / np.where(total > 0, total, 1),
+                        1 / len(self.stock_list))
+
+    def _get_initial_knot_weights(self, n_knots: int, n_years: int):
+        """
+        元のinvest_planの比率をn_knots個の年で取り出す
+        """
+        plan_weights = self.sweep.plan.weights[:n_years]
+        knot_idx = np.round(self._get_knot_idx(n_years, n_knots)).astype(int)
+        return np.clip(plan_weights[knot_idx], 0, 1)
+
+    def _evaluate(self, candidates, rates, n, target_year_idx,
+                  asset_threshold, crash_ratio_cap, penalty):
+        """
+        候補(n_knots, 銘柄数)のリストをまとめて計算し、(ペナルティ込みの目的関数, 各指標)を返す
+        """
+        n_years = target_year_idx + 1
+        points = [{
+            "weight_path": self.get_weight_path(c, n_years)
+        } for c in candidates]
+        metrics = self.sweep.simulate_points(points, rates, n,
+                                              target_year_idx, asset_threshold)
+        score = metrics["achieve_ratio"] - penalty * np.maximum(
+            metrics["max_crash_ratio"] - crash_ratio_cap, 0)
+        return score, metrics
+
+    def optimize(self,
+                 n: int,
+                 target_year: int,
+                 asset_threshold: float,
+                 crash_ratio_cap: float = 0.05,
+                 n_knots: int = 2,
+                 step: float = 0.25,
+                 min_step: float = 0.02,
+                 max_iter: int = 50,
+                 penalty: float = 10.0):
+        """
+        投資比率を探索し、(年ごとの最適な投資比率のDataFrame, 探索履歴のDataFrame)を返す
+        - n: ライフ数
+        - target_year: asset_thresholdの達成率を評価する年
+        - crash_ratio_cap: target_yearまでの各年の破産率の上限
+        - n_knots: グライドパスの折れ点の数
+        - step, min_step: 座標探索の初期ステップ幅と終了するステップ幅
+        - max_iter: 最大反復回数
+        - penalty: 破産率が上限を超えた分にかける係数
+        """
+        years = self.sweep.get_years()
+        if target_year not in years:
+            raise ValueError(f"target_yearが計算範囲外です: {target_year}")
+        target_year_idx = int(np.flatnonzero(years == target_year)[0])
+        n_years = target_year_idx + 1
+        rates = self.sweep.draw_common_returns(n, n_years)
+        eval_args = (rates, n, target_year_idx, asset_threshold,
+                     crash_ratio_cap, penalty)
+
+        best = self._get_initial_knot_weights(n_knots, n_years)
+        score, metrics = self._evaluate([best], *eval_args)
+        best_score = score[0]
+        history = [{
+            "iteration": 0,
+            "step": step,
+            "score": best_score,
+            "achieve_ratio": metrics["achieve_ratio"][0],
+            "max_crash_ratio": metrics["max_crash_ratio"][0]
+        }]
+
+        for iteration in range(1, max_iter + 1):
+            if step < min_step:
+                break
+            # 各パラメータを±stepした候補
+            candidates = []
+            for i in range(best.shape[0]):
+                for j in range(best.shape[1]):
+                    for sign in (1, -1):
+                        candidate = best.copy()
+                        candidate[i, j] = np.clip(candidate[i, j] + sign * step,
+                                                  0, 1)
+                        if not np.array_equal(candidate, best):
+                            candidates.append(candidate)
+            score, metrics = self._evaluate(candidates, *eval_args)
+            i_best = int(np.argmax(score))
+            if score[i_best] > best_score:
+                best = candidates[i_best]
+                best_score = score[i_best]
+                achieve_ratio = metrics["achieve_ratio"][i_best]
+                max_crash_ratio = metrics["max_crash_ratio"][i_best]
+            else:
+                step /= 2
+                achieve_ratio = history[-1]["achieve_ratio"]
+                max_crash_ratio = history[-1]["max_crash_ratio"]
+            history.append({
+                "iteration": iteration,
+                "step": step,
+                "score": best_score,
+                "achieve_ratio": achieve_ratio,
+                "max_crash_ratio": max_crash_ratio
+            })
+
+        weight_path = self.get_weight_path(best, n_years)
+        allocation_df = pd.DataFrame(weight_path, columns=self.stock_list)
+        allocation_df.insert(0, "year", years[:n_years] - 1)
+        return allocation_df, pd.DataFrame(history)
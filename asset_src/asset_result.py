@@ -0,0 +1,219 @@
+import os
+import numpy as np
+import pandas as pd
+
+from histogram import get_histograms
+
+# 保持する資産の種類(各々が(年数, ライフ数)の配列)
+FIELDS = ("cash", "invest", "total", "profit", "rate")
+
+
+class AssetResult:
+    """
+    複数人生の資産シミュレーション結果
+    - cash, invest, total, profit, rateをそれぞれ(年数, ライフ数)の連続した配列で保持する
+    - DataFrameは描画・出力で必要になったときだけ作成する
+    - create_memmap/open_memmapでoutput_dir以下の.npyファイルにメモリマップすることもできる
+      (集計は年(行)ごとに行うため、全体をメモリに読み込まない)
+    """
+
+    def __init__(self, years, number_of_life: int, dtype="float64",
+                 planes: dict = None):
+        """
+        years: 各行の年
+        number_of_life: ライフ数
+        dtype: 保持する配列のdtype("float64" or "float32")
+        planes: 作成済みの配列{field: (年数, ライフ数)の配列}。Noneの場合は確保する
+        """
+        self.years = np.asarray(years)
+        self.number_of_life = number_of_life
+        self.dtype = np.dtype(dtype)
+        if planes is None:
+            planes = {
+                field: np.empty((len(self.years), number_of_life),
+                                dtype=self.dtype)
+                for field in FIELDS
+            }
+        self.planes = planes
+
+    @property
+    def cash(self):
+        return self.planes["cash"]
+
+    @property
+    def invest(self):
+        return self.planes["invest"]
+
+    @property
+    def total(self):
+        return self.planes["total"]
+
+    @property
+    def profit(self):
+        return self.planes["profit"]
+
+    @property
+    def rate(self):
+        return self.planes["rate"]
+
+    @classmethod
+    def create_memmap(cls, out_dir, years, number_of_life: int,
+                      dtype="float64"):
+        """
+        out_dir以下に{field}.npyを作成し、それにメモリマップした結果を返す
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(f"{out_dir}/years.npy", np.asarray(years))
+        planes = {
+            field:
+            np.lib.format.open_memmap(f"{out_dir}/{field}.npy",
+                                      mode="w+",
+                                      dtype=dtype,
+                                      shape=(len(years), number_of_life))
+            for field in FIELDS
+        }
+        return cls(years, number_of_life, dtype=dtype, planes=planes)
+
+    @classmethod
+    def open_memmap(cls, out_dir, mode: str = "r"):
+        """
+        create_memmapで作成した.npyファイルをメモリマップで開く
+        - mode: "r"(読み込みのみ) or "r+"(書き込みも行う)
+        """
+        years = np.load(f"{out_dir}/years.npy")
+        planes = {
+            field: np.load(f"{out_dir}/{field}.npy", mmap_mode=mode)
+            for field in FIELDS
+        }
+        number_of_life = planes["total"].shape[1]
+        return cls(years,
+                   number_of_life,
+                   dtype=planes["total"].dtype,
+                   planes=planes)
+
+    def save(self, out_dir):
+        """
+        open_memmapで開ける形式(out_dir/{field}.npy)で保存する
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(f"{out_dir}/years.npy", self.years)
+        for field, plane in self.planes.items():
+            np.save(f"{out_dir}/{field}.npy", plane)
+
+    def get_lives(self, start: int, stop: int):
+        """
+        start~stop列目のライフのビューを返す(コピーしないので書き込みは元の配列に反映される)
+        """
+        planes = {
+            field: plane[:, start:stop]
+            for field, plane in self.planes.items()
+        }
+        return AssetResult(self.years,
+                           stop - start,
+                           dtype=self.dtype,
+                           planes=planes)
+
+    def flush(self):
+        """
+        メモリマップの場合、書き込んだ内容をファイルに反映する
+        """
+        for plane in self.planes.values():
+            if isinstance(plane, np.memmap):
+                plane.flush()
+
+    @classmethod
+    def concatenate(cls, results):
+        """
+        ライフ方向(列方向)に複数の結果を結合する
+        """
+        planes = {
+            field:
+            np.concatenate([result.planes[field] for result in results],
+                           axis=1)
+            for field in FIELDS
+        }
+        return cls(results[0].years,
+                   sum(result.number_of_life for result in results),
+                   dtype=results[0].dtype,
+                   planes=planes)
+
+    def set_year(self, year_idx: int, cash, invest, total, profit, rate):
+        """
+        year_idx行目に全ライフ分の値を書き込む(ベクトル計算用)
+        """
+        self.planes["cash"][year_idx] = cash
+        self.planes["invest"][year_idx] = invest
+        self.planes["total"][year_idx] = total
+        self.planes["profit"][year_idx] = profit
+        self.planes["rate"][year_idx] = rate
+
+    def set_life(self, life_idx: int, a_life_assets_dict: dict):
+        """
+        life_idx列目に一回の人生の結果(AssetSim.get_role_play_assetsの戻り値)を書き込む
+        """
+        self.planes["cash"][:, life_idx] = a_life_assets_dict["cash"]
+        self.planes["invest"][:, life_idx] = a_life_assets_dict["invest"]
+        self.planes["total"][:, life_idx] = a_life_assets_dict["assets"]
+        self.planes["profit"][:, life_idx] = a_life_assets_dict["profits"]
+        self.planes["rate"][:, life_idx] = a_life_assets_dict["rates"]
+
+    def has_year(self, year) -> bool:
+        return year in self.years
+
+    def values_at(self, year, field: str = "total"):
+        """
+        指定した年の全ライフの値を返す
+        """
+        year_idx = int(np.flatnonzero(self.years == year)[0])
+        return self.planes[field][year_idx]
+
+    def get_achive_ratio(self, asset_threshold, field: str = "total"):
+        """
+        各年でasset_thresholdを超えるライフの割合を返す
+        """
+        # メモリマップでも全体を読み込まないよう年(行)ごとに数える
+        achievement_counts = np.array([
+            np.count_nonzero(row >= asset_threshold)
+            for row in self.planes[field]
+        ])
+        return achievement_counts / self.number_of_life
+
+    def get_quantile(self, q, field: str = "total"):
+        """
+        各年のq分位点(線形補間)を返す
+        """
+        return np.array([
+            np.quantile(row, q, method="linear") for row in self.planes[field]
+        ])
+
+    def get_histogram(self, year, bins: int = 20, field: str = "total"):
+        """
+        指定した年の全ライフの値のヒストグラム(counts, bin_edges)を返す
+        """
+        return np.histogram(self.values_at(year, field), bins=bins)
+
+    def get_histograms(self,
+                       years,
+                       bins: int = 20,
+                       log_bins: bool = False,
+                       kde: bool = False,
+                       field: str = "total"):
+        """
+        指定した全ての年のヒストグラム{年: histogram.get_histogramsの結果}を返す
+        (対象の年の行だけを一度読み込んでまとめて計算する)
+        """
+        year_idx = [int(np.flatnonzero(self.years == year)[0]) for year in years]
+        histograms = get_histograms(self.planes[field][year_idx],
+                                    bins=bins,
+                                    log_bins=log_bins,
+                                    kde=kde)
+        return dict(zip(years, histograms))
+
+    def to_frame(self, field: str = "total"):
+        """
+        indexが年、列がsimulation_{i}のDataFrameを作成する
+        """
+        return pd.DataFrame(
+            self.planes[field],
+            index=pd.Index(self.years, name="year"),
+            columns=[f'simulation_{i+1}' for i in range(self.number_of_life)])
@@ -1,16 +1,33 @@
 import os, sys
 import numpy as np
 import pandas as pd
-from IPython.display import display
-import plotly.graph_objects as go
 
 # from asset.asset_src.assetsim import AssetSim
 # from asset.asset_src.input_generator import InputGenerator
 # from asset.asset_src.tbase_for_asset import Base_class
 
+from asset_result import AssetResult
+from allocation_optimizer import AllocationOptimizer
 from assetsim import AssetSim
 from input_generator import InputGenerator
-from tbase_for_asset import Base_class
+from param_sweep import ParameterSweep, get_sweep_heatmap_figure_spec
+from renderers import get_renderer, render_figures
+from parallel_runner import get_multi_role_play_assets_parallel, split_number_of_life
+from random_generator import make_rng
+from result_cache import ResultCache, make_cache_key
+from result_export import export_result, export_summary
+import return_database
+from stage_timer import StageTimer
+from tbase_for_asset import Base_class, save_dict_as_json
+from variance_reduction import get_sampling_units
+
+
+def read_database_csv(csv_in):
+    """
+    databaseのCSVを読み込む
+    (return_databaseの.npzと同じ値になるよう、小数を正確に丸めて読み込む)
+    """
+    return pd.read_csv(csv_in, float_precision="round_trip")
 
 
 class AssetSimulator(Base_class):
@@ -20,8 +37,70 @@ class AssetSimulator(Base_class):
         - 
     """
 
-    def __init__(self, js_in):
+    def __init__(self, js_in, return_distribution_cache: dict = None):
+        """
+        js_in: condition.jsonのパス
+        return_distribution_cache: 読み込み済みの利回り分布{csvのパス: DataFrame}
+            (複数シナリオで同じdatabaseを読み直さないために使う)
+        """
+        self.return_distribution_cache = return_distribution_cache
+        # condition.jsonで省略可能な設定のデフォルト値
+        self.engine = "python"
+        self.workers = 1
+        self.number_of_chunks = None
+        self.seed = None
+        self.bit_generator = "PCG64"
+        self.result_dtype = "float64"
+        self.stream_mode = False
+        self.stream_block_size = 10000
+        self.stream_relative_accuracy = 0.01
+        self.memmap_output = False
+        self.export_format = None
+        self.export_block_size = 10000
+        self.use_cache = False
+        self.cache_dir = None
+        self.cache_max_bytes = 2 * 1024**3
+        self.cache_invalidate = False
+        self.incremental_mode = True
+        self.sweep = None
+        self.optimize_allocation = None
+        self.joint_returns = False
+        self.joint_return_table = None
+        self.compiled_database = False
+        # Falseの場合は描画せず(plotly/matplotlibを読み込まない)、数値だけを出力する
+        self.plot = True
+        # 利回りの引き方(random, antithetic, stratified)とstratifiedのグループ数
+        self.sampling = "random"
+        self.stratified_groups = 10
+        # 破産率の推定に利回りの累積和を制御変量として使うか
+        self.control_variate = False
+        # trueの場合、check_yearsの破産率・達成率の信頼区間の幅がadaptive_interval_width以下になるまで
+        # adaptive_block_sizeずつライフを追加する(number_of_lifeが上限)
+        self.adaptive_mode = False
+        self.adaptive_block_size = 1000
+        self.adaptive_interval_width = 0.02
+        self.adaptive_confidence = 0.95
+        # 各段階の時間・ピークメモリをoutput_dir/timings.jsonに出力するか
+        self.timings = True
+        # trueの場合、timings.jsonに各段階で確保したメモリのピーク(tracemalloc)も出力する(計算が遅くなる)
+        self.trace_memory = False
+        # trueの場合、cProfileの結果をoutput_dir/profile.pstats, profile.txtに出力する
+        self.profile = False
+        # 図を並列に描画するプロセス数
+        self.render_workers = 1
+        # 全ての図をまとめたreport.htmlも出力するか(plotly.jsはplotlyjsの読み込み方に合わせる)
+        self.html_report = False
+        # plotlyの各htmlでのplotly.jsの読み込み方("inline", "directory", "cdn")
+        self.plotlyjs = "inline"
+        # 資産分布のヒストグラムのビン数(Noneの場合はmatplotlib: 20, plotly: 50)
+        self.histogram_bins = None
+        # 資産分布のビンを対数で等間隔にするか
+        self.histogram_log_bins = False
+        # 資産分布にカーネル密度推定の曲線を重ねるか
+        self.histogram_kde = False
         super().__init__(js_in)
+        self.timer = StageTimer(trace_memory=self.trace_memory,
+                                profile=self.profile)
 
     def _read_asset_plan(self):
         IG = InputGenerator()
@@ -29,12 +108,48 @@ class AssetSimulator(Base_class):
         self.asset_plan_df, self.asset_plan, self.invest_plan_df, self.invest_plan = IG.get_asset_plan(
             self.asset_plan_in)
         self.stock_list = self.invest_plan_df.columns
+        # 計算用の配列にまとめた計画(各エンジンはこれを使う)
+        self.compiled_plan = IG.compiled_plan.with_inflation_rate(
+            self.inflation_rate)
+
+    def _read_database_csv(self, csv_in):
+        if self.return_distribution_cache is not None and os.path.abspath(
+                csv_in) in self.return_distribution_cache:
+            return self.return_distribution_cache[os.path.abspath(csv_in)]
+        return read_database_csv(csv_in)
 
     def _read_return_distribution(self):
+        if self.compiled_database:
+            self._read_compiled_return_distribution()
+            return
         self.return_distribution_dict = {
-            k: pd.read_csv(f"{self.sock_database_path}/{k}.csv")
-            for k in self.stock_list
+            k: self._read_database_csv(csv_in)
+            for k, csv_in in zip(self.stock_list, self._get_database_paths())
         }
+        # 複数銘柄の同じ期間の利回りの表(銘柄間の相関を保って選ぶ)
+        self.joint_return_distribution = self._read_database_csv(
+            self._get_joint_return_path()) if self.joint_returns else None
+
+    def _read_compiled_return_distribution(self):
+        """
+        databaseのCSVをまとめた.npz(return_database)からサンプラーを読み込む
+        CSVの方が新しい場合は.npzを作り直す
+        """
+        npz_path = return_database.get_default_path(self.sock_database_path)
+        if return_database.is_stale(self.sock_database_path, npz_path):
+            print(f"{npz_path}を作成します")
+            return_database.compile_return_database(self.sock_database_path,
+                                                    npz_path)
+        self.return_distribution_dict, joint_sampler = return_database.load_return_database(
+            npz_path, self.stock_list)
+        self.joint_return_distribution = None
+        if self.joint_returns:
+            # joint_return_tableを指定した場合はそのCSVを使う
+            self.joint_return_distribution = joint_sampler if self.joint_return_table is None else self._read_database_csv(
+                self.joint_return_table)
+            if self.joint_return_distribution is None:
+                raise FileNotFoundError(
+                    f"{self.sock_database_path}/joint_returns.csvがありません")
 
     def _cal_main(self):
         AS_cond = {
@@ -44,102 +159,543 @@ class AssetSimulator(Base_class):
             "initial_year": self.initial_year,
             "initial_cash": self.initial_cash,
             "initial_invest_asset": self.initial_invest_asset,
-            "inflation_rate": self.inflation_rate
+            "inflation_rate": self.inflation_rate,
+            "joint_return_distribution": self.joint_return_distribution,
+            "sampling": self.sampling,
+            "stratified_groups": self.stratified_groups,
+            "compiled_plan": self.compiled_plan
         }
-        AS = AssetSim(**AS_cond)
+        AS = AssetSim(**AS_cond,
+                      rng=make_rng(self.seed, self.bit_generator))
+        self.asset_sim = AS
+        # 描画する図の仕様(計算が終わってからまとめて描画する)
+        self.figure_specs = []
 
         # 一回の人生を計算
         if self.single_life_mode:
-            AS.get_role_play_assets()
-            AS.plot_role_play_assets(
-                save_name=f"{self.output_dir}/one_life_asset",
-                is_show=self.is_show,
-                mode=self.fig_mode)
+            with self.timer.stage("simulate"):
+                AS.get_role_play_assets()
+            if self.plot:
+                with self.timer.stage("aggregate"):
+                    self.figure_specs.append(
+                        AS.get_role_play_assets_figure_spec())
+            else:
+                with self.timer.stage("write"):
+                    AS.get_role_play_asset_result_df().to_csv(
+                        f"{self.output_dir}/one_life_asset.csv", index=False)
 
         # number_of_lifeの人生を計算
         if self.multi_life_mode:
-            AS.get_multi_role_play_assets(self.number_of_life)
+            with self.timer.stage("simulate"):
+                # 同じ入力で計算済みの場合はキャッシュの結果を使う
+                result = self._load_cached_result()
+                if result is None:
+                    # asset_planの前半が同じ計算済みの結果があれば変わった年から再計算する
+                    resume_from = self._find_resume_checkpoint()
+                    self._simulate_multi_life(AS, AS_cond, resume_from)
+                    self._save_cached_result(AS)
+                else:
+                    self._set_cached_result(AS, result)
+            with self.timer.stage("aggregate"):
+                estimate_df = None
+                if self._use_variance_reduction() and isinstance(
+                        AS.result, AssetResult):
+                    estimate_df = self.get_crash_ratio_estimate()
+                if self.plot:
+                    self.figure_specs += self._get_multi_life_figure_specs(AS)
+                else:
+                    summary = self.get_summary()
+            with self.timer.stage("write"):
+                if estimate_df is not None:
+                    estimate_df.to_csv(
+                        f"{self.output_dir}/crash_ratio_estimate.csv",
+                        index=False)
+                if not self.plot:
+                    save_dict_as_json(summary,
+                                      f"{self.output_dir}/summary.json")
+                if self.export_format:
+                    self._export_result(AS)
+
+        # パラメータをグリッドで変えて計算
+        if self.sweep:
+            with self.timer.stage("sweep"):
+                self._run_sweep(AS_cond)
+
+        # 投資比率の探索
+        if self.optimize_allocation:
+            with self.timer.stage("optimize_allocation"):
+                self._run_allocation_optimizer(AS_cond)
+
+        if self.plot and self.figure_specs:
+            with self.timer.stage("render"):
+                self._render_figures()
+
+    def _save_timings(self):
+        """
+        各段階の時間・メモリをoutput_dir/timings.jsonに、
+        profileの場合はプロファイル結果をoutput_dir/profile.pstats, profile.txtに保存する
+        """
+        if self.timings:
+            save_dict_as_json(self.timer.to_dict(),
+                              f"{self.output_dir}/timings.json")
+        self.timer.save_profile(f"{self.output_dir}/profile")
+
+    def _get_renderer_options(self):
+        return {"include_plotlyjs": self.plotlyjs} if self.fig_mode == "plotly" else {}
+
+    def _get_multi_life_figure_specs(self, AS):
+        bins = self.histogram_bins or get_renderer(
+            self.fig_mode, **self._get_renderer_options()).histogram_bins
+        check_years = []
+        for check_year in self.check_years:
+            if AS.result.has_year(check_year):
+                check_years.append(check_year)
+            else:
+                print(f"データに{check_year}年が見つかりません。")
+        specs = AS.get_asset_distribution_figure_specs(
+            check_years,
+            bins,
+            log_bins=self.histogram_log_bins,
+            kde=self.histogram_kde)
+        specs.append(AS.get_achive_ratio_figure_spec(self.asset_threshold))
+        specs.append(AS.get_asset_transition_figure_spec(self.achieve_percents))
+        specs.append(AS.get_crash_ratio_figure_spec())
+        return specs
+
+    def _render_figures(self):
+        """
+        figure_specsの図をoutput_dirに描画する
+        (render_workersが2以上の場合は並列に描画し、html_reportの場合はreport.htmlにもまとめる)
+        """
+        return render_figures(
+            self.figure_specs,
+            self.output_dir,
+            mode=self.fig_mode,
+            workers=self.render_workers,
+            is_show=self.is_show,
+            report_name="report" if self.html_report else None,
+            **self._get_renderer_options())
+
+    def _simulate_multi_life(self, AS, AS_cond, resume_from=None):
+        """
+        number_of_lifeの人生を計算し、結果をASに設定する
+        - resume_from: 途中の年から再計算する場合のチェックポイント(_find_resume_checkpoint)
+        """
+        # 一回の人生の計算で使った乱数によらないよう乱数生成器を作り直す
+        AS.rng = make_rng(self.seed, self.bit_generator)
+        stream_cond = self._get_stream_cond()
+        # 全ライフの結果をoutput_dir以下の.npyにメモリマップで書き込む
+        memmap_dir = f"{self.output_dir}/asset_result" if self.memmap_output else None
+        if self.adaptive_mode:
+            # 信頼区間の幅が目標に達するまでブロックごとに計算(一つのプロセスで計算する)
+            if self._is_parallel() or self.memmap_output:
+                raise ValueError(
+                    "adaptive_modeはworkers(2以上), number_of_chunks, memmap_outputと同時に指定できません")
+            # 計画にないcheck_yearsは除く(描画・要約と同じ)
             for check_year in self.check_years:
-                AS.plot_asset_distribution(
-                    check_year,
-                    save_name=
-                    f"{self.output_dir}/asset_distribution_in_{check_year}y",
-                    is_show=self.is_show,
-                    mode=self.fig_mode)
-            AS.plot_achive_ratio(
+                if check_year not in AS.get_years():
+                    print(f"データに{check_year}年が見つかりません。")
+            if stream_cond is not None:
+                stream_cond = {
+                    k: v
+                    for k, v in stream_cond.items() if k != "block_size"
+                }
+            history_df = AS.get_multi_role_play_assets_adaptive(
+                self.number_of_life,
+                self.check_years,
                 self.asset_threshold,
-                save_name=
-                f"{self.output_dir}/achive_ratio_{self.asset_threshold}",
-                is_show=self.is_show,
-                mode=self.fig_mode)
-            achieve_percents_name = "_".join(
-                [str(x) for x in self.achieve_percents])
-            AS.plot_asset_transition(
-                self.achieve_percents,
-                save_name=
-                f"{self.output_dir}/asset_transition_{achieve_percents_name}",
-                is_show=self.is_show,
-                mode=self.fig_mode)
-            AS.plot_crash_ratio(save_name=f"{self.output_dir}/crash_ratio",
-                                is_show=self.is_show,
-                                mode=self.fig_mode)
+                block_size=self.adaptive_block_size,
+                interval_width=self.adaptive_interval_width,
+                confidence=self.adaptive_confidence,
+                dtype=self.result_dtype,
+                stream_cond=stream_cond)
+            history_df.to_csv(f"{self.output_dir}/adaptive_history.csv",
+                              index=False)
+            print(f"{AS.n}ライフで終了しました "
+                  f"(信頼区間の幅: {history_df['max_interval_width'].iloc[-1]:.4f})")
+        elif self._is_parallel():
+            # チャンクに分けてプロセス並列で計算
+            result = get_multi_role_play_assets_parallel(
+                AS_cond,
+                self.number_of_life,
+                workers=self.workers,
+                number_of_chunks=self.number_of_chunks,
+                seed=self.seed,
+                engine=self.engine,
+                bit_generator=self.bit_generator,
+                dtype=self.result_dtype,
+                stream_cond=stream_cond,
+                memmap_dir=memmap_dir)
+            AS.set_result(result)
+        elif self.stream_mode:
+            AS.get_multi_role_play_assets_stream(self.number_of_life,
+                                                 **stream_cond)
+        elif self.memmap_output:
+            out = AssetResult.create_memmap(memmap_dir, AS.get_years(),
+                                            self.number_of_life,
+                                            self.result_dtype)
+            AS.get_multi_role_play_assets(self.number_of_life,
+                                          engine=self.engine,
+                                          dtype=self.result_dtype,
+                                          out=out,
+                                          resume_from=resume_from)
+            out.flush()
+            # 以降の集計・描画は読み込み専用のメモリマップから行う
+            AS.set_result(AssetResult.open_memmap(memmap_dir, mode="r"))
+        else:
+            AS.get_multi_role_play_assets(self.number_of_life,
+                                          engine=self.engine,
+                                          dtype=self.result_dtype,
+                                          resume_from=resume_from)
+
+    def _run_sweep(self, AS_cond):
+        """
+        condition.jsonのsweepの設定でグリッド計算を行い、表とヒートマップを出力する
+        sweep: {
+            "grid": {パラメータ名: 値のリスト}(ParameterSweepを参照),
+            "target_year": 目的関数を評価する年(省略時は最終年),
+            "number_of_life": 各グリッド点のライフ数(省略時はnumber_of_life),
+            "objective": ヒートマップに描く目的関数(省略時はcrash_ratio),
+            "heatmap_axes": [x軸, y軸](省略時はgridの先頭2つ)
+        }
+        """
+        PS = ParameterSweep(**AS_cond,
+                            rng=make_rng(self.seed, self.bit_generator))
+        grid = self.sweep["grid"]
+        sweep_df = PS.run(
+            grid,
+            self.sweep.get("number_of_life", self.number_of_life),
+            self.sweep.get("target_year", int(PS.get_years()[-1])),
+            asset_threshold=self.asset_threshold)
+        sweep_df.to_csv(f"{self.output_dir}/sweep_result.csv", index=False)
+        self.sweep_df = sweep_df
+
+        heatmap_axes = self.sweep.get("heatmap_axes", list(grid)[:2])
+        if self.plot and len(heatmap_axes) == 2:
+            objective = self.sweep.get("objective", "crash_ratio")
+            self.figure_specs.append(
+                get_sweep_heatmap_figure_spec(sweep_df, heatmap_axes[0],
+                                              heatmap_axes[1], objective))
+
+    def _run_allocation_optimizer(self, AS_cond):
+        """
+        condition.jsonのoptimize_allocationの設定で投資比率を探索し、結果を出力する
+        optimize_allocation: {
+            "target_year": asset_thresholdの達成率を評価する年(省略時は最終年),
+            "crash_ratio_cap": 各年の破産率の上限(省略時は0.05),
+            "number_of_life": ライフ数(省略時はnumber_of_life),
+            その他AllocationOptimizer.optimizeの引数(n_knots, step, min_step, max_iter, penalty)
+        }
+        """
+        AO = AllocationOptimizer(**AS_cond,
+                                 rng=make_rng(self.seed, self.bit_generator))
+        optimize_cond = dict(self.optimize_allocation)
+        n = optimize_cond.pop("number_of_life", self.number_of_life)
+        target_year = optimize_cond.pop("target_year",
+                                        int(AO.sweep.get_years()[-1]))
+        allocation_df, history_df = AO.optimize(n, target_year,
+                                                self.asset_threshold,
+                                                **optimize_cond)
+        allocation_df.to_csv(f"{self.output_dir}/optimized_allocation.csv",
+                             index=False)
+        history_df.to_csv(
+            f"{self.output_dir}/allocation_optimization_history.csv",
+            index=False)
+        print(history_df.iloc[-1].to_string())
+
+    def get_summary(self):
+        """
+        複数人生の計算結果の要約(破産率・check_yearsでのasset_threshold達成率)を返す
+        """
+        AS = self.asset_sim
+        AS.get_achive_ratio(self.asset_threshold)
+        achieve_ratio = AS.achieve_ratio_df.set_index("year")["achieve_ratio"]
+        crash_ratio = AS.get_crash_ratio().set_index("year")["crash_ratio"]
+        summary = {
+            "number_of_life": AS.n,
+            "final_year": int(crash_ratio.index[-1]),
+            "final_crash_ratio": float(crash_ratio.iloc[-1]),
+            "max_crash_ratio": float(crash_ratio.max()),
+        }
+        if self.adaptive_mode:
+            widths = AS.get_ratio_interval_widths(
+                [y for y in self.check_years if AS.result.has_year(y)],
+                self.asset_threshold, self.adaptive_confidence)
+            summary["max_interval_width"] = max(widths.values(), default=0.0)
+            summary["adaptive_converged"] = bool(
+                summary["max_interval_width"] <= self.adaptive_interval_width)
+        if isinstance(AS.result, AssetResult):
+            estimate = self.get_crash_ratio_estimate().iloc[-1]
+            if self.control_variate:
+                summary["final_crash_ratio_cv"] = float(estimate["crash_ratio"])
+            summary["final_crash_ratio_standard_error"] = float(
+                estimate["standard_error"])
+            summary["effective_sample_size"] = float(
+                estimate["effective_sample_size"])
+        for check_year in self.check_years:
+            if check_year in achieve_ratio.index:
+                summary[f"achieve_ratio_{check_year}y"] = float(
+                    achieve_ratio.loc[check_year])
+        return summary
+
+    def _use_variance_reduction(self):
+        return self.sampling != "random" or self.control_variate
+
+    def get_crash_ratio_estimate(self):
+        """
+        各年の破産率の推定値・標準誤差・有効サンプルサイズ
+        (sampling・並列計算のチャンクに応じた独立な単位で誤差を推定し、control_variateの場合は制御変量で補正する)
+        """
+        n = self.asset_sim.n
+        if self.adaptive_mode:
+            chunk_sizes = [
+                min(self.adaptive_block_size, n - start)
+                for start in range(0, n, self.adaptive_block_size)
+            ]
+        elif self._is_parallel():
+            chunk_sizes = split_number_of_life(
+                n, self.number_of_chunks or self.workers)
+        else:
+            chunk_sizes = [n]
+        units = get_sampling_units(self.sampling, chunk_sizes,
+                                   self.stratified_groups)
+        return self.asset_sim.get_crash_ratio_estimate(
+            units, control_variate=self.control_variate)
+
+    def _get_stream_cond(self):
+        """
+        ストリーミング集計の設定(ストリーミング集計しない場合はNone)
+        描画に使う閾値のライフ数だけを厳密に数える
+        """
+        if not self.stream_mode:
+            return None
+        return {
+            "block_size": self.stream_block_size,
+            "thresholds": [0, self.asset_threshold],
+            "relative_accuracy": self.stream_relative_accuracy
+        }
+
+    def _is_parallel(self):
+        return self.workers > 1 or self.number_of_chunks is not None
+
+    def _get_result_cache(self):
+        cache_dir = self.cache_dir if self.cache_dir else f"{self.output_dir}/cache"
+        return ResultCache(cache_dir, self.cache_max_bytes)
+
+    def _get_cache_inputs(self):
+        """
+        シミュレーション結果に影響する計算条件
+        (check_yearsやachieve_percentsなど描画の設定は含めない)
+        """
+        return {
+            "initial_year": self.initial_year,
+            "initial_cash": self.initial_cash,
+            "initial_invest_asset": self.initial_invest_asset,
+            "inflation_rate": self.inflation_rate,
+            "seed": self.seed,
+            "bit_generator": self.bit_generator,
+            "number_of_life": self.number_of_life,
+            "engine": self.engine,
+            "result_dtype": self.result_dtype,
+            # 並列計算の結果はチャンク数で決まる(workersの数にはよらない)
+            "number_of_chunks": (self.number_of_chunks or self.workers)
+            if self._is_parallel() else None,
+            "stream_cond": self._get_stream_cond(),
+            "joint_returns": self.joint_returns,
+            "sampling": self.sampling,
+            "stratified_groups": self.stratified_groups
+            if self.sampling == "stratified" else None,
+            "adaptive": [
+                self.adaptive_block_size, self.adaptive_interval_width,
+                self.adaptive_confidence, self.check_years,
+                self.asset_threshold
+            ] if self.adaptive_mode else None,
+        }
+
+    def _get_database_paths(self):
+        return [f"{self.sock_database_path}/{k}.csv" for k in self.stock_list]
+
+    def _get_joint_return_path(self):
+        if self.joint_return_table is None:
+            return f"{self.sock_database_path}/joint_returns.csv"
+        return self.joint_return_table
+
+    def _get_input_database_paths(self):
+        """
+        結果に影響するdatabaseのファイル(キャッシュのキー用)
+        """
+        database_paths = self._get_database_paths()
+        if self.joint_returns:
+            database_paths.append(self._get_joint_return_path())
+        return database_paths
+
+    def _get_cache_key(self):
+        """
+        計算条件・asset_plan・databaseの中身からキャッシュのキーを作成する
+        """
+        return make_cache_key(self._get_cache_inputs(),
+                              [self.asset_plan_in] +
+                              self._get_input_database_paths())
+
+    def _get_prefix_key(self):
+        """
+        asset_plan以外の入力(asset_planの銘柄列は含む)のキー
+        これが同じキャッシュはasset_planが同じ年まで同じ結果になる
+        """
+        inputs = self._get_cache_inputs()
+        inputs["stock_list"] = list(self.stock_list)
+        return make_cache_key(inputs, self._get_input_database_paths())
+
+    def _get_plan_array(self):
+        """
+        途中から再計算する年を探すための(年数, 列数)のasset_planの配列
+        """
+        return np.hstack([
+            self.invest_plan_df.to_numpy(dtype=np.float64),
+            self.asset_plan_df.to_numpy(dtype=np.float64)
+        ])
+
+    def _is_incremental(self):
+        """
+        途中の年からの再計算ができる条件か
+        (一つの乱数列で年ごとに全ライフを計算するvector, jitエンジン、かつ結果をfloat64で保持する場合のみ)
+        """
+        return (self.incremental_mode and self.use_cache
+                and self.seed is not None and self.engine in ("vector", "jit")
+                and self.result_dtype == "float64" and not self.stream_mode
+                and not self._is_parallel() and not self.adaptive_mode)
+
+    def _find_resume_checkpoint(self):
+        if not self._is_incremental() or self.cache_invalidate:
+            return None
+        resume_from = self._get_result_cache().find_checkpoint(
+            self._get_prefix_key(), self._get_plan_array())
+        if resume_from is not None:
+            print(f"{self.initial_year + 1 + resume_from[1]}年から再計算します")
+        return resume_from
+
+    def _load_cached_result(self):
+        """
+        キャッシュの結果を返す(キャッシュを使わない・無い場合はNone)
+        seedが無い場合は毎回結果が変わるのでキャッシュしない
+        """
+        if not self.use_cache or self.seed is None:
+            return None
+        cache = self._get_result_cache()
+        key = self._get_cache_key()
+        if self.cache_invalidate:
+            cache.invalidate(key)
+            return None
+        return cache.load(key)
+
+    def _set_cached_result(self, AS, result):
+        """
+        キャッシュの結果をASに設定する
+        memmap_outputの場合は計算した場合と同じく全ライフの結果をoutput_dir/asset_resultに書き出し、
+        そこから読み込む
+        """
+        if self.memmap_output and isinstance(result, AssetResult):
+            memmap_dir = f"{self.output_dir}/asset_result"
+            result.save(memmap_dir)
+            result = AssetResult.open_memmap(memmap_dir, mode="r")
+        AS.set_result(result)
+
+    def _save_cached_result(self, AS):
+        if not self.use_cache or self.seed is None:
+            return
+        checkpoint = {
+            "prefix_key": self._get_prefix_key(),
+            "plan": self._get_plan_array(),
+            "rng_states": AS.rng_states
+        } if self._is_incremental() else None
+        self._get_result_cache().save(self._get_cache_key(), AS.result,
+                                      checkpoint)
+
+    def _export_result(self, AS):
+        """
+        集計表(達成率・資産推移・破産率)と、全ライフを保持している場合は
+        全ライフ・全年の結果をexport_formatの形式でoutput_dirに出力する
+        """
+        # get_crash_ratioはachieve_ratio_dfを上書きするので先に控えておく
+        AS.get_achive_ratio(self.asset_threshold)
+        achieve_ratio_df = AS.achieve_ratio_df.copy()
+        AS.get_asset_transition(self.achieve_percents)
+        summary_dfs = {
+            "achieve_ratio": achieve_ratio_df,
+            "asset_transition": AS.asset_transition_df,
+            "crash_ratio": AS.get_crash_ratio()
+        }
+        export_summary(summary_dfs, self.output_dir, self.export_format)
+        if isinstance(AS.result, AssetResult):
+            export_result(AS.result, self.output_dir, self.export_format,
+                          self.export_block_size)
 
     def cal_asset(self):
-        self._read_asset_plan()
-        self._read_return_distribution()
+        with self.timer.stage("read_plan"):
+            self._read_asset_plan()
+        with self.timer.stage("read_distributions"):
+            self._read_return_distribution()
         self._cal_main()
+        self._save_timings()
 
     def check_plan(self, is_show: bool = False):
-        self._read_asset_plan()
-        result = self.asset_plan_df
-        years_df = pd.DataFrame(
-            {"years": [self.initial_year + i for i in range(len(result))]})
-        result = pd.concat([years_df, result], axis=1, join='outer')
-        fig = go.Figure()
-        # assets, invest, cash（左y軸）
-        fig.add_trace(
-            go.Scatter(x=result['years'],
-                       y=result['income'],
-                       mode='lines',
-                       name='income',
-                       line=dict(color='blue')))
-        fig.add_trace(
-            go.Scatter(x=result['years'],
-                       y=result['saving_per_year'],
-                       mode='lines',
-                       name='saving_per_year',
-                       line=dict(color='black')))
-        fig.add_trace(
-            go.Scatter(x=result['years'],
-                       y=result['invest_per_year'],
-                       mode='lines',
-                       name='invest_per_year',
-                       line=dict(color='green')))
-        fig.add_trace(
-            go.Scatter(x=result['years'],
-                       y=result['outcome'],
-                       mode='lines',
-                       name='outcome',
-                       line=dict(color='red')))
-
-        # レイアウト設定
-        fig.update_layout(
-            title='asset plan',
-            xaxis=dict(title='years'),
-            yaxis=dict(
-                title='income / saving_per_year / invest_per_year / outcome',
-                side='left'),
-            yaxis2=dict(title='profits', overlaying='y', side='right'),
-            legend=dict(x=0, y=1.1, orientation='h'),
-            width=900,  # 幅（ピクセル）
-            height=700,
-        )
+        with self.timer.stage("check_plan.read_plan"):
+            self._read_asset_plan()
+        with self.timer.stage("check_plan.render"):
+            import plotly.graph_objects as go
+
+            result = self.asset_plan_df
+            years_df = pd.DataFrame({
+                "years":
+                [self.initial_year + i for i in range(len(result))]
+            })
+            result = pd.concat([years_df, result], axis=1, join='outer')
+            fig = go.Figure()
+            # assets, invest, cash（左y軸）
+            fig.add_trace(
+                go.Scatter(x=result['years'],
+                           y=result['income'],
+                           mode='lines',
+                           name='income',
+                           line=dict(color='blue')))
+            fig.add_trace(
+                go.Scatter(x=result['years'],
+                           y=result['saving_per_year'],
+                           mode='lines',
+                           name='saving_per_year',
+                           line=dict(color='black')))
+            fig.add_trace(
+                go.Scatter(x=result['years'],
+                           y=result['invest_per_year'],
+                           mode='lines',
+                           name='invest_per_year',
+                           line=dict(color='green')))
+            fig.add_trace(
+                go.Scatter(x=result['years'],
+                           y=result['outcome'],
+                           mode='lines',
+                           name='outcome',
+                           line=dict(color='red')))
+
+            # レイアウト設定
+            fig.update_layout(
+                title='asset plan',
+                xaxis=dict(title='years'),
+                yaxis=dict(
+                    title='income / saving_per_year / invest_per_year / outcome',
+                    side='left'),
+                yaxis2=dict(title='profits', overlaying='y', side='right'),
+                legend=dict(x=0, y=1.1, orientation='h'),
+                width=900,  # 幅（ピクセル）
+                height=700,
+            )
 
         if is_show:
             fig.show()
 
-        # if save_name:
-        fig.write_html(f"{self.output_dir}/check_plan" + ".html")
+        with self.timer.stage("check_plan.write"):
+            fig.write_html(f"{self.output_dir}/check_plan" + ".html")
+        self._save_timings()
 
 
 if __name__ == "__main__":
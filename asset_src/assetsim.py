@@ -2,9 +2,14 @@ import os
 from collections import defaultdict
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+
+from asset_result import AssetResult
+from compiled_plan import CompiledPlan
+from renderers import get_renderer
+from return_sampler import SAMPLING_METHODS, as_joint_return_sampler, as_return_sampler, sample_rates
+from streaming_stats import StreamingAssetResult
+from variance_reduction import estimate_mean, get_expected_rate_path, get_sampling_units, get_wilson_interval
+from year_kernel import RateTables, draw_year_uniforms, get_year_kernel, update_assets_one_year_vector
 
 # TODO:グラフ関数を一般化すべき
 
@@ -13,32 +18,64 @@ class AssetSim():
 
     def __init__(self, return_distribution_dict, invest_plan, asset_plan,
                  initial_year, initial_cash, initial_invest_asset,
-                 inflation_rate):
+                 inflation_rate, rng=None, joint_return_distribution=None,
+                 sampling="random", stratified_groups=10, compiled_plan=None):
         """
         return_distributions:株式投資のリターン分布リスト{"sp500":sp500_return_distribution, "nasdaq":nasdaq_return_distribution}
+            (分布はrate[%], Share列のDataFrameまたはReturnSampler(return_database.load_return_database))
         initial_year:開始年  
         initial_cash:初期現金資産
         initial_invest:初期投資資産
         initial_asset:初期資産  
+        rng:乱数生成器(numpy.random.Generator)。Noneの場合はシードなしで作成する
+        joint_return_distribution:複数銘柄の同じ期間の利回りの表(create_database.get_joint_return_table)またはJointReturnSampler。
+            指定した場合、表にある銘柄は同じ期間の利回りを一緒に選ぶ(表にない銘柄は独立に選ぶ)
+        sampling:複数人生(engine=vector)の利回りの引き方(return_sampler.draw_uniformsを参照)
+            "random", "antithetic"(対称変量法), "stratified"(ラテン超方格法)
+        stratified_groups:stratifiedの場合にライフを分けるグループ数(グループ間のばらつきから誤差を推定する)
+        compiled_plan:計算用の配列にまとめた計画(InputGenerator.get_compiled_plan)。
+            Noneの場合はinvest_plan, asset_planから作成する(計算はcompiled_planだけを使う)
         """
+        if sampling not in SAMPLING_METHODS:
+            raise ValueError(
+                f"samplingが不正です: {sampling} (選択肢: {SAMPLING_METHODS})")
+        self.sampling = sampling
+        self.stratified_groups = stratified_groups
+        self.rng = np.random.default_rng() if rng is None else rng
         self.return_distribution_dict = return_distribution_dict
         # 配列化
         self.return_distribution_detail = defaultdict(dict)
         for k, return_distribution in self.return_distribution_dict.items():
+            # 利回りを選ぶサンプラー(同じ分布なら作成済みのものを使い回す)
+            sampler = as_return_sampler(return_distribution)
             self.return_distribution_detail[k]["indices"] = np.arange(
-                len(return_distribution))
-            self.return_distribution_detail[k]["share"] = return_distribution[
-                'Share'].to_numpy()
-            self.return_distribution_detail[k][
-                "rate"] = return_distribution['rate'].to_numpy() / 100.0
+                len(sampler))
+            self.return_distribution_detail[k]["share"] = sampler.share
+            self.return_distribution_detail[k]["rate"] = sampler.rate
+            self.return_distribution_detail[k]["sampler"] = sampler
+        self.samplers = {
+            k: detail["sampler"]
+            for k, detail in self.return_distribution_detail.items()
+        }
+        self.joint_sampler = None
+        if joint_return_distribution is not None:
+            self.joint_sampler = as_joint_return_sampler(
+                joint_return_distribution, list(return_distribution_dict))
 
         self.invest_plan = invest_plan
         self.asset_plan = asset_plan
+        if compiled_plan is None:
+            compiled_plan = CompiledPlan.from_plans(asset_plan, invest_plan,
+                                                    inflation_rate)
+        self.plan = compiled_plan.with_inflation_rate(inflation_rate)
         self.initial_year = initial_year
         self.initial_cash_asset = initial_cash
         self.initial_invest_asset = initial_invest_asset
         self.initial_total_asset = initial_cash + initial_invest_asset
         self.initial_inflation_rate = inflation_rate
+        # 複数人生のシミュレーション結果(AssetResult)
+        self.result = None
+        self._all_assets_by_year = None
 
         self.initialize()
 
@@ -52,31 +89,298 @@ class AssetSim():
         self.total_asset = self.initial_total_asset
         self.inflation_rate = self.initial_inflation_rate
 
-    def get_multi_role_play_assets(self, n: int):
+    def get_multi_role_play_assets(self,
+                                   n: int,
+                                   engine: str = "python",
+                                   dtype: str = "float64",
+                                   out: AssetResult = None,
+                                   resume_from: tuple = None):
         """
         n回ロールプレイをして各年の資産シミュレーションをn列作成
+        - engine: "python"(一人生ずつ計算) or "vector"(全人生を配列でまとめて計算)
+            or "jit"(ライフ×年のループをカーネルで計算。vectorと同じ結果)
+        - dtype: 結果を保持する配列のdtype("float64" or "float32")
+        - out: 結果を書き込むAssetResult(メモリマップなど)。Noneの場合は新しく確保する
+        - resume_from: 途中の年から再計算する場合のチェックポイント(vector, jitのみ)
         """
-        self.n = n
-        all_assets_by_year = pd.DataFrame()
-        all_life_assets_list = []
+        if engine == "vector":
+            self.get_multi_role_play_assets_vector(n, dtype, out, resume_from)
+            return
+        elif engine == "jit":
+            self.get_multi_role_play_assets_jit(n, dtype, out, resume_from)
+            return
+        elif engine != "python":
+            raise ValueError(f"engineが不正です: {engine}")
+        elif resume_from is not None:
+            raise ValueError("途中からの再計算はengine=vector, jitのみ対応しています")
+        elif self.sampling != "random":
+            raise ValueError("samplingの指定はengine=vector, jitのみ対応しています")
+
+        from tqdm import tqdm
+
+        result = AssetResult(self.get_years(), n,
+                             dtype) if out is None else out
         for i in tqdm(range(n)):
             a_life_assets_dict = self.get_role_play_assets()
-            # 初めてDataFrameを作成するときに年の情報をインデックスとして追加
-            if i == 0:
-                all_assets_by_year['year'] = a_life_assets_dict['years']
-            # 各年の資産額をDataFrameに追加 (列名は試行回数)
-            all_life_assets_list.append(a_life_assets_dict['assets'])
-        # 辞書にまとめておく
-        sim_columns = {
-            f'simulation_{i+1}': simulation_data
-            for i, simulation_data in enumerate(all_life_assets_list)
-        }
-        all_assets_by_year = pd.concat(
-            [all_assets_by_year, pd.DataFrame(sim_columns)],
-            axis=1,
-            join="outer")
-        all_assets_by_year = all_assets_by_year.set_index('year')
-        self.all_assets_by_year = all_assets_by_year
+            # 各年の資産額をi列目に追加
+            result.set_life(i, a_life_assets_dict)
+        self.set_result(result)
+
+    def get_multi_role_play_assets_vector(self,
+                                          n: int,
+                                          dtype: str = "float64",
+                                          out: AssetResult = None,
+                                          resume_from: tuple = None):
+        """
+        n回分の人生を一年ずつ配列でまとめて進め、各年の資産シミュレーションをn列作成
+        (get_multi_role_play_assetsと同じ結果を作成する)
+        - resume_from: (計算済みの結果AssetResult, 再開する年のidx, 各年の開始時点の乱数の状態のリスト)
+            再開する年より前は計算済みの結果をコピーし、その年の資産と乱数の状態から計算を続ける
+            (再開する年より前のasset_planが同じであれば、最初から計算した場合と同じ結果になる)
+        計算後、各年の開始時点と最後の年の終了時点の乱数の状態(年数+1個)をself.rng_statesに保持する
+        (終了時点の状態はasset_planに年を追加した場合に追加した年から再計算するために使う)
+        """
+        result, cash, invest, start_year_idx = self._start_vector(
+            n, dtype, out, resume_from)
+        plan = self.plan
+        for year_idx in range(start_year_idx, len(plan)):
+            self.rng_states.append(self.rng.bit_generator.state)
+            # 一年経過
+            self.year += 1
+
+            # 全人生分の利益率をまとめて選ぶ
+            rate = self._get_rate_a_year_vector(plan.weights[year_idx], n)
+            # 支出はインフレを加味した値
+            cash, invest, total, profit = update_assets_one_year_vector(
+                cash, invest, plan.inflated_cost[year_idx],
+                plan.income[year_idx], plan.saving_per_year[year_idx],
+                plan.invest_per_year[year_idx], rate)
+
+            result.set_year(year_idx, cash, invest, total, profit, rate)
+        self.rng_states.append(self.rng.bit_generator.state)
+        self.set_result(result)
+
+    def _start_vector(self, n: int, dtype: str, out: AssetResult,
+                      resume_from: tuple):
+        """
+        vector, jitの計算の準備をし、(結果, 各ライフのcash, invest, 計算を始める年のidx)を返す
+        (resume_fromの場合は計算済みの年をコピーし、乱数の状態を再開する年に戻す。
+        再開する年の乱数の状態が無い場合(終了時点の状態を保存していない古いチェックポイント)は最初から計算する)
+        """
+        self.initialize()
+        result = AssetResult(self.get_years(), n,
+                             dtype) if out is None else out
+        cash = np.full(n, self.initial_cash_asset, dtype=np.float64)
+        invest = np.full(n, self.initial_invest_asset, dtype=np.float64)
+        # 各年の開始時点の乱数の状態(途中から再計算するためのチェックポイント)
+        self.rng_states = []
+
+        start_year_idx = 0
+        if resume_from is not None and resume_from[1] < len(resume_from[2]):
+            base_result, start_year_idx, rng_states = resume_from
+            for field, plane in base_result.planes.items():
+                result.planes[field][:start_year_idx] = plane[:start_year_idx]
+            if start_year_idx > 0:
+                cash = np.array(base_result.cash[start_year_idx - 1],
+                                dtype=np.float64)
+                invest = np.array(base_result.invest[start_year_idx - 1],
+                                  dtype=np.float64)
+            self.rng_states = list(rng_states[:start_year_idx])
+            self.rng.bit_generator.state = rng_states[start_year_idx]
+            self.year += start_year_idx
+        return result, cash, invest, start_year_idx
+
+    def get_multi_role_play_assets_jit(self,
+                                       n: int,
+                                       dtype: str = "float64",
+                                       out: AssetResult = None,
+                                       resume_from: tuple = None,
+                                       kernel: str = "auto",
+                                       max_uniforms: int = 2**20):
+        """
+        get_multi_role_play_assets_vectorと同じ結果を、ライフ×年のループをまとめて計算するカーネルで作成する
+        (year_kernel.get_year_kernelを参照。numbaがあればコンパイルしたカーネル、なければnumpy)
+        - 一様乱数はvectorと同じ順に引き、利回りの表(エイリアステーブル・累積分布)で利回りにする
+        - 一様乱数は最大max_uniforms個ずつ、年をまとめて引いてカーネルに渡す
+        - kernel: "auto", "numba", "numpy", "python"(確認用)
+        """
+        run_years = get_year_kernel(kernel)
+        result, cash, invest, start_year_idx = self._start_vector(
+            n, dtype, out, resume_from)
+        plan = self.plan
+        tables = RateTables(plan.stocks, self.samplers, self.joint_sampler)
+
+        n_years = len(plan)
+        block_years = max(1, max_uniforms // max(tables.n_sources * n, 1))
+        for start in range(start_year_idx, n_years, block_years):
+            stop = min(start + block_years, n_years)
+            uniforms = np.empty((stop - start, tables.n_sources, n))
+            for t in range(stop - start):
+                self.rng_states.append(self.rng.bit_generator.state)
+                uniforms[t] = draw_year_uniforms(tables.n_sources, n,
+                                                 self.rng, self.sampling,
+                                                 self.stratified_groups)
+            # float64の結果には直接書き込む
+            outs = {
+                field: plane[start:stop] if plane.dtype == np.float64 else
+                np.empty((stop - start, n))
+                for field, plane in result.planes.items()
+            }
+            run_years(cash, invest, uniforms, self.sampling != "random",
+                      tables, plan.weights[start:stop],
+                      plan.inflated_cost[start:stop],
+                      plan.income[start:stop],
+                      plan.saving_per_year[start:stop],
+                      plan.invest_per_year[start:stop], outs["cash"],
+                      outs["invest"], outs["total"], outs["profit"],
+                      outs["rate"])
+            for field, plane in result.planes.items():
+                if plane.dtype != np.float64:
+                    plane[start:stop] = outs[field]
+        self.rng_states.append(self.rng.bit_generator.state)
+        self.year = self.initial_year + n_years
+        self.set_result(result)
+
+    def get_multi_role_play_assets_stream(self,
+                                          n: int,
+                                          block_size: int = 10000,
+                                          thresholds=(0, ),
+                                          relative_accuracy: float = 0.01):
+        """
+        n回分の人生をblock_sizeずつベクトル計算し、全ライフを保持せずに集計する
+        (メモリはnによらず一定。集計の精度はStreamingAssetResultを参照)
+        - thresholds: 達成率を厳密に数える金額のリスト
+        - relative_accuracy: 分位点の相対誤差
+        """
+        from tqdm import tqdm
+
+        stream = StreamingAssetResult(self.get_years(),
+                                      thresholds=thresholds,
+                                      relative_accuracy=relative_accuracy)
+        for start in tqdm(range(0, n, block_size)):
+            self.get_multi_role_play_assets_vector(min(block_size, n - start))
+            stream.add_block(self.result.total)
+        self.set_result(stream)
+
+    def get_multi_role_play_assets_adaptive(self,
+                                            max_n: int,
+                                            check_years,
+                                            asset_threshold,
+                                            block_size: int = 1000,
+                                            interval_width: float = 0.02,
+                                            confidence: float = 0.95,
+                                            dtype: str = "float64",
+                                            stream_cond: dict = None):
+        """
+        block_sizeずつライフを追加してベクトル計算し、check_yearsの破産率・asset_threshold達成率の
+        Wilson信頼区間の幅が全てinterval_width以下になるか、max_nライフに達したら止める
+        - stream_cond: ストリーミング集計する場合のStreamingAssetResultの引数
+            (thresholds, relative_accuracy。Noneの場合は全ライフを保持する)
+        各ブロック後の信頼区間の幅の履歴(DataFrame)を返す
+        (計画にないcheck_yearsは除く。全て無い場合は最初のブロックで止める)
+        """
+        years = list(self.get_years())
+        check_years = [year for year in check_years if year in years]
+        year_idx = [years.index(year) for year in check_years]
+        stream = None if stream_cond is None else StreamingAssetResult(
+            self.get_years(), **stream_cond)
+        results = []
+        crash_counts = np.zeros(len(year_idx), dtype=np.int64)
+        achieve_counts = np.zeros(len(year_idx), dtype=np.int64)
+        n = 0
+        history = []
+        while n < max_n:
+            size = min(block_size, max_n - n)
+            self.get_multi_role_play_assets_vector(size, dtype)
+            total = self.result.total
+            crash_counts += np.count_nonzero(total[year_idx] < 0, axis=1)
+            achieve_counts += np.count_nonzero(
+                total[year_idx] >= asset_threshold, axis=1)
+            if stream is not None:
+                stream.add_block(total)
+            else:
+                results.append(self.result)
+            n += size
+
+            row = {"number_of_life": n}
+            for name, counts in (("crash_ratio", crash_counts),
+                                 ("achieve_ratio", achieve_counts)):
+                lower, upper = get_wilson_interval(counts, n, confidence)
+                for year, ratio, width in zip(check_years, counts / n,
+                                              upper - lower):
+                    row[f"{name}_{year}y"] = ratio
+                    row[f"{name}_{year}y_interval_width"] = width
+            row["max_interval_width"] = max(
+                (v for k, v in row.items() if k.endswith("_interval_width")),
+                default=0.0)
+            history.append(row)
+            if row["max_interval_width"] <= interval_width:
+                break
+        self.set_result(stream if stream is not None else AssetResult.
+                        concatenate(results))
+        return pd.DataFrame(history)
+
+    def get_ratio_interval_widths(self, check_years, asset_threshold,
+                                  confidence: float = 0.95):
+        """
+        check_yearsの破産率・asset_threshold達成率のWilson信頼区間の幅
+        {"crash_ratio_{年}y": 幅, "achieve_ratio_{年}y": 幅}を返す
+        """
+        years = list(self.result.years)
+        year_idx = [years.index(year) for year in check_years]
+        widths = {}
+        for name, ratio in (
+            ("crash_ratio", 1 - self.result.get_achive_ratio(0)),
+            ("achieve_ratio", self.result.get_achive_ratio(asset_threshold))):
+            counts = np.round(ratio[year_idx] * self.n)
+            lower, upper = get_wilson_interval(counts, self.n, confidence)
+            for year, width in zip(check_years, upper - lower):
+                widths[f"{name}_{year}y"] = float(width)
+        return widths
+
+    def _get_rate_a_year_vector(self, weights, n: int):
+        """
+        _get_profit_a_yearのベクトル版。
+        各銘柄の利益率をn人生分まとめて選び、投資比率weights(self.plan.stocksの順)で重み付けした利益率を返す。
+        """
+        rates = sample_rates(self.plan.stocks,
+                             self.samplers,
+                             n,
+                             self.rng,
+                             self.joint_sampler,
+                             sampling=self.sampling,
+                             groups=self.stratified_groups)
+        rate_a_year = np.zeros(n)
+        for k, v in zip(self.plan.stocks, weights):
+            rate_a_year += rates[k] * v
+        return rate_a_year
+
+    def get_years(self):
+        """
+        シミュレーション結果の各行の年(一年経過後の年)
+        """
+        return self.initial_year + 1 + np.arange(len(self.plan))
+
+    def set_result(self, result):
+        """
+        複数人生のシミュレーション結果(AssetResult)を設定する
+        (並列計算など別途計算した結果もこれで設定する)
+        """
+        self.result = result
+        self.n = result.number_of_life
+        self._all_assets_by_year = None
+
+    @property
+    def all_assets_by_year(self):
+        """
+        各年の総資産をまとめたDataFrame(indexが年、列がsimulation_{i})
+        描画・出力で必要になったときだけ作成する
+        """
+        if isinstance(self.result, StreamingAssetResult):
+            raise ValueError("ストリーミング集計では全ライフの資産額を保持していません")
+        if self._all_assets_by_year is None:
+            self._all_assets_by_year = self.result.to_frame("total")
+        return self._all_assets_by_year
 
     def get_all_assets_by_year(self):
         return self.all_assets_by_year
@@ -85,15 +389,13 @@ class AssetSim():
         """
         各年で資産がasset_thresholdを超える確率を計算
         """
-        achievement_counts = (self.all_assets_by_year.iloc[:, 1:]
-                              >= asset_threshold).sum(axis=1)
-
         # 達成率を計算 (達成回数 / シミュレーション総数)
-        achievement_ratio = achievement_counts / self.n
+        achievement_ratio = self.result.get_achive_ratio(asset_threshold)
 
-        self.achieve_ratio_df = pd.DataFrame(achievement_ratio,
-                                             columns=["achieve_ratio"
-                                                      ]).reset_index()
+        self.achieve_ratio_df = pd.DataFrame({
+            "year": self.result.years,
+            "achieve_ratio": achievement_ratio
+        })
 
     def plot_multi_role_play_assets(self, asset_threshold, year: int):
         """
@@ -117,16 +419,15 @@ class AssetSim():
         profits = []
         rates = []
 
-        for asset_plan_value, invest_plan_a_year in zip(
-                self.asset_plan.values(), self.invest_plan.values()):
-            cost = asset_plan_value[0]
-            income = asset_plan_value[1]
-            saving_per_year = asset_plan_value[2]
-            invest_per_year = asset_plan_value[3]
-
+        # 一人生ずつの計算はnumpyのスカラーよりPythonのfloatの方が速いためリストにする
+        # (支出はインフレを加味した値)
+        plan = self.plan
+        for cost, income, saving_per_year, invest_per_year, weights in zip(
+                plan.inflated_cost.tolist(), plan.income.tolist(),
+                plan.saving_per_year.tolist(), plan.invest_per_year.tolist(),
+                plan.weights.tolist()):
             self.cash_asset, self.invest_asset, self.total_asset = self.update_assets_one_year(
-                cost, income, saving_per_year, invest_per_year,
-                invest_plan_a_year)
+                cost, income, saving_per_year, invest_per_year, weights)
 
             years.append(self.year)
             cash_assets.append(self.cash_asset)
@@ -149,6 +450,32 @@ class AssetSim():
     def get_role_play_asset_result_df(self):
         return pd.DataFrame(self.a_life_assets_dict)
 
+    def get_role_play_assets_figure_spec(self):
+        """
+        1回分の資産シミュレーション結果の図の仕様(renderers.Rendererを参照)
+        """
+        result = self.a_life_assets_dict
+        return {
+            "name": "one_life_asset",
+            "kind": "line",
+            "title": 'Assets and Profits Over Years',
+            "xlabel": 'years',
+            "ylabel": 'assets / invest / cash',
+            "y2label": 'profits',
+            "legend": True,
+            "figsize": (10, 10),
+            "series": [
+                {"x": result['years'], "y": result['assets'],
+                 "name": 'assets', "color": 'blue'},
+                {"x": result['years'], "y": result['invest'],
+                 "name": 'total_invests', "color": 'black'},
+                {"x": result['years'], "y": result['cash'],
+                 "name": 'cash', "color": 'green'},
+                {"x": result['years'], "y": result['profits'],
+                 "name": 'profits', "color": 'red', "secondary_y": True},
+            ]
+        }
+
     def plot_role_play_assets(self,
                               save_name: str = None,
                               is_show: bool = True,
@@ -156,110 +483,19 @@ class AssetSim():
         """
         1年分の資産シミュレーション結果を描画
         """
-        result = pd.DataFrame(self.a_life_assets_dict)
-        if mode == "matplotlib":
-            fig, ax1 = plt.subplots(figsize=(10, 10))
-            ax1.plot(result['years'],
-                     result['assets'],
-                     color='blue',
-                     label='assets')
-            ax1.plot(result['years'],
-                     result['invest'],
-                     color='black',
-                     label='total_invests')
-            ax1.plot(result['years'],
-                     result['cash'],
-                     color='green',
-                     label='cash')
-
-            ax1.set_xlabel('years')
-            ax1.set_ylabel('assets / invest / cash')
-            ax1.tick_params(axis='y')
-
-            # ax2（右側y軸）作成
-            ax2 = ax1.twinx()
-            ax2.plot(result['years'],
-                     result['profits'],
-                     color='red',
-                     label='profits')
-            ax2.set_ylabel('profits', color='red')
-            ax2.tick_params(axis='y', labelcolor='red')
-
-            plt.title('Assets and Profits Over Years')
-
-            # 凡例を一つにまとめる
-            lines_1, labels_1 = ax1.get_legend_handles_labels()
-            lines_2, labels_2 = ax2.get_legend_handles_labels()
-            ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc='best')
-
-            if is_show:
-                plt.show()
-            if save_name:
-                plt.savefig(save_name + ".png")
-            plt.clf()
-            plt.close()
-        elif mode == "plotly":
-            fig = go.Figure()
-
-            # assets, invest, cash（左y軸）
-            fig.add_trace(
-                go.Scatter(x=result['years'],
-                           y=result['assets'],
-                           mode='lines',
-                           name='assets',
-                           line=dict(color='blue')))
-            fig.add_trace(
-                go.Scatter(x=result['years'],
-                           y=result['invest'],
-                           mode='lines',
-                           name='total_invests',
-                           line=dict(color='black')))
-            fig.add_trace(
-                go.Scatter(x=result['years'],
-                           y=result['cash'],
-                           mode='lines',
-                           name='cash',
-                           line=dict(color='green')))
-
-            # profits（右y軸）
-            fig.add_trace(
-                go.Scatter(x=result['years'],
-                           y=result['profits'],
-                           mode='lines',
-                           name='profits',
-                           line=dict(color='red'),
-                           yaxis='y2'))
-
-            # レイアウト設定
-            fig.update_layout(
-                title='Assets and Profits Over Years',
-                xaxis=dict(title='years'),
-                yaxis=dict(title='assets / invest / cash', side='left'),
-                yaxis2=dict(title='profits', overlaying='y', side='right'),
-                legend=dict(x=0, y=1.1, orientation='h'),
-                width=900,  # 幅（ピクセル）
-                height=700,
-            )
-
-            if is_show:
-                fig.show()
-
-            if save_name:
-                # save_nameはhtml推奨（静的画像は別途設定必要）
-                fig.write_html(save_name + ".html")
+        get_renderer(mode).render(self.get_role_play_assets_figure_spec(),
+                                  save_name, is_show)
 
     def update_assets_one_year(self, cost, income, saving_per_year,
-                               invest_per_year, invest_plan_a_year):
+                               invest_per_year, weights):
         """
         一年経過時の資産額を返す
+        - cost: インフレ補正済みの支出(CompiledPlan.inflated_cost)
+        - weights: 各銘柄(self.plan.stocksの順)の投資比率
         """
         # 一年経過
         self.year += 1
 
-        # インフレを加味した支出
-        inflation_coeff = self.inflation_rate**(self.year - self.initial_year)
-        cost = cost * inflation_coeff
-
         # cashが尽きたらinvestを取り崩し
         if self.cash_asset <= 0:
             if (invest_asset_tmp :=
@@ -272,7 +508,7 @@ class AssetSim():
 
         # 投資の年利を反映
         self.invest_profit_a_year, self.rate_a_year = self._get_profit_a_year(
-            invest_plan_a_year)
+            weights)
         self.invest_asset += self.invest_profit_a_year
 
         # 収入と支出の差分
@@ -293,23 +529,21 @@ class AssetSim():
 
         return self.cash_asset, self.invest_asset, self.total_asset
 
-    def _get_profit_a_year(self, invest_plan_a_year):
+    def _get_profit_a_year(self, weights):
         """
         資産(asset)が株式利益分布(return_distribution)に従って  
         ある年に増える利益(profit)、選ばれた利益率(rate)を返す。  
+        - weights: 各銘柄(self.plan.stocksの順)の投資比率(CompiledPlanで合計1に正規化済み)
         """
-        #TODO:invest_plan_a_year,self.return_distribution_detail[k]["rate"]のそれぞれの値の
-        # 各種比率がそれぞれでトータルで1になるよう補正するように変更(今はトータル1になることを前提にしている)
         profits = []
         rate_list = []
-        for k, v in invest_plan_a_year.items():
-            # 計算用の配列
-            indices = self.return_distribution_detail[k]["indices"]
-            share = self.return_distribution_detail[k]["share"]
-            rates = self.return_distribution_detail[k]["rate"]
-            # 利益率をshareの確率に従い選ぶ
-            idx = np.random.choice(indices, p=share)
-            rate = rates[idx]
+        # 利益率をshareの確率に従い選ぶ
+        rates = sample_rates(self.plan.stocks,
+                             self.samplers,
+                             rng=self.rng,
+                             joint_sampler=self.joint_sampler)
+        for k, v in zip(self.plan.stocks, weights):
+            rate = rates[k]
             rate_list.append(rate)
             # 利益を計算
             invest = self.invest_asset * v
@@ -317,59 +551,110 @@ class AssetSim():
             profits.append(profit)
         # 合算
         invest_profit_a_year = sum(profits)
-        rate_a_year = sum(
-            [k * v for k, v in zip(rate_list, invest_plan_a_year.values())])
+        rate_a_year = sum([k * v for k, v in zip(rate_list, weights)])
         return invest_profit_a_year, rate_a_year
 
+    def get_asset_distribution_figure_specs(self,
+                                            years,
+                                            bins: int = 20,
+                                            log_bins: bool = False,
+                                            kde: bool = False):
+        """
+        指定した各年の資産額のヒストグラムの図の仕様のリスト
+        (全ての年をまとめて集計する。ストリーミング集計の場合も同じ形式)
+        - log_bins: 資産額のビンを対数で等間隔にする(0以下のライフ数はタイトルに表示)
+        - kde: カーネル密度推定の曲線を重ねる
+        """
+        histograms = self.result.get_histograms(years,
+                                                bins=bins,
+                                                log_bins=log_bins,
+                                                kde=kde)
+        specs = []
+        for year, histogram in histograms.items():
+            title = f"{year}y assets distribution"
+            if log_bins:
+                title += f" (assets <= 0: {histogram['non_positive']:g})"
+            series = [{
+                "bin_edges": histogram["bin_edges"],
+                "y": histogram["counts"],
+                "name": 'frequency'
+            }]
+            if kde:
+                series.append({
+                    "x": histogram["kde_x"],
+                    "y": histogram["kde_y"],
+                    "name": 'KDE',
+                    "color": 'red'
+                })
+            specs.append({
+                "name": f"asset_distribution_in_{year}y",
+                "kind": "bar",
+                "title": title,
+                "xlabel": 'assets',
+                "ylabel": 'frequency',
+                "log_x": log_bins,
+                "legend": kde,
+                "series": series
+            })
+        return specs
+
+    def get_asset_distribution_figure_spec(self,
+                                           year: int,
+                                           bins: int = 20,
+                                           log_bins: bool = False,
+                                           kde: bool = False):
+        """
+        指定した年の資産額のヒストグラムの図の仕様
+        """
+        return self.get_asset_distribution_figure_specs([year], bins, log_bins,
+                                                        kde)[0]
+
     def plot_asset_distribution(
         self,
         year: int,
         save_name: str = None,
         is_show: bool = True,
         mode: str = "matplotlib",
+        bins: int = None,
+        log_bins: bool = False,
+        kde: bool = False,
     ):
         """
         指定した年の各シミュレーションにおける資産額の分布をヒストグラムで表示する。
 
         Args:
-            data: 各シミュレーションの資産額をまとめたDataFrame (indexが年)。
             year: 資産分布を表示したい年。
+            bins: ビン数(省略時は描画バックエンドの既定値)。
+            log_bins: 資産額のビンを対数で等間隔にするか。
+            kde: カーネル密度推定の曲線を重ねるか。
         """
-        data = self.all_assets_by_year
-        if year in data.index:
-            assets_at_year = data.loc[year]
-            # 年の列を除外して資産額のみを取得
-            assets_values = assets_at_year.drop(index=assets_at_year.index[
-                assets_at_year.index.isin(['year'])])
-            if mode == "matplotlib":
-                plt.figure(figsize=(10, 6))
-                plt.hist(assets_values, bins=20, edgecolor='black')
-                plt.title(f"{year}y assets distribution")
-                plt.xlabel('assets')
-                plt.ylabel('frequency')
-                plt.grid(axis='y', alpha=0.75)
-                if is_show:
-                    plt.show()
-                if save_name:
-                    plt.savefig(save_name + ".png")
-                plt.clf()
-                plt.close()
-            elif mode == "plotly":
-                fig = go.Figure(
-                    data=[go.Histogram(x=assets_values, nbinsx=50)])
-                fig.update_layout(title=f"{year}y assets distribution",
-                                  xaxis_title='assets',
-                                  yaxis_title='frequency',
-                                  bargap=0.1,
-                                  width=900,
-                                  height=700)
-                if is_show:
-                    fig.show()
-                if save_name:
-                    fig.write_html(save_name + ".html")  # HTML保存が無難です
+        if self.result.has_year(year):
+            renderer = get_renderer(mode)
+            renderer.render(
+                self.get_asset_distribution_figure_spec(
+                    year, bins or renderer.histogram_bins, log_bins, kde),
+                save_name, is_show)
         else:
             print(f"データに{year}年が見つかりません。")
 
+    def get_achive_ratio_figure_spec(self, asset_threshold):
+        """
+        asset_thresholdを超える確率の推移の図の仕様
+        """
+        self.get_achive_ratio(asset_threshold)
+        return {
+            "name": f"achive_ratio_{asset_threshold}",
+            "kind": "line",
+            "title": f"achieve_ratio {asset_threshold} over years",
+            "xlabel": 'year',
+            "ylabel": 'achieve_ratio',
+            "series": [{
+                "x": self.achieve_ratio_df["year"].to_numpy(),
+                "y": self.achieve_ratio_df['achieve_ratio'].to_numpy(),
+                "name": 'achieve_ratio'
+            }]
+        }
+
     def plot_achive_ratio(
         self,
         asset_threshold,
@@ -383,50 +668,45 @@ class AssetSim():
         asset_threshold: 資産額の閾値
         n: シミュレーション総数
         """
-        self.get_achive_ratio(asset_threshold)
-
-        if mode == "matplotlib":
-            fig = plt.figure(figsize=(10, 6))
-            plt.plot(self.achieve_ratio_df["year"],
-                     self.achieve_ratio_df['achieve_ratio'])
-            plt.xlabel('year')
-            plt.ylabel('achieve_ratio')
-            plt.title(f"achieve_ratio {asset_threshold} over years")
-            if is_show:
-                plt.show()
-            if save_name:
-                fig.savefig(save_name + ".png")
-            plt.clf()
-            plt.close()
-        elif mode == "plotly":
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(x=self.achieve_ratio_df["year"],
-                           y=self.achieve_ratio_df['achieve_ratio'],
-                           mode='lines',
-                           name='achieve_ratio'))
-            fig.update_layout(
-                title=f"achieve_ratio {asset_threshold} over years",
-                xaxis_title='year',
-                yaxis_title='achieve_ratio',
-                width=900,
-                height=700)
-            if is_show:
-                fig.show()
-            if save_name:
-                fig.write_html(save_name + ".html")  # HTML形式で保存
+        get_renderer(mode).render(
+            self.get_achive_ratio_figure_spec(asset_threshold), save_name,
+            is_show)
 
     def get_asset_transition(self, achieve_percents: list = [10, 90, 99]):
         """
         achieve_ratiosの確率で超える資産額推移
         """
         #各年(各行)の資産額を昇順にしてまとめてachieve_ratioの番目の数値を取得する
-        self.asset_transition_df = pd.DataFrame()
+        self.asset_transition_df = pd.DataFrame(
+            index=pd.Index(self.result.years, name="year"))
         for achieve_percent in achieve_percents:
             achieve_ratios = 1 - achieve_percent / 100
             self.asset_transition_df[
-                f"achieve_ratio_{achieve_percent}"] = self.all_assets_by_year.iloc[:, 1:].quantile(
-                    achieve_ratios, axis=1, interpolation='linear')
+                f"achieve_ratio_{achieve_percent}"] = self.result.get_quantile(
+                    achieve_ratios)
+
+    def get_asset_transition_figure_spec(self,
+                                         achieve_percents: list = [50, 90,
+                                                                   99]):
+        """
+        achieve_ratiosの確率で超える資産額推移の図の仕様
+        """
+        self.get_asset_transition(achieve_percents)
+        achieve_percents_name = "_".join([str(x) for x in achieve_percents])
+        return {
+            "name": f"asset_transition_{achieve_percents_name}",
+            "kind": "line",
+            "title": 'assets over years',
+            "xlabel": 'year',
+            "ylabel": 'assets',
+            "legend": True,
+            "series": [{
+                "x": self.result.years,
+                "y": self.asset_transition_df[
+                    f"achieve_ratio_{achieve_percent}"].to_numpy(),
+                "name": f"{achieve_percent}%"
+            } for achieve_percent in achieve_percents]
+        }
 
     def plot_asset_transition(
         self,
@@ -447,45 +727,9 @@ class AssetSim():
         is_show : bool, optional
             描画結果を表示するか否か, by default True
         """
-        self.get_asset_transition(achieve_percents)
-        df = self.asset_transition_df.reset_index()
-
-        if mode == "matplotlib":
-            # Create a figure
-            fig = plt.figure(figsize=(10, 6))
-
-            for achieve_percent in achieve_percents:
-                plt.plot(df["year"],
-                         df[f"achieve_ratio_{achieve_percent}"],
-                         label=f"{achieve_percent}%")
-            plt.xlabel('year')
-            plt.ylabel('assets')
-            plt.title('assets over years')
-            plt.legend()
-            if is_show:
-                plt.show()
-            if save_name:
-                fig.savefig(save_name + ".png")
-            plt.clf()
-            plt.close()
-        elif mode == "plotly":
-            fig = go.Figure()
-            for achieve_percent in achieve_percents:
-                fig.add_trace(
-                    go.Scatter(x=df["year"],
-                               y=df[f"achieve_ratio_{achieve_percent}"],
-                               mode='lines',
-                               name=f"{achieve_percent}%"))
-            fig.update_layout(title='assets over years',
-                              xaxis_title='year',
-                              yaxis_title='assets',
-                              legend=dict(orientation='h', y=1.1),
-                              width=900,
-                              height=700)
-            if is_show:
-                fig.show()
-            if save_name:
-                fig.write_html(save_name + ".html")  # HTML保存推奨
+        get_renderer(mode).render(
+            self.get_asset_transition_figure_spec(achieve_percents),
+            save_name, is_show)
 
     def get_crash_ratio(self):
         """
@@ -497,6 +741,59 @@ class AssetSim():
         crash_ratio_df["crash_ratio"] = 1 - crash_ratio_df["achieve_ratio"]
         return crash_ratio_df
 
+    def get_crash_ratio_estimate(self, units=None,
+                                 control_variate: bool = False):
+        """
+        各年の破産する確率の推定値・標準誤差・有効サンプルサイズ(ESS)
+        - units: 各ライフの独立な単位(variance_reduction.get_sampling_units)。
+            省略時は全ライフを一度に計算した場合の単位
+        - control_variate: その年までの利回りの累積和を制御変量にする(期待値は利回り分布から解析的に計算)
+        """
+        if isinstance(self.result, StreamingAssetResult):
+            raise ValueError("ストリーミング集計では全ライフの資産額を保持していません")
+        if units is None:
+            units = get_sampling_units(self.sampling, [self.n],
+                                       self.stratified_groups)
+        expected_rate_path = np.cumsum(
+            get_expected_rate_path(self.plan, self.samplers,
+                                   self.joint_sampler))
+        cumulative_rate = np.zeros(self.n)
+        rows = []
+        # メモリマップでも全体を読み込まないよう年(行)ごとに計算する
+        for year_idx, year in enumerate(self.result.years):
+            is_crash = self.result.planes["total"][year_idx] < 0
+            control = None
+            if control_variate:
+                cumulative_rate += self.result.planes["rate"][year_idx]
+                control = cumulative_rate
+            crash_ratio, standard_error, effective_sample_size = estimate_mean(
+                is_crash, units, control, expected_rate_path[year_idx])
+            rows.append({
+                "year": year,
+                "crash_ratio": crash_ratio,
+                "standard_error": standard_error,
+                "effective_sample_size": effective_sample_size
+            })
+        return pd.DataFrame(rows)
+
+    def get_crash_ratio_figure_spec(self):
+        """
+        破産する確率の推移の図の仕様
+        """
+        self.crash_ratio_df = self.get_crash_ratio()
+        return {
+            "name": "crash_ratio",
+            "kind": "line",
+            "title": 'crash_ratio over years',
+            "xlabel": 'year',
+            "ylabel": 'crash_ratio',
+            "series": [{
+                "x": self.crash_ratio_df["year"].to_numpy(),
+                "y": self.crash_ratio_df['crash_ratio'].to_numpy(),
+                "name": 'crash_ratio'
+            }]
+        }
+
     def plot_crash_ratio(self,
                          save_name: str = None,
                          is_show: bool = True,
@@ -504,38 +801,8 @@ class AssetSim():
         """
         破産する確率を描画
         """
-
-        self.crash_ratio_df = self.get_crash_ratio()
-
-        if mode == "matplotlib":
-            fig = plt.figure(figsize=(10, 6))
-            plt.plot(self.crash_ratio_df["year"],
-                     self.crash_ratio_df['crash_ratio'])
-            plt.xlabel('year')
-            plt.ylabel('crash_ratio')
-            plt.title('crash_ratio over years')
-            if is_show:
-                plt.show()
-            if save_name:
-                fig.savefig(save_name + ".png")
-            plt.clf()
-            plt.close()
-        elif mode == "plotly":
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(x=self.crash_ratio_df["year"],
-                           y=self.crash_ratio_df['crash_ratio'],
-                           mode='lines',
-                           name='crash_ratio'))
-            fig.update_layout(title='crash_ratio over years',
-                              xaxis_title='year',
-                              yaxis_title='crash_ratio',
-                              width=900,
-                              height=700)
-            if is_show:
-                fig.show()
-            if save_name:
-                fig.write_html(save_name + ".html")  # HTML形式で保存
+        get_renderer(mode).render(self.get_crash_ratio_figure_spec(),
+                                  save_name, is_show)
 
 
 def single_life_example():
@@ -0,0 +1,197 @@
+import os
+import glob
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from asset_simulator import AssetSimulator, read_database_csv
+from input_generator import InputGenerator
+from tbase_for_asset import save_dict_as_json, read_json_as_dict
+
+# 各ワーカープロセスで共有する読み込み済みの利回り分布{csvのパス: DataFrame}
+_SHARED_RETURN_DISTRIBUTIONS = None
+
+
+def _init_worker(return_distribution_cache):
+    global _SHARED_RETURN_DISTRIBUTIONS
+    _SHARED_RETURN_DISTRIBUTIONS = return_distribution_cache
+
+
+def _run_scenario(name, js_in):
+    """
+    1シナリオ分の計算を行い、要約を返す
+    (ProcessPoolExecutorから呼ぶためモジュール関数にしている)
+    """
+    summary = {"name": name}
+    try:
+        AS = AssetSimulator(js_in, _SHARED_RETURN_DISTRIBUTIONS)
+        if AS.plot:
+            AS.check_plan()
+        AS.cal_asset()
+        if AS.multi_life_mode:
+            summary.update(AS.get_summary())
+        summary["error"] = ""
+    except Exception:
+        summary["error"] = traceback.format_exc(limit=1).strip()
+    return summary
+
+
+class BatchRunner:
+    """
+    複数シナリオ(condition.jsonとasset_plan.csvの組)をまとめて計算する
+    - scenarios_in
+        - ディレクトリ: 各サブディレクトリのcondition.json(asset_plan.csvがあればそれを使う)
+        - マニフェスト(json):
+            {
+                "scenarios": [
+                    {"name": "A", "condition": "A/condition.json",
+                     "asset_plan": "A/asset_plan.csv", "overrides": {"seed": 0}},
+                    ...
+                ]
+            }
+            asset_plan, overridesは省略可。相対パスはマニフェストのディレクトリから
+    - 利回り分布はまとめて一度だけ読み込み、ワーカープロセス間で共有する
+    - 各シナリオはoutput_dir/{name}に出力し、要約をoutput_dir/summary.csvにまとめる
+    - plot=Falseの場合は全シナリオで描画しない(condition.jsonのplotを上書きする)
+    """
+
+    def __init__(self,
+                 scenarios_in,
+                 output_dir: str = None,
+                 workers: int = 1,
+                 plot: bool = True):
+        self.scenarios_in = scenarios_in
+        self.workers = workers
+        self.plot = plot
+        if output_dir is None:
+            base_dir = scenarios_in if os.path.isdir(
+                scenarios_in) else os.path.dirname(
+                    os.path.abspath(scenarios_in))
+            output_dir = f"{base_dir}/batch_result"
+        self.output_dir = output_dir
+
+    def _get_scenarios(self):
+        """
+        [{"name", "condition", "asset_plan", "overrides"}]のリストを返す
+        """
+        scenarios = []
+        if os.path.isdir(self.scenarios_in):
+            for js_in in sorted(
+                    glob.glob(f"{self.scenarios_in}/*/condition.json")):
+                scenario_dir = os.path.dirname(js_in)
+                asset_plan_in = f"{scenario_dir}/asset_plan.csv"
+                scenarios.append({
+                    "name": os.path.basename(scenario_dir),
+                    "condition": js_in,
+                    "asset_plan":
+                    asset_plan_in if os.path.exists(asset_plan_in) else None,
+                    "overrides": {}
+                })
+            return scenarios
+
+        manifest_dir = os.path.dirname(os.path.abspath(self.scenarios_in))
+        manifest = read_json_as_dict(self.scenarios_in)
+        for i, scenario in enumerate(manifest["scenarios"]):
+            asset_plan_in = scenario.get("asset_plan")
+            scenarios.append({
+                "name":
+                scenario.get("name", f"scenario_{i+1}"),
+                "condition":
+                os.path.join(manifest_dir, scenario["condition"]),
+                "asset_plan":
+                os.path.join(manifest_dir, asset_plan_in)
+                if asset_plan_in else None,
+                "overrides":
+                scenario.get("overrides", {})
+            })
+        return scenarios
+
+    def _write_scenario_condition(self, scenario):
+        """
+        シナリオの計算条件を出力先に保存し、そのパスを返す
+        """
+        cond = read_json_as_dict(scenario["condition"])
+        cond.update(scenario["overrides"])
+        if scenario["asset_plan"]:
+            cond["asset_plan_in"] = scenario["asset_plan"]
+        cond["output_dir"] = f"{self.output_dir}/{scenario['name']}"
+        cond["is_show"] = False
+        if not self.plot:
+            cond["plot"] = False
+        os.makedirs(cond["output_dir"], exist_ok=True)
+        js_in = f"{cond['output_dir']}/condition.json"
+        save_dict_as_json(cond, js_in)
+        return js_in
+
+    def _read_shared_return_distributions(self, js_in_list):
+        """
+        全シナリオで使う利回り分布を一度だけ読み込み、
+        (利回り分布{csvのパス: DataFrame}, 読み込めなかったシナリオのエラー{condition.jsonのパス: エラー})を返す
+        """
+        return_distribution_cache = {}
+        errors = {}
+        IG = InputGenerator()
+        for js_in in js_in_list:
+            # 読み込めないシナリオは計算せず、エラーをそのシナリオの要約に記録する
+            try:
+                cond = read_json_as_dict(js_in)
+                _, _, invest_plan_df, _ = IG.get_asset_plan(
+                    cond["asset_plan_in"])
+                csv_in_list = [
+                    os.path.abspath(f"{cond['sock_database_path']}/{k}.csv")
+                    for k in invest_plan_df.columns
+                ]
+                if cond.get("joint_returns"):
+                    csv_in_list.append(
+                        os.path.abspath(
+                            cond.get("joint_return_table") or
+                            f"{cond['sock_database_path']}/joint_returns.csv"
+                        ))
+                for csv_in in csv_in_list:
+                    if csv_in not in return_distribution_cache:
+                        return_distribution_cache[
+                            csv_in] = read_database_csv(csv_in)
+            except Exception:
+                errors[js_in] = traceback.format_exc(limit=1).strip()
+        return return_distribution_cache, errors
+
+    def run(self):
+        """
+        全シナリオを計算し、要約のDataFrameを返す
+        """
+        scenarios = self._get_scenarios()
+        names = [scenario["name"] for scenario in scenarios]
+        js_in_list = [
+            self._write_scenario_condition(scenario) for scenario in scenarios
+        ]
+        return_distribution_cache, errors = \
+            self._read_shared_return_distributions(js_in_list)
+        run_names = [
+            name for name, js_in in zip(names, js_in_list)
+            if js_in not in errors
+        ]
+        run_js_in_list = [js_in for js_in in js_in_list if js_in not in errors]
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(return_distribution_cache, )) as executor:
+                summaries = list(
+                    executor.map(_run_scenario, run_names, run_js_in_list))
+        else:
+            _init_worker(return_distribution_cache)
+            summaries = list(map(_run_scenario, run_names, run_js_in_list))
+
+        # 読み込めなかったシナリオはエラーだけの要約にし、シナリオの順に並べる
+        results = iter(summaries)
+        summaries = [{
+            "name": name,
+            "error": errors[js_in]
+        } if js_in in errors else next(results)
+                     for name, js_in in zip(names, js_in_list)]
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary_df = pd.DataFrame(summaries)
+        summary_df.to_csv(f"{self.output_dir}/summary.csv", index=False)
+        return summary_df
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def normalize_weights(weights):
+    """
+    (..., 銘柄数)の投資比率を各行の合計が1になるよう正規化する(全銘柄0の行は0のまま)
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    total = weights.sum(axis=-1, keepdims=True)
+    return np.where(total > 0, weights / np.where(total > 0, total, 1), 0.0)
+
+
+class CompiledPlan:
+    """
+    資産計画・投資計画を計算用の配列にまとめたもの
+    - cost, income, saving_per_year, invest_per_year: (年数, )の配列
+    - weights: (年数, 銘柄数)の投資比率(各年の合計が1になるよう正規化する。全銘柄0の年は0のまま)
+    - stocks: weightsの各列の銘柄
+    - inflation_coeff: 各年(一年経過後)の支出に掛けるインフレ係数 inflation_rate**(年のidx+1)
+    - inflated_cost: インフレを加味した支出 cost * inflation_coeff
+    """
+
+    def __init__(self,
+                 stocks,
+                 weights,
+                 cost,
+                 income,
+                 saving_per_year,
+                 invest_per_year,
+                 inflation_rate: float = 1.0):
+        self.stocks = list(stocks)
+        self.weights = normalize_weights(
+            np.array(weights, dtype=np.float64).reshape(-1, len(self.stocks)))
+        self.cost = np.asarray(cost, dtype=np.float64)
+        self.income = np.asarray(income, dtype=np.float64)
+        self.saving_per_year = np.asarray(saving_per_year, dtype=np.float64)
+        self.invest_per_year = np.asarray(invest_per_year, dtype=np.float64)
+        self.inflation_rate = inflation_rate
+        # get_multi_role_play_assetsの各エンジンと同じ値になるようfloatのべき乗で計算する
+        self.inflation_coeff = np.array(
+            [inflation_rate**(year_idx + 1) for year_idx in range(len(self))],
+            dtype=np.float64)
+        self.inflated_cost = self.cost * self.inflation_coeff
+
+    def __len__(self):
+        return len(self.cost)
+
+    @classmethod
+    def from_plans(cls, asset_plan: dict, invest_plan: dict,
+                   inflation_rate: float = 1.0):
+        """
+        InputGenerator.get_asset_planのasset_plan{行: [cost, income, saving_per_year, invest_per_year]}と
+        invest_plan{行: {銘柄: 比率}}から作成する(年によって無い銘柄は比率0)
+        """
+        stocks = list(
+            dict.fromkeys(k for v in invest_plan.values() for k in v))
+        weights = [[v.get(k, 0.0) for k in stocks]
+                   for v in invest_plan.values()]
+        asset_plan_array = np.array(list(asset_plan.values()),
+                                    dtype=np.float64).reshape(-1, 4)
+        return cls(stocks, weights, *asset_plan_array.T, inflation_rate)
+
+    @classmethod
+    def from_dataframes(cls, asset_plan_df, invest_plan_df,
+                        inflation_rate: float = 1.0):
+        """
+        InputGenerator.get_asset_planのasset_plan_df(outcome, income, saving_per_year, invest_per_year列)と
+        invest_plan_df(銘柄ごとの比率の列)から作成する
+        """
+        asset_plan_array = asset_plan_df.to_numpy(dtype=np.float64)
+        return cls(invest_plan_df.columns,
+                   invest_plan_df.to_numpy(dtype=np.float64),
+                   *asset_plan_array.T, inflation_rate)
+
+    def with_inflation_rate(self, inflation_rate: float):
+        """
+        インフレ率だけを変えた計画を返す
+        """
+        if inflation_rate == self.inflation_rate:
+            return self
+        return CompiledPlan(self.stocks, self.weights, self.cost, self.income,
+                            self.saving_per_year, self.invest_per_year,
+                            inflation_rate)
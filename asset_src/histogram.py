@@ -0,0 +1,141 @@
+import numpy as np
+
+
+def _to_axis(values, log_bins: bool):
+    """
+    ビンを等間隔に切る軸の値に変換する(log_binsの場合はlog10、0以下はnan)
+    """
+    if not log_bins:
+        return values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(values > 0, np.log10(np.where(values > 0, values, 1)),
+                        np.nan)
+
+
+def _from_axis(t, log_bins: bool):
+    return 10**t if log_bins else t
+
+
+def _bincount_rows(bin_idx, weights, bins: int):
+    """
+    (行数, 値の数)のビン番号(範囲外は-1)を行ごとに数え、(行数, bins)のカウントを返す
+    """
+    n_rows = bin_idx.shape[0]
+    is_valid = bin_idx >= 0
+    row_idx = np.broadcast_to(np.arange(n_rows)[:, None], bin_idx.shape)
+    counts = np.bincount((row_idx * bins + bin_idx)[is_valid],
+                         weights=None if weights is None else weights[is_valid],
+                         minlength=n_rows * bins)
+    return counts.reshape(n_rows, bins)
+
+
+def _get_bin_edges(lo, hi, bins: int):
+    """
+    各行の[lo, hi]をbins等分したビンの境界((行数, bins+1)、np.histogramと同じ計算)
+    """
+    return np.linspace(lo, hi, bins + 1, axis=1)
+
+
+def _get_bin_idx(t, edges):
+    """
+    各行の値tがedgesのどのビンに入るか(最後のビンは右端を含む、nanは-1)
+    np.histogramと同じく、割り算で求めたビン番号を実際の境界と比べて丸め誤差を補正する
+    """
+    bins = edges.shape[1] - 1
+    lo = edges[:, :1]
+    hi = edges[:, -1:]
+    with np.errstate(invalid="ignore"):
+        f_idx = (t - lo) * (bins / (hi - lo))
+    is_nan = np.isnan(f_idx)
+    bin_idx = np.clip(np.where(is_nan, 0, f_idx).astype(np.int64), 0,
+                      bins - 1)
+    with np.errstate(invalid="ignore"):
+        bin_idx -= t < np.take_along_axis(edges, bin_idx, axis=1)
+        bin_idx += (t >= np.take_along_axis(edges, bin_idx + 1, axis=1)) & (
+            bin_idx != bins - 1)
+    return np.where(is_nan, -1, bin_idx)
+
+
+def get_histograms(values,
+                   bins: int = 20,
+                   log_bins: bool = False,
+                   kde: bool = False,
+                   weights=None,
+                   kde_points: int = 256):
+    """
+    (行数, 値の数)の配列の各行のヒストグラムをまとめて計算し、行ごとのdictのリストを返す
+    - counts, bin_edges: np.histogramと同じ形式(範囲は各行の最小値〜最大値)
+    - log_bins: ビンを対数で等間隔にする(0以下の値はビンに入れず、non_positiveに数える)
+    - kde: ガウスカーネル密度推定(ビニングした値を畳み込む近似、バンド幅はScottの方法)をkde_x, kde_yに入れる
+      (kde_yはヒストグラムのビン幅あたりの数に換算するため、countsと重ねて描ける)
+    - weights: 各値の重み(ストリーミング集計のバケットの数など)、省略時は1
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    if values.shape[0] == 0:
+        return []
+    if weights is not None:
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64),
+                                  values.shape)
+    t = _to_axis(values, log_bins)
+    is_valid = ~np.isnan(t)
+    if weights is not None:
+        is_valid &= weights > 0
+    t = np.where(is_valid, t, np.nan)
+    w = np.ones_like(t) if weights is None else weights
+    # log_binsでビンに入らない0以下の値の数
+    non_positive = np.where(values <= 0, w, 0.0).sum(
+        axis=1) if log_bins else np.zeros(values.shape[0])
+    w = np.where(is_valid, w, 0.0)
+    total = w.sum(axis=1)
+
+    with np.errstate(invalid="ignore"):
+        lo = np.nanmin(np.where(is_valid, t, np.inf), axis=1)
+        hi = np.nanmax(np.where(is_valid, t, -np.inf), axis=1)
+    # 値が無い・全て同じ値の行はnp.histogramと同様に±0.5の範囲にする
+    is_empty = ~np.isfinite(lo)
+    lo = np.where(is_empty, 0.0, lo)
+    hi = np.where(is_empty, 0.0, hi)
+    is_flat = hi <= lo
+    lo = np.where(is_flat, lo - 0.5, lo)
+    hi = np.where(is_flat, hi + 0.5, hi)
+
+    edges = _get_bin_edges(lo, hi, bins)
+    counts = _bincount_rows(_get_bin_idx(t, edges),
+                            None if weights is None else w, bins)
+
+    if kde:
+        # ビン幅の細かいヒストグラムをガウスカーネルで畳み込む
+        fine_counts = _bincount_rows(
+            _get_bin_idx(t, _get_bin_edges(lo, hi, kde_points)), w,
+            kde_points)
+        dx = (hi - lo) / kde_points
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(t * w, axis=1) / total
+            std = np.sqrt(
+                np.nansum((t - mean[:, None])**2 * w, axis=1) / total)
+        bandwidth = 1.06 * std * np.maximum(total, 1)**(-1 / 5)
+        kde_t = lo[:, None] + dx[:, None] * (np.arange(kde_points) + 0.5)
+
+    histograms = []
+    for i in range(values.shape[0]):
+        histogram = {
+            "counts": counts[i],
+            "bin_edges": _from_axis(edges[i], log_bins),
+            "non_positive": non_positive[i]
+        }
+        if kde:
+            sigma = bandwidth[i] / dx[i] if bandwidth[i] > 0 else 0
+            if sigma > 0:
+                offsets = np.arange(-int(np.ceil(4 * sigma)),
+                                    int(np.ceil(4 * sigma)) + 1)
+                kernel = np.exp(-0.5 * (offsets / sigma)**2)
+                kernel /= kernel.sum()
+                smoothed = np.convolve(fine_counts[i], kernel,
+                                       mode="full")[offsets[-1]:offsets[-1] +
+                                                    kde_points]
+            else:
+                smoothed = fine_counts[i].astype(np.float64)
+            histogram["kde_x"] = _from_axis(kde_t[i], log_bins)
+            histogram["kde_y"] = smoothed * kde_points / bins
+        histograms.append(histogram)
+    return histograms
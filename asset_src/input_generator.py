@@ -1,6 +1,7 @@
 # import ipysheet
 import pandas as pd
-from IPython.display import display
+
+from compiled_plan import CompiledPlan
 
 
 class InputGenerator:
@@ -79,7 +80,8 @@ class InputGenerator:
         cols = self.asset_plan_ini_df.columns.to_list()
         self.asset_plan_ini_idx = cols.index("year") + 1
         self.other_fin_idx = self.asset_plan_ini_idx + 3
-        self.invest_fin_idx = cols.index("age") - 1
+        # ageより前の列は全て銘柄の投資比率(ilocの終端は含まないためageのidxをそのまま使う)
+        self.invest_fin_idx = cols.index("age")
 
         # asset_planを作成
         other_df = self.asset_plan_ini_df.iloc[:, self.asset_plan_ini_idx:self.
@@ -101,8 +103,19 @@ class InputGenerator:
             for k, v in self.invest_plan_ini_df.T.items()
         }
         # invest_plan = dict(self.invest_plan_ini_df.T)
+
+        # 計算用の配列にまとめた計画(インフレ率はget_compiled_planで指定する)
+        self.compiled_plan = CompiledPlan.from_dataframes(
+            asset_plan_df, self.invest_plan_ini_df)
         return asset_plan_df, asset_plan, self.invest_plan_ini_df, invest_plan
 
+    def get_compiled_plan(self, asset_csv_in, inflation_rate: float = 1.0):
+        """
+        asset_planを読み込み、計算用の配列にまとめた計画(CompiledPlan)を返す
+        """
+        self.get_asset_plan(asset_csv_in)
+        return self.compiled_plan.with_inflation_rate(inflation_rate)
+
 
 if __name__ == "__main__":
     import glob
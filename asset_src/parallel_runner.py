@@ -0,0 +1,106 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from asset_result import AssetResult
+from assetsim import AssetSim
+from random_generator import make_rng
+from streaming_stats import StreamingAssetResult
+
+
+def split_number_of_life(number_of_life: int, number_of_chunks: int):
+    """
+    number_of_lifeをnumber_of_chunks個のチャンクに分割した各チャンクのライフ数を返す
+    """
+    if number_of_chunks < 1:
+        raise ValueError("number_of_chunksは1以上である必要があります")
+    base, rest = divmod(number_of_life, number_of_chunks)
+    return [base + (1 if i < rest else 0) for i in range(number_of_chunks)]
+
+
+def _run_chunk(AS_cond, number_of_life, seed_sequence, engine,
+               bit_generator, dtype, stream_cond, memmap_dir, start):
+    """
+    1チャンク分の人生を計算し、AssetResult(ストリーミング集計の場合はStreamingAssetResult)を返す
+    memmap_dirを指定した場合はそのstart列目からの担当範囲に直接書き込み、Noneを返す
+    (ProcessPoolExecutorから呼ぶためモジュール関数にしている)
+    """
+    rng = make_rng(seed_sequence, bit_generator)
+    AS = AssetSim(**AS_cond, rng=rng)
+    if stream_cond is not None:
+        AS.get_multi_role_play_assets_stream(number_of_life, **stream_cond)
+        return AS.result
+
+    out = None
+    if memmap_dir is not None:
+        out = AssetResult.open_memmap(memmap_dir, mode="r+").get_lives(
+            start, start + number_of_life)
+    AS.get_multi_role_play_assets(number_of_life,
+                                  engine=engine,
+                                  dtype=dtype,
+                                  out=out)
+    if out is not None:
+        out.flush()
+        return None
+    return AS.result
+
+
+def get_multi_role_play_assets_parallel(AS_cond,
+                                        number_of_life: int,
+                                        workers: int = 1,
+                                        number_of_chunks: int = None,
+                                        seed=None,
+                                        engine: str = "vector",
+                                        bit_generator: str = "PCG64",
+                                        dtype: str = "float64",
+                                        stream_cond: dict = None,
+                                        memmap_dir: str = None):
+    """
+    number_of_lifeをチャンクに分けてプロセス並列で計算し、
+    AssetSim.get_multi_role_play_assetsと同じ結果(AssetResult)を返す。
+
+    各チャンクはSeedSequence(seed).spawnで作った子シードを使うため、
+    seedとnumber_of_chunksが同じであればworkersの数によらず同じ結果になる。
+
+    Args:
+        AS_cond (dict): AssetSimの引数
+        number_of_life (int): 計算するライフ数
+        workers (int): プロセス数
+        number_of_chunks (int): チャンク数(Noneの場合はworkersと同じ)
+        seed: SeedSequenceのシード(Noneの場合は毎回異なる結果になる)
+        engine (str): 各チャンクの計算エンジン("python", "vector" or "jit")
+        bit_generator (str): 各チャンクの乱数のビットジェネレーター
+        dtype (str): 結果を保持する配列のdtype
+        stream_cond (dict): ストリーミング集計する場合の
+            AssetSim.get_multi_role_play_assets_streamの引数(Noneの場合は全ライフを保持)
+        memmap_dir (str): 指定した場合、結果をこのディレクトリの.npyにメモリマップで書き込む
+            (各チャンクは互いに重ならない列範囲にコピーなしで書き込む)
+    """
+    if number_of_chunks is None:
+        number_of_chunks = workers
+    chunk_sizes = split_number_of_life(number_of_life, number_of_chunks)
+    seed_sequences = np.random.SeedSequence(seed).spawn(number_of_chunks)
+    starts = np.concatenate([[0], np.cumsum(chunk_sizes)[:-1]]).tolist()
+    if memmap_dir is not None and stream_cond is None:
+        AssetResult.create_memmap(memmap_dir,
+                                  AssetSim(**AS_cond).get_years(),
+                                  number_of_life,
+                                  dtype=dtype)
+    else:
+        memmap_dir = None
+    args = ([AS_cond] * number_of_chunks, chunk_sizes, seed_sequences,
+            [engine] * number_of_chunks, [bit_generator] * number_of_chunks,
+            [dtype] * number_of_chunks, [stream_cond] * number_of_chunks,
+            [memmap_dir] * number_of_chunks, starts)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_chunk, *args))
+    else:
+        results = list(map(_run_chunk, *args))
+
+    # チャンクの結果をライフ方向に結合
+    if memmap_dir is not None:
+        return AssetResult.open_memmap(memmap_dir, mode="r")
+    if stream_cond is not None:
+        return StreamingAssetResult.merge_all(results)
+    return AssetResult.concatenate(results)
@@ -0,0 +1,261 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+from compiled_plan import CompiledPlan, normalize_weights
+from year_kernel import update_assets_one_year_vector
+from renderers import get_renderer
+from return_sampler import as_joint_return_sampler, as_return_sampler, sample_rates
+
+# グリッドで変えられるパラメータ
+SWEEP_PARAMS = ("initial_cash", "initial_invest_asset", "inflation_rate",
+                "invest_per_year_scale", "allocation")
+OBJECTIVES = ("crash_ratio", "max_crash_ratio", "achieve_ratio",
+              "median_asset")
+
+
+def expand_grid(grid: dict) -> list:
+    """
+    {パラメータ名: 値のリスト}の全組み合わせを[{パラメータ名: 値}]にする
+    """
+    for name in grid:
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"sweepできないパラメータです: {name}")
+    names = list(grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*[grid[name] for name in names])
+    ]
+
+
+def get_allocation_label(allocation: dict) -> str:
+    """
+    {銘柄: 比率}を表・ヒートマップの軸に使う文字列にする(例: "SP500:0.7/NASDAQ:0.3")
+    """
+    return "/".join(f"{k}:{v:g}" for k, v in allocation.items())
+
+
+class ParameterSweep:
+    """
+    初期資産・インフレ率・年間投資額・投資比率をグリッドで変えて複数人生の計算を行う
+    - 全グリッド点で同じ乱数(各銘柄の利回り)を使う(共通乱数法)ため、
+      グリッド点間の差はパラメータの違いによるものになる
+    - グリッド点をライフ方向に並べ、全グリッド点を一度に配列で計算する
+    - 利回りはAssetSim.get_multi_role_play_assets_vectorと同じ順に引くため、
+      同じシードなら元の計画と同じパラメータのグリッド点はengine=vectorの結果と一致する
+
+    grid(省略したパラメータは元の計画の値を使う)
+    - initial_cash, initial_invest_asset, inflation_rate: 値のリスト
+    - invest_per_year_scale: asset_planの各年のinvest_per_yearに掛ける倍率のリスト
+    - allocation: 全年の投資比率を置き換える{銘柄: 比率}のリスト(指定しない銘柄は0。計画と同じく合計1に正規化する)
+    """
+
+    def __init__(self,
+                 return_distribution_dict,
+                 invest_plan,
+                 asset_plan,
+                 initial_year,
+                 initial_cash,
+                 initial_invest_asset,
+                 inflation_rate,
+                 rng=None,
+                 joint_return_distribution=None,
+                 sampling="random",
+                 stratified_groups=10,
+                 compiled_plan=None):
+        self.rng = np.random.default_rng() if rng is None else rng
+        # 共通乱数の引き方(AssetSimのsamplingと同じ)
+        self.sampling = sampling
+        self.stratified_groups = stratified_groups
+        self.samplers = {
+            k: as_return_sampler(return_distribution)
+            for k, return_distribution in return_distribution_dict.items()
+        }
+        self.joint_sampler = None
+        if joint_return_distribution is not None:
+            self.joint_sampler = as_joint_return_sampler(
+                joint_return_distribution, list(return_distribution_dict))
+        # 計算用の配列にまとめた計画(AssetSimと同じ)
+        if compiled_plan is None:
+            compiled_plan = CompiledPlan.from_plans(asset_plan, invest_plan,
+                                                    inflation_rate)
+        self.plan = compiled_plan
+        self.initial_year = initial_year
+        self.base_params = {
+            "initial_cash": initial_cash,
+            "initial_invest_asset": initial_invest_asset,
+            "inflation_rate": inflation_rate,
+            "invest_per_year_scale": 1.0,
+        }
+        self.stock_list = self.plan.stocks
+
+    def get_years(self):
+        return self.initial_year + 1 + np.arange(len(self.plan))
+
+    def draw_common_returns(self, n: int, n_years: int = None):
+        """
+        全グリッド点で共通に使う各銘柄の利回り{銘柄: (年数, n)}を引く
+        """
+        n_years = len(self.plan) if n_years is None else n_years
+        rates = {
+            k: np.empty((n_years, n), dtype=np.float64)
+            for k in self.stock_list
+        }
+        for year_idx in range(n_years):
+            rates_a_year = sample_rates(self.stock_list,
+                                        self.samplers,
+                                        n,
+                                        self.rng,
+                                        self.joint_sampler,
+                                        sampling=self.sampling,
+                                        groups=self.stratified_groups)
+            for k, rate in rates_a_year.items():
+                rates[k][year_idx] = rate
+        return rates
+
+    def _get_weights(self, points):
+        """
+        各グリッド点の(年数, グリッド点数, 銘柄数)の投資比率
+        (点に"weight_path"((年数, 銘柄数)の配列)がある場合は先頭の年からそれを使う)
+        allocation, weight_pathはCompiledPlanと同じく各年の合計が1になるよう正規化する
+        """
+        weights = np.repeat(self.plan.weights[:, np.newaxis, :],
+                            len(points),
+                            axis=1)
+        for i, point in enumerate(points):
+            if "allocation" in point:
+                weights[:, i, :] = normalize_weights([
+                    point["allocation"].get(k, 0.0) for k in self.stock_list
+                ])
+            if "weight_path" in point:
+                weights[:len(point["weight_path"]),
+                        i, :] = normalize_weights(point["weight_path"])
+        return weights
+
+    def _get_param(self, points, name):
+        """
+        各グリッド点のパラメータを(グリッド点数, 1)の配列にする
+        (ライフ方向にブロードキャストしてupdate_assets_one_year_vectorに渡す)
+        """
+        return np.array([point.get(name, self.base_params[name])
+                         for point in points],
+                        dtype=np.float64)[:, np.newaxis]
+
+    def simulate_points(self, points, rates, n: int, target_year_idx: int,
+                         asset_threshold: float):
+        """
+        グリッド点をまとめて(グリッド点数, n)の配列で計算し、目的関数の値を返す
+        """
+        cash = np.broadcast_to(self._get_param(points, "initial_cash"),
+                               (len(points), n))
+        invest = np.broadcast_to(
+            self._get_param(points, "initial_invest_asset"), (len(points), n))
+        inflation_rate = self._get_param(points, "inflation_rate")
+        invest_per_year_scale = self._get_param(points,
+                                                "invest_per_year_scale")
+        weights = self._get_weights(points)
+        max_crash_ratio = np.zeros(len(points))
+
+        plan = self.plan
+        for year_idx in range(min(target_year_idx + 1, len(plan))):
+            cost = plan.cost[year_idx] * inflation_rate**(year_idx + 1)
+            rate = np.zeros((len(points), n))
+            for j, k in enumerate(self.stock_list):
+                rate += weights[year_idx, :, j, np.newaxis] * rates[k][year_idx]
+            cash, invest, total, _ = update_assets_one_year_vector(
+                cash, invest, cost, plan.income[year_idx],
+                plan.saving_per_year[year_idx],
+                plan.invest_per_year[year_idx] * invest_per_year_scale, rate)
+            max_crash_ratio = np.maximum(max_crash_ratio,
+                                         (total < 0).mean(axis=1))
+
+        return {
+            "crash_ratio": (total < 0).mean(axis=1),
+            "max_crash_ratio": max_crash_ratio,
+            "achieve_ratio": (total >= asset_threshold).mean(axis=1),
+            "median_asset": np.median(total, axis=1),
+        }
+
+    def run(self,
+            grid: dict,
+            n: int,
+            target_year: int,
+            asset_threshold: float = 0,
+            max_lives_per_block: int = 1000000):
+        """
+        全グリッド点を計算し、パラメータと目的関数の表を返す
+        - n: 各グリッド点のライフ数
+        - target_year: 目的関数を評価する年
+        - asset_threshold: achieve_ratioの金額
+        - max_lives_per_block: 一度に計算する(グリッド点数×n)の上限(メモリの目安)
+        目的関数
+        - crash_ratio: target_yearに総資産が0を下回る割合
+        - max_crash_ratio: target_yearまでの各年のcrash_ratioの最大値
+        - achieve_ratio: target_yearに総資産がasset_threshold以上の割合
+        - median_asset: target_yearの総資産の中央値
+        """
+        years = self.get_years()
+        if target_year not in years:
+            raise ValueError(f"target_yearが計算範囲外です: {target_year}")
+        target_year_idx = int(np.flatnonzero(years == target_year)[0])
+        points = expand_grid(grid)
+        rates = self.draw_common_returns(n, target_year_idx + 1)
+
+        points_per_block = max(1, max_lives_per_block // n)
+        objectives = {name: [] for name in OBJECTIVES}
+        for start in range(0, len(points), points_per_block):
+            block = self.simulate_points(points[start:start +
+                                                 points_per_block], rates, n,
+                                          target_year_idx, asset_threshold)
+            for name in OBJECTIVES:
+                objectives[name].append(block[name])
+
+        sweep_df = pd.DataFrame([{
+            name: get_allocation_label(value) if name == "allocation" else value
+            for name, value in point.items()
+        } for point in points])
+        for name in OBJECTIVES:
+            sweep_df[name] = np.concatenate(objectives[name])
+        return sweep_df
+
+
+def get_sweep_heatmap_figure_spec(sweep_df,
+                                  x: str,
+                                  y: str,
+                                  objective: str = "crash_ratio"):
+    """
+    2つのパラメータを軸にした目的関数のヒートマップの図の仕様
+    (それ以外のパラメータは平均する)
+    """
+    heatmap_df = sweep_df.pivot_table(index=y,
+                                      columns=x,
+                                      values=objective,
+                                      aggfunc="mean",
+                                      sort=False)
+    return {
+        "name": f"sweep_{objective}",
+        "kind": "heatmap",
+        "title": f"{objective} by {x} and {y}",
+        "xlabel": x,
+        "ylabel": y,
+        "z": heatmap_df.to_numpy(),
+        "x": list(heatmap_df.columns),
+        "y": list(heatmap_df.index),
+        "colorbar": objective
+    }
+
+
+def plot_sweep_heatmap(sweep_df,
+                       x: str,
+                       y: str,
+                       objective: str = "crash_ratio",
+                       save_name: str = None,
+                       is_show: bool = True,
+                       mode: str = "matplotlib"):
+    """
+    2つのパラメータを軸に目的関数のヒートマップを描画する
+    (それ以外のパラメータは平均する)
+    """
+    get_renderer(mode).render(
+        get_sweep_heatmap_figure_spec(sweep_df, x, y, objective), save_name,
+        is_show)
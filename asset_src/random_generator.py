@@ -0,0 +1,27 @@
+import numpy as np
+
+# condition.jsonのbit_generatorで選択できるビットジェネレーター
+BIT_GENERATORS = {
+    "PCG64": np.random.PCG64,
+    "PCG64DXSM": np.random.PCG64DXSM,
+    "Philox": np.random.Philox,
+    "SFC64": np.random.SFC64,
+    "MT19937": np.random.MT19937,
+}
+
+
+def make_rng(seed=None, bit_generator: str = "PCG64"):
+    """
+    シードとビットジェネレーター名からnumpy.random.Generatorを作成する。
+
+    Args:
+        seed: int / np.random.SeedSequence / None(Noneの場合は毎回異なる乱数)
+        bit_generator (str): BIT_GENERATORSのキー
+    Returns:
+        numpy.random.Generator
+    """
+    if bit_generator not in BIT_GENERATORS:
+        raise ValueError(
+            f"bit_generatorが不正です: {bit_generator} (選択肢: {list(BIT_GENERATORS)})"
+        )
+    return np.random.Generator(BIT_GENERATORS[bit_generator](seed))
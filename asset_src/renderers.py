@@ -0,0 +1,352 @@
+import os
+import io
+import base64
+import html
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# 描画バックエンド{mode: Rendererのクラス}(register_rendererで追加する)
+RENDERERS = {}
+
+
+def register_renderer(name: str):
+    """
+    描画バックエンドを登録するデコレーター(condition.jsonのfig_modeで選べるようになる)
+    """
+
+    def decorator(cls):
+        RENDERERS[name] = cls
+        return cls
+
+    return decorator
+
+
+def get_renderer(mode: str, **options):
+    """
+    fig_modeに対応するRendererを返す
+    options: Rendererの引数(plotlyのinclude_plotlyjsなど)
+    """
+    if mode not in RENDERERS:
+        raise ValueError(f"fig_modeが不正です: {mode} (選択肢: {list(RENDERERS)})")
+    return RENDERERS[mode](**options)
+
+
+class Renderer:
+    """
+    描画バックエンドの基底クラス
+    描画する内容は図の仕様(dict)で受け取る。計算結果には依存しないため、別プロセスでも描画できる
+    - name: 保存するファイル名(拡張子なし)
+    - kind: "line"(折れ線), "bar"(ヒストグラム), "heatmap"
+    - title, xlabel, ylabel, y2label(右軸のラベル)
+    - series: [{"x", "y", "name", "color", "secondary_y"}]
+        - ヒストグラムは{"bin_edges", "y"}(barの図に折れ線を重ねることもできる)
+    - log_x: x軸を対数にする
+    - heatmapの場合はz(2次元配列), x, y(軸のラベル), colorbar
+    - legend: 凡例を表示するか, figsize: matplotlibの図のサイズ
+    """
+    # 保存するファイルの拡張子
+    extension = None
+    # ヒストグラムのビン数の既定値
+    histogram_bins = 20
+
+    def render(self, spec: dict, save_name: str = None, is_show=False):
+        raise NotImplementedError
+
+    def to_html(self, spec: dict) -> str:
+        """
+        レポートに埋め込むHTMLの断片を返す
+        """
+        raise NotImplementedError
+
+    def render_with_html(self, spec: dict, save_name: str = None,
+                         is_show=False) -> str:
+        """
+        renderと同じく描画して保存し、レポートに埋め込むHTMLの断片も返す
+        (図を一度だけ作るよう各バックエンドで上書きする)
+        """
+        self.render(spec, save_name, is_show)
+        return self.to_html(spec)
+
+    def get_report_head(self) -> str:
+        """
+        レポートのheadに一度だけ入れるHTML(ライブラリの読み込みなど)
+        """
+        return ""
+
+
+@register_renderer("matplotlib")
+class MatplotlibRenderer(Renderer):
+    extension = ".png"
+    histogram_bins = 20
+
+    def _draw(self, spec: dict):
+        import matplotlib.pyplot as plt
+
+        fig, ax1 = plt.subplots(figsize=spec.get("figsize", (10, 6)))
+        if spec["kind"] == "heatmap":
+            image = ax1.imshow(np.asarray(spec["z"]),
+                               aspect="auto",
+                               origin="lower")
+            fig.colorbar(image, label=spec.get("colorbar"))
+            ax1.set_xticks(range(len(spec["x"])),
+                           [str(x) for x in spec["x"]],
+                           rotation=45,
+                           ha="right")
+            ax1.set_yticks(range(len(spec["y"])), [str(y) for y in spec["y"]])
+        ax2 = None
+        for series in spec.get("series", []):
+            ax = ax1
+            if series.get("secondary_y"):
+                if ax2 is None:
+                    ax2 = ax1.twinx()
+                ax = ax2
+            if "bin_edges" in series:
+                ax.bar(series["bin_edges"][:-1],
+                       series["y"],
+                       width=np.diff(series["bin_edges"]),
+                       align='edge',
+                       edgecolor='black')
+            else:
+                ax.plot(series["x"],
+                        series["y"],
+                        color=series.get("color"),
+                        label=series.get("name"))
+        if spec.get("log_x"):
+            ax1.set_xscale("log")
+        ax1.set_xlabel(spec.get("xlabel"))
+        ax1.set_ylabel(spec.get("ylabel"))
+        if spec["kind"] == "bar":
+            ax1.grid(axis='y', alpha=0.75)
+        if ax2 is not None:
+            ax2.set_ylabel(spec.get("y2label"), color='red')
+            ax2.tick_params(axis='y', labelcolor='red')
+        plt.title(spec["title"])
+        if spec.get("legend"):
+            # 凡例を一つにまとめる
+            lines, labels = ax1.get_legend_handles_labels()
+            if ax2 is not None:
+                lines_2, labels_2 = ax2.get_legend_handles_labels()
+                lines, labels = lines + lines_2, labels + labels_2
+            ax1.legend(lines, labels, loc='best')
+        if spec["kind"] == "heatmap":
+            plt.tight_layout()
+        return fig
+
+    def render(self, spec: dict, save_name: str = None, is_show=False):
+        import matplotlib.pyplot as plt
+
+        fig = self._draw(spec)
+        if is_show:
+            plt.show()
+        if save_name:
+            fig.savefig(save_name + self.extension)
+        plt.clf()
+        plt.close()
+
+    def to_html(self, spec: dict) -> str:
+        return self.render_with_html(spec)
+
+    def render_with_html(self, spec: dict, save_name: str = None,
+                         is_show=False) -> str:
+        import matplotlib.pyplot as plt
+
+        fig = self._draw(spec)
+        if is_show:
+            plt.show()
+        if save_name:
+            fig.savefig(save_name + self.extension)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+        plt.clf()
+        plt.close()
+        data = base64.b64encode(buffer.getvalue()).decode("ascii")
+        return f'<img src="data:image/png;base64,{data}">'
+
+
+@register_renderer("plotly")
+class PlotlyRenderer(Renderer):
+    extension = ".html"
+    histogram_bins = 50
+
+    def __init__(self, include_plotlyjs="inline"):
+        """
+        include_plotlyjs: 各htmlでのplotly.jsの読み込み方
+            "inline": 各htmlに埋め込む(オフラインで見られる)
+            "directory": 出力先にplotly.min.jsを一つ置き、各htmlから参照する
+            "cdn": CDNから読み込む(インターネット接続が必要)
+        """
+        self.include_plotlyjs = True if include_plotlyjs == "inline" else include_plotlyjs
+
+    def build_figure(self, spec: dict):
+        import plotly.graph_objects as go
+
+        fig = go.Figure()
+        if spec["kind"] == "heatmap":
+            fig.add_trace(
+                go.Heatmap(z=np.asarray(spec["z"]),
+                           x=[str(x) for x in spec["x"]],
+                           y=[str(y) for y in spec["y"]],
+                           colorbar=dict(title=spec.get("colorbar"))))
+        for series in spec.get("series", []):
+            if "bin_edges" in series and spec.get("log_x"):
+                # 対数軸ではBarの幅がずれるため、階段状に塗りつぶした線で描く
+                bin_edges = np.asarray(series["bin_edges"])
+                fig.add_trace(
+                    go.Scatter(x=bin_edges,
+                               y=np.append(series["y"], series["y"][-1]),
+                               mode='lines',
+                               name=series.get("name"),
+                               line=dict(shape='hv'),
+                               fill='tozeroy'))
+            elif "bin_edges" in series:
+                bin_edges = np.asarray(series["bin_edges"])
+                fig.add_trace(
+                    go.Bar(x=(bin_edges[:-1] + bin_edges[1:]) / 2,
+                           y=series["y"],
+                           name=series.get("name")))
+            else:
+                fig.add_trace(
+                    go.Scatter(x=series["x"],
+                               y=series["y"],
+                               mode='lines',
+                               name=series.get("name"),
+                               line=dict(color=series.get("color")),
+                               yaxis='y2'
+                               if series.get("secondary_y") else None))
+        fig.update_layout(title=spec["title"],
+                          xaxis=dict(title=spec.get("xlabel")),
+                          yaxis=dict(title=spec.get("ylabel"), side='left'),
+                          width=900,
+                          height=700)
+        if spec.get("y2label"):
+            fig.update_layout(yaxis2=dict(
+                title=spec["y2label"], overlaying='y', side='right'))
+        if spec.get("log_x"):
+            fig.update_xaxes(type="log")
+        if spec.get("legend"):
+            fig.update_layout(legend=dict(x=0, y=1.1, orientation='h'))
+        if spec["kind"] == "bar":
+            fig.update_layout(bargap=0.1)
+        return fig
+
+    def render(self, spec: dict, save_name: str = None, is_show=False):
+        fig = self.build_figure(spec)
+        if is_show:
+            fig.show()
+        if save_name:
+            fig.write_html(save_name + self.extension,
+                           include_plotlyjs=self.include_plotlyjs)
+
+    def to_html(self, spec: dict) -> str:
+        return self.build_figure(spec).to_html(full_html=False,
+                                               include_plotlyjs=False)
+
+    def render_with_html(self, spec: dict, save_name: str = None,
+                         is_show=False) -> str:
+        fig = self.build_figure(spec)
+        if is_show:
+            fig.show()
+        if save_name:
+            fig.write_html(save_name + self.extension,
+                           include_plotlyjs=self.include_plotlyjs)
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+
+    def get_report_head(self) -> str:
+        """
+        include_plotlyjsに合わせてplotly.jsを読み込む
+        (inline以外は各htmlと同じplotly.min.js・CDNを参照するため、レポートにplotly.jsを埋め込まない)
+        """
+        from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+        if self.include_plotlyjs == "directory":
+            return '<script src="plotly.min.js"></script>'
+        if self.include_plotlyjs == "cdn":
+            return (f'<script src="https://cdn.plot.ly/plotly-'
+                    f'{get_plotlyjs_version()}.min.js"></script>')
+        return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+
+
+def _render_one(mode, options, spec, save_name, with_html=False):
+    """
+    1つの図を描画して保存する(with_htmlの場合はレポートに埋め込むHTMLの断片を返す)
+    """
+    renderer = get_renderer(mode, **options)
+    if with_html:
+        return renderer.render_with_html(spec, save_name)
+    renderer.render(spec, save_name)
+    return None
+
+
+def write_html_report(specs: list,
+                      file_path,
+                      mode: str = "plotly",
+                      title: str = "asset simulation report",
+                      fragments: list = None,
+                      **options):
+    """
+    全ての図を一つのHTMLにまとめる(plotly.jsなどのライブラリはheadで一度だけ読み込む)
+    - fragments: 描画済みの各図のHTMLの断片(Renderer.render_with_html)。Noneの場合はここで作成する
+    """
+    renderer = get_renderer(mode, **options)
+    if fragments is None:
+        fragments = [renderer.to_html(spec) for spec in specs]
+    sections = "\n".join(
+        f"<section><h2>{html.escape(spec['title'])}</h2>\n"
+        f"{fragment}</section>" for spec, fragment in zip(specs, fragments))
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+{renderer.get_report_head()}
+</head>
+<body>
+<h1>{html.escape(title)}</h1>
+{sections}
+</body>
+</html>
+""")
+    return file_path
+
+
+def render_figures(specs: list,
+                   out_dir,
+                   mode: str = "plotly",
+                   workers: int = 1,
+                   is_show: bool = False,
+                   report_name: str = None,
+                   **options):
+    """
+    図の仕様のリストを{out_dir}/{spec["name"]}に描画し、保存したファイルのパスを返す
+    - workers: 2以上の場合は別プロセスで並列に描画する(is_showの場合は順に描画する)
+    - report_name: 指定した場合は全ての図を{out_dir}/{report_name}.htmlにもまとめる
+      (各図を描画するときにHTMLの断片も作り、図を作り直さない)
+    - options: Rendererの引数
+    """
+    renderer = get_renderer(mode, **options)
+    save_names = [f"{out_dir}/{spec['name']}" for spec in specs]
+    with_html = bool(report_name)
+    if workers > 1 and not is_show and len(specs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fragments = list(
+                executor.map(_render_one, [mode] * len(specs),
+                             [options] * len(specs), specs, save_names,
+                             [with_html] * len(specs)))
+    elif with_html:
+        fragments = [
+            renderer.render_with_html(spec, save_name, is_show)
+            for spec, save_name in zip(specs, save_names)
+        ]
+    else:
+        for spec, save_name in zip(specs, save_names):
+            renderer.render(spec, save_name, is_show)
+    file_paths = [save_name + renderer.extension for save_name in save_names]
+    if report_name:
+        file_paths.append(
+            write_html_report(specs,
+                              f"{out_dir}/{report_name}.html",
+                              mode,
+                              fragments=fragments,
+                              **options))
+    return [file_path for file_path in file_paths if os.path.exists(file_path)]
@@ -0,0 +1,164 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import numpy as np
+
+from asset_result import AssetResult
+from streaming_stats import StreamingAssetResult
+from tbase_for_asset import update_file_hash
+
+# 保存形式・計算方法を変えたときに上げる(古いキャッシュを使わないようにする)
+RESULT_CACHE_VERSION = 2
+
+
+def make_cache_key(inputs: dict, file_paths: list) -> str:
+    """
+    計算条件(inputs)と入力ファイルの中身からキャッシュのキー(sha256)を作成する
+    """
+    h = hashlib.sha256()
+    h.update(
+        json.dumps({
+            "version": RESULT_CACHE_VERSION,
+            **inputs
+        },
+                   sort_keys=True,
+                   default=str).encode("utf-8"))
+    for file_path in file_paths:
+        h.update(os.path.basename(file_path).encode("utf-8"))
+        update_file_hash(h, file_path)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    複数人生のシミュレーション結果のキャッシュ
+    - cache_dir/{key}/ に結果を保存する(AssetResultは.npy、StreamingAssetResultは.npz)
+    - 合計サイズがmax_bytesを超えたら、最後に使われたのが古いものから削除する(LRU)
+    - チェックポイント(asset_planと各年の開始時点の乱数の状態)を一緒に保存すると、
+      asset_planの後半だけを変えた場合にfind_checkpointで途中から再計算できる
+    """
+
+    def __init__(self, cache_dir, max_bytes: int = 2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return f"{self.cache_dir}/{key}"
+
+    def load(self, key):
+        """
+        keyの結果を返す(メモリマップで開く)。無い場合はNoneを返す
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(f"{entry_dir}/stream.npz"):
+            result = StreamingAssetResult.load(f"{entry_dir}/stream.npz")
+        elif os.path.exists(f"{entry_dir}/asset_result/total.npy"):
+            result = AssetResult.open_memmap(f"{entry_dir}/asset_result")
+        else:
+            return None
+        # 最終使用時刻を更新(LRU用)
+        os.utime(entry_dir)
+        return result
+
+    def save(self, key, result, checkpoint: dict = None):
+        """
+        keyで結果を保存し、容量を超えた分の古いキャッシュを削除する
+        - checkpoint: {"prefix_key": asset_plan以外の入力のキー,
+                       "plan": (年数, 列数)のasset_planの配列,
+                       "rng_states": 各年の開始時点と最後の年の終了時点の乱数の状態のリスト}
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        if isinstance(result, StreamingAssetResult):
+            result.save(f"{tmp_dir}/stream.npz")
+        else:
+            result.save(f"{tmp_dir}/asset_result")
+        if checkpoint is not None:
+            np.save(f"{tmp_dir}/plan.npy", checkpoint["plan"])
+            with open(f"{tmp_dir}/checkpoint.pkl", "wb") as f:
+                pickle.dump(
+                    {
+                        "prefix_key": checkpoint["prefix_key"],
+                        "rng_states": checkpoint["rng_states"]
+                    }, f)
+        # 書き込み途中のキャッシュを読まないよう最後に名前を変える
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.rename(tmp_dir, entry_dir)
+        self.evict(keep=key)
+
+    def find_checkpoint(self, prefix_key, plan):
+        """
+        prefix_keyが同じキャッシュのうち、planと先頭から一致する年数が最も多いものを探し、
+        (計算済みの結果, 再開する年のidx, 各年の開始時点と最後の年の終了時点の乱数の状態のリスト)を返す。
+        (planがキャッシュの計画に年を追加したものの場合、再開する年はキャッシュの年数になる)
+        一年目から異なる場合・見つからない場合はNoneを返す
+        """
+        best = None
+        for key in self._get_keys():
+            entry_dir = self._entry_dir(key)
+            if not os.path.exists(f"{entry_dir}/checkpoint.pkl"):
+                continue
+            with open(f"{entry_dir}/checkpoint.pkl", "rb") as f:
+                checkpoint = pickle.load(f)
+            if checkpoint["prefix_key"] != prefix_key:
+                continue
+            cached_plan = np.load(f"{entry_dir}/plan.npy")
+            if cached_plan.shape[1] != plan.shape[1]:
+                continue
+            # 最初に異なる行(年)を探す
+            n_common = min(len(cached_plan), len(plan))
+            is_changed = np.any(cached_plan[:n_common] != plan[:n_common],
+                                axis=1)
+            start_year_idx = int(
+                np.argmax(is_changed)) if is_changed.any() else n_common
+            if start_year_idx > 0 and (best is None
+                                       or start_year_idx > best[1]):
+                best = (key, start_year_idx, checkpoint["rng_states"])
+        if best is None:
+            return None
+        key, start_year_idx, rng_states = best
+        return self.load(key), start_year_idx, rng_states
+
+    def invalidate(self, key=None):
+        """
+        keyのキャッシュを削除する(Noneの場合はすべて削除する)
+        """
+        keys = [key] if key is not None else self._get_keys()
+        for k in keys:
+            shutil.rmtree(self._entry_dir(k), ignore_errors=True)
+
+    def _get_keys(self):
+        return [
+            name for name in os.listdir(self.cache_dir)
+            if os.path.isdir(self._entry_dir(name))
+            and not name.endswith(".tmp")
+        ]
+
+    def _get_entry_bytes(self, key):
+        total = 0
+        for root, _, files in os.walk(self._entry_dir(key)):
+            total += sum(
+                os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def evict(self, keep=None):
+        """
+        合計サイズがmax_bytes以下になるまで最終使用時刻が古いものから削除する
+        (keepのキャッシュは削除しない)
+        """
+        keys = sorted(self._get_keys(),
+                      key=lambda k: os.path.getmtime(self._entry_dir(k)))
+        sizes = {k: self._get_entry_bytes(k) for k in keys}
+        total = sum(sizes.values())
+        for k in keys:
+            if total <= self.max_bytes:
+                break
+            if k == keep:
+                continue
+            self.invalidate(k)
+            total -= sizes[k]
@@ -0,0 +1,125 @@
+import os
+import zipfile
+import numpy as np
+
+from asset_result import AssetResult, FIELDS
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_export_format(export_format: str) -> str:
+    """
+    "auto"の場合はpyarrowがあればparquet、なければnpzを返す
+    """
+    if export_format == "auto":
+        return "parquet" if _has_pyarrow() else "npz"
+    if export_format == "parquet" and not _has_pyarrow():
+        raise ImportError("parquet出力にはpyarrowのインストールが必要です")
+    if export_format not in ("parquet", "npz"):
+        raise ValueError(f"export_formatが不正です: {export_format}")
+    return export_format
+
+
+def _iter_life_blocks(result: AssetResult, block_size: int):
+    for start in range(0, result.number_of_life, block_size):
+        yield start, result.get_lives(
+            start, min(start + block_size, result.number_of_life))
+
+
+def _export_result_parquet(result: AssetResult, file_path, block_size: int):
+    """
+    life, year, cash, invest, total, profit, rateの縦持ちの表をブロックごとに書き込む
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("life", pa.int64()), ("year", pa.int64())] +
+                       [(field, pa.from_numpy_dtype(result.dtype))
+                        for field in FIELDS])
+    n_years = len(result.years)
+    with pq.ParquetWriter(file_path, schema, compression="zstd") as writer:
+        for start, block in _iter_life_blocks(result, block_size):
+            n_lives = block.number_of_life
+            columns = {
+                "life": np.repeat(np.arange(start, start + n_lives), n_years),
+                "year": np.tile(result.years.astype(np.int64), n_lives),
+            }
+            for field in FIELDS:
+                # ライフごとに年が並ぶ順にする
+                columns[field] = np.ascontiguousarray(
+                    block.planes[field].T).ravel()
+            writer.write_table(pa.table(columns, schema=schema))
+
+
+def _write_npy_to_zip(zf, name, array):
+    with zf.open(f"{name}.npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(array))
+
+
+def _export_result_npz(result: AssetResult, file_path, block_size: int):
+    """
+    {field}_{ブロック番号}に(年数, ブロック内ライフ数)の配列をブロックごとに書き込む
+    """
+    with zipfile.ZipFile(file_path,
+                         "w",
+                         compression=zipfile.ZIP_DEFLATED,
+                         allowZip64=True) as zf:
+        _write_npy_to_zip(zf, "years", result.years)
+        for i, (_, block) in enumerate(_iter_life_blocks(result, block_size)):
+            for field in FIELDS:
+                _write_npy_to_zip(zf, f"{field}_{i:05d}",
+                                  np.ascontiguousarray(block.planes[field]))
+
+
+def export_result(result: AssetResult,
+                  out_dir,
+                  export_format: str = "auto",
+                  block_size: int = 10000):
+    """
+    全ライフ・全年の結果を圧縮した列指向形式で出力し、出力したファイルパスを返す
+    - parquet: asset_result.parquet(life, year, cash, invest, total, profit, rate)
+    - npz: asset_result.npz(years, {field}_{ブロック番号})
+    ブロックごとに書き込むため、出力時のメモリはライフ総数ではなくblock_sizeに比例する
+    """
+    export_format = resolve_export_format(export_format)
+    os.makedirs(out_dir, exist_ok=True)
+    file_path = f"{out_dir}/asset_result.{export_format}"
+    if export_format == "parquet":
+        _export_result_parquet(result, file_path, block_size)
+    else:
+        _export_result_npz(result, file_path, block_size)
+    return file_path
+
+
+def export_summary(summary_dfs: dict, out_dir, export_format: str = "auto"):
+    """
+    集計表{名前: DataFrame}を出力し、出力したファイルパスのリストを返す
+    - parquet: {名前}.parquet
+    - npz: summary.npz({名前}.{列名})
+    """
+    export_format = resolve_export_format(export_format)
+    os.makedirs(out_dir, exist_ok=True)
+    if export_format == "parquet":
+        file_paths = []
+        for name, df in summary_dfs.items():
+            file_path = f"{out_dir}/{name}.parquet"
+            df.to_parquet(file_path, engine="pyarrow", compression="zstd")
+            file_paths.append(file_path)
+        return file_paths
+
+    file_path = f"{out_dir}/summary.npz"
+    arrays = {}
+    for name, df in summary_dfs.items():
+        # 名前付きのindex(yearなど)は列として出力する
+        if df.index.name is not None:
+            df = df.reset_index()
+        for column in df.columns:
+            arrays[f"{name}.{column}"] = df[column].to_numpy()
+    np.savez_compressed(file_path, **arrays)
+    return [file_path]
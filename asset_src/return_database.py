@@ -0,0 +1,160 @@
+import os
+import sys
+import csv
+import glob
+import argparse
+import numpy as np
+
+from return_sampler import (JointReturnSampler, ReturnSampler,
+                            build_alias_table)
+from tbase_for_asset import get_file_hash
+
+# 保存形式を変えたときに上げる(古いファイルは作り直す)
+RETURN_DATABASE_VERSION = 2
+JOINT_RETURN_NAME = "joint_returns"
+
+
+def _read_csv_columns(csv_in):
+    """
+    CSVを{列名: 文字列のリスト}として読み込む(pandasを使わない)
+    """
+    with open(csv_in, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    header, values = rows[0], rows[1:]
+    return {name: [row[j] for row in values] for j, name in enumerate(header)}
+
+
+def get_source_paths(database_dir):
+    """
+    コンパイル対象のCSV{名前: パス}
+    (rate, Share列の利回り分布と、joint_returns.csv)
+    """
+    source_paths = {}
+    for csv_in in sorted(glob.glob(f"{database_dir}/*.csv")):
+        name = os.path.splitext(os.path.basename(csv_in))[0]
+        with open(csv_in, newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        if name == JOINT_RETURN_NAME or header == ["rate", "Share"]:
+            source_paths[name] = csv_in
+    return source_paths
+
+
+def get_default_path(database_dir):
+    return f"{database_dir}/returns.npz"
+
+
+def compile_return_database(database_dir, out_path=None):
+    """
+    database_dirのCSVを一つの.npzにまとめる(CSVが編集用の元データ)
+    - {銘柄}.rate: 利回り(小数), {銘柄}.share: 確率(合計1)
+    - {銘柄}.alias_prob, {銘柄}.alias_idx: エイリアス法のテーブル
+    - joint.rate_table, joint.share, joint.stock_names: joint_returns.csvの表
+    - joint.alias_prob, joint.alias_idx: joint_returns.csvの行のエイリアス法のテーブル
+    - source_names, source_hashes: 元のCSVのsha256(is_staleの判定用)
+    出力したファイルのパスを返す
+    """
+    out_path = get_default_path(database_dir) if out_path is None else out_path
+    source_paths = get_source_paths(database_dir)
+    arrays = {"version": np.array(RETURN_DATABASE_VERSION)}
+    stock_names = []
+    for name, csv_in in source_paths.items():
+        columns = _read_csv_columns(csv_in)
+        share = np.array(columns.pop("Share"), dtype=np.float64)
+        share = share / share.sum()
+        alias_prob, alias_idx = build_alias_table(share)
+        if name == JOINT_RETURN_NAME:
+            columns.pop("start", None)
+            arrays["joint.rate_table"] = np.array(
+                list(columns.values()), dtype=np.float64).T / 100.0
+            arrays["joint.share"] = share
+            arrays["joint.alias_prob"] = alias_prob
+            arrays["joint.alias_idx"] = alias_idx
+            arrays["joint.stock_names"] = np.array(list(columns))
+            continue
+        arrays[f"{name}.rate"] = np.array(columns["rate"],
+                                          dtype=np.float64) / 100.0
+        arrays[f"{name}.share"] = share
+        arrays[f"{name}.alias_prob"] = alias_prob
+        arrays[f"{name}.alias_idx"] = alias_idx
+        stock_names.append(name)
+    arrays["stock_names"] = np.array(stock_names)
+    arrays["source_names"] = np.array(list(source_paths))
+    arrays["source_hashes"] = np.array(
+        [get_file_hash(csv_in) for csv_in in source_paths.values()])
+
+    # 書き込み途中のファイルを読まないよう最後に名前を変える
+    tmp_path = f"{out_path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def is_stale(database_dir, path=None) -> bool:
+    """
+    .npzが無い・形式が古い・元のCSVが追加/削除/変更されている場合にTrueを返す
+    """
+    path = get_default_path(database_dir) if path is None else path
+    if not os.path.exists(path):
+        return True
+    with np.load(path) as data:
+        if int(data["version"]) != RETURN_DATABASE_VERSION:
+            return True
+        compiled_hashes = dict(
+            zip(data["source_names"].tolist(),
+                data["source_hashes"].tolist()))
+    source_paths = get_source_paths(database_dir)
+    return compiled_hashes != {
+        name: get_file_hash(csv_in)
+        for name, csv_in in source_paths.items()
+    }
+
+
+def load_return_database(path, stock_names=None):
+    """
+    compile_return_databaseで作成した.npzを読み込み、
+    ({銘柄: ReturnSampler}, JointReturnSampler(joint_returnsが無い場合はNone))を返す
+    stock_names: 読み込む銘柄(Noneの場合は全銘柄)
+    """
+    with np.load(path) as data:
+        names = data["stock_names"].tolist(
+        ) if stock_names is None else list(stock_names)
+        samplers = {}
+        for name in names:
+            if f"{name}.rate" not in data:
+                raise KeyError(f"{path}に{name}がありません")
+            samplers[name] = ReturnSampler.from_tables(
+                data[f"{name}.rate"], data[f"{name}.share"],
+                data[f"{name}.alias_prob"], data[f"{name}.alias_idx"])
+        joint_sampler = None
+        if "joint.rate_table" in data:
+            joint_sampler = JointReturnSampler.from_tables(
+                data["joint.rate_table"], data["joint.share"],
+                data["joint.stock_names"].tolist(), data["joint.alias_prob"],
+                data["joint.alias_idx"])
+    return samplers, joint_sampler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="database/*.csvから利回り分布の.npz(returns.npz)を作成する")
+    parser.add_argument("database_dir", help="利回り分布のCSVがあるディレクトリ")
+    parser.add_argument("--out",
+                        default=None,
+                        help="出力先(省略時はdatabase_dir/returns.npz)")
+    parser.add_argument("--check",
+                        action="store_true",
+                        help="作成せず、CSVから作り直す必要があるかだけ確認する")
+    args = parser.parse_args()
+
+    if args.check:
+        stale = is_stale(args.database_dir, args.out)
+        print("stale" if stale else "up to date")
+        sys.exit(1 if stale else 0)
+    out_path = compile_return_database(args.database_dir, args.out)
+    with np.load(out_path) as data:
+        print(f"{out_path}: {data['stock_names'].tolist()} "
+              f"(joint_returns: {'joint.rate_table' in data})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# 同じ分布から作ったサンプラーを使い回すためのキャッシュ(古いものから捨てる)
+_SAMPLER_CACHE = OrderedDict()
+_SAMPLER_CACHE_SIZE = 64
+# 利回りの一様乱数の引き方(draw_uniformsを参照)
+SAMPLING_METHODS = ("random", "antithetic", "stratified")
+
+
+def build_alias_table(share):
+    """
+    Vose のエイリアス法のテーブルを作成する。
+
+    Args:
+        share (np.ndarray): 各idxが選ばれる確率(合計1)
+    Returns:
+        alias_prob (np.ndarray): 各idxをそのまま採用する確率
+        alias_idx (np.ndarray): 採用しなかった場合に選ぶidx
+    """
+    n = len(share)
+    scaled = np.asarray(share, dtype=np.float64) * n
+    alias_prob = np.ones(n, dtype=np.float64)
+    alias_idx = np.arange(n, dtype=np.int64)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        alias_prob[s] = scaled[s]
+        alias_idx[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    # 残りは丸め誤差分なので必ず自分自身を採用する
+    for i in small + large:
+        alias_prob[i] = 1.0
+        alias_idx[i] = i
+    return alias_prob, alias_idx
+
+
+class ReturnSampler:
+    """
+    年間利回り分布(rate, share)に従って利回りを選ぶサンプラー
+    - エイリアステーブルを一度だけ作成し、1サンプルあたりO(1)で選ぶ
+    - 任意のshapeでまとめて選ぶことができる
+    """
+
+    def __init__(self, rate, share):
+        """
+        rate: 利回りの配列
+        share: 各利回りの確率(合計が1でなくても正規化する)
+        """
+        self.rate = np.asarray(rate, dtype=np.float64)
+        share = np.asarray(share, dtype=np.float64)
+        self.share = share / share.sum()
+        self.alias_prob, self.alias_idx = build_alias_table(self.share)
+        self._cdf = None
+
+    @classmethod
+    def from_tables(cls, rate, share, alias_prob, alias_idx):
+        """
+        作成済みのエイリアステーブルから作成する(テーブルの再計算をしない)
+        """
+        sampler = cls.__new__(cls)
+        sampler.rate = np.asarray(rate, dtype=np.float64)
+        sampler.share = np.asarray(share, dtype=np.float64)
+        sampler.alias_prob = np.asarray(alias_prob, dtype=np.float64)
+        sampler.alias_idx = np.asarray(alias_idx, dtype=np.int64)
+        sampler._cdf = None
+        return sampler
+
+    def __len__(self):
+        return len(self.rate)
+
+    def sample_indices(self, size=None, rng=np.random):
+        """
+        shareの確率に従い利回りのidxを選ぶ。
+        sizeがNoneの場合はintを1つ返す。
+        - rng: 乱数生成器(numpy.random.Generator または np.random)
+        """
+        n = len(self.rate)
+        # 一様乱数の整数部で列を選び、小数部でエイリアスを使うか決める
+        u = rng.random(size) * n
+        column = np.minimum(np.asarray(u, dtype=np.int64), n - 1)
+        accept = (u - column) < self.alias_prob[column]
+        idx = np.where(accept, column, self.alias_idx[column])
+        if size is None:
+            return int(idx)
+        return idx
+
+    def sample(self, size=None, rng=np.random):
+        """
+        shareの確率に従い利回りを選ぶ。
+        sizeがNoneの場合はfloatを1つ返す。
+        """
+        idx = self.sample_indices(size, rng)
+        if size is None:
+            return float(self.rate[idx])
+        return self.rate[idx]
+
+    def get_cdf(self):
+        """
+        (rateの昇順のidx, その順の累積確率)を返す(初回に計算して使い回す)
+        """
+        if self._cdf is None:
+            order = np.argsort(self.rate, kind="stable")
+            self._cdf = (order, np.cumsum(self.share[order]))
+        return self._cdf
+
+    def ppf_indices(self, u):
+        """
+        累積分布の逆関数: 一様乱数u(0〜1)をrateの昇順の累積確率で利回りのidxに変換する
+        (uが大きいほど利回りが大きいため、uと1-uで負の相関を持つ利回りになる)
+        """
+        order, cdf = self.get_cdf()
+        idx = np.searchsorted(cdf, np.asarray(u) * cdf[-1], side="right")
+        return order[np.minimum(idx, len(order) - 1)]
+
+    def ppf(self, u):
+        """
+        累積分布の逆関数: 一様乱数u(0〜1)を利回りに変換する
+        """
+        return self.rate[self.ppf_indices(u)]
+
+
+def get_return_sampler(rate, share):
+    """
+    利回り分布に対応するReturnSamplerを返す。
+    同じ分布のサンプラーは作成済みのものを使い回す。
+    """
+    rate = np.ascontiguousarray(rate, dtype=np.float64)
+    share = np.ascontiguousarray(share, dtype=np.float64)
+    key = hashlib.sha1(rate.tobytes() + share.tobytes()).hexdigest()
+    if key in _SAMPLER_CACHE:
+        _SAMPLER_CACHE.move_to_end(key)
+        return _SAMPLER_CACHE[key]
+    _SAMPLER_CACHE[key] = ReturnSampler(rate, share)
+    if len(_SAMPLER_CACHE) > _SAMPLER_CACHE_SIZE:
+        _SAMPLER_CACHE.popitem(last=False)
+    return _SAMPLER_CACHE[key]
+
+
+class JointReturnSampler:
+    """
+    複数銘柄の同じ期間の年間利回りの表(行: 期間, 列: 銘柄)から行を選ぶサンプラー
+    - 1回の選択で全銘柄の利回りを同じ行から取るため、銘柄間の相関が保たれる
+    - 行の選択はReturnSamplerと同じエイリアス法(1ライフ・1年あたり一様乱数1つ)
+    """
+
+    def __init__(self, rate_table, share, stock_names):
+        """
+        rate_table: (期間数, 銘柄数)の利回りの配列
+        share: 各期間の確率(合計が1でなくても正規化する)
+        stock_names: 各列の銘柄名
+        """
+        self.rate_table = np.asarray(rate_table, dtype=np.float64)
+        self.stock_names = list(stock_names)
+        self.row_sampler = ReturnSampler(np.arange(len(self.rate_table)),
+                                         share)
+        self._cdf = None
+
+    @classmethod
+    def from_tables(cls, rate_table, share, stock_names, alias_prob,
+                    alias_idx):
+        """
+        作成済みの行のエイリアステーブルから作成する(テーブルの再計算をしない)
+        """
+        sampler = cls.__new__(cls)
+        sampler.rate_table = np.asarray(rate_table, dtype=np.float64)
+        sampler.stock_names = list(stock_names)
+        sampler.row_sampler = ReturnSampler.from_tables(
+            np.arange(len(sampler.rate_table)), share, alias_prob, alias_idx)
+        sampler._cdf = None
+        return sampler
+
+    def select(self, stock_names):
+        """
+        stock_namesに含まれる銘柄だけを選ぶサンプラーを返す(行の選び方は同じ)
+        """
+        sampler = JointReturnSampler.__new__(JointReturnSampler)
+        columns = [
+            j for j, k in enumerate(self.stock_names) if k in stock_names
+        ]
+        sampler.rate_table = self.rate_table[:, columns]
+        sampler.stock_names = [self.stock_names[j] for j in columns]
+        sampler.row_sampler = self.row_sampler
+        # 行の平均利回りが変わるため累積分布は選んだ銘柄で計算し直す
+        sampler._cdf = None
+        return sampler
+
+    @classmethod
+    def from_dataframe(cls, joint_return_distribution, stock_names=None):
+        """
+        create_database.get_joint_return_tableの表(利回りは%)から作成する
+        stock_names: 使う銘柄(Noneの場合は表の全銘柄。表にない銘柄は無視する)
+        """
+        table_names = [
+            c for c in joint_return_distribution.columns
+            if c not in ("start", "Share")
+        ]
+        if stock_names is not None:
+            table_names = [c for c in table_names if c in stock_names]
+        return cls(joint_return_distribution[table_names].to_numpy() / 100.0,
+                   joint_return_distribution["Share"].to_numpy(),
+                   table_names)
+
+    def sample(self, size=None, rng=np.random):
+        """
+        行を選び、{銘柄: 利回り}を返す
+        (sizeがNoneの場合は各銘柄float、それ以外は各銘柄sizeの配列)
+        """
+        idx = self.row_sampler.sample_indices(size, rng)
+        return self._get_rates(idx, size is None)
+
+    def ppf(self, u):
+        """
+        累積分布の逆関数: 一様乱数u(0〜1)を各行の平均利回りの昇順の累積確率で行に変換し、
+        {銘柄: 利回り}を返す
+        """
+        order, cdf = self.get_cdf()
+        idx = np.searchsorted(cdf, np.asarray(u) * cdf[-1], side="right")
+        return self._get_rates(order[np.minimum(idx, len(order) - 1)])
+
+    def get_cdf(self):
+        """
+        (各行の平均利回りの昇順の行idx, その順の累積確率)を返す(初回に計算して使い回す)
+        """
+        if self._cdf is None:
+            order = np.argsort(self.rate_table.mean(axis=1), kind="stable")
+            self._cdf = (order, np.cumsum(self.row_sampler.share[order]))
+        return self._cdf
+
+    def _get_rates(self, idx, is_scalar: bool = False):
+        return {
+            k: float(self.rate_table[idx, j]) if is_scalar else
+            self.rate_table[idx, j]
+            for j, k in enumerate(self.stock_names)
+        }
+
+
+def as_return_sampler(return_distribution):
+    """
+    利回り分布(DataFrame: rate[%], Share)またはReturnSamplerをReturnSamplerにする
+    """
+    if isinstance(return_distribution, ReturnSampler):
+        return return_distribution
+    return get_return_sampler(return_distribution['rate'].to_numpy() / 100.0,
+                              return_distribution['Share'].to_numpy())
+
+
+def as_joint_return_sampler(joint_return_distribution, stock_names):
+    """
+    複数銘柄の利回りの表(DataFrame)またはJointReturnSamplerを、
+    stock_namesの銘柄だけを選ぶJointReturnSamplerにする
+    """
+    if isinstance(joint_return_distribution, JointReturnSampler):
+        return joint_return_distribution.select(stock_names)
+    return JointReturnSampler.from_dataframe(joint_return_distribution,
+                                             stock_names)
+
+
+def get_group_sizes(size: int, groups: int):
+    """
+    sizeライフをgroups個(size以下)に分けた各グループのライフ数
+    """
+    groups = max(1, min(groups, size))
+    base, rest = divmod(size, groups)
+    return [base + (1 if i < rest else 0) for i in range(groups)]
+
+
+def draw_uniforms(size: int, rng=np.random, sampling: str = "random",
+                  groups: int = 1):
+    """
+    一様乱数(0〜1)をsize個引く
+    - random: 独立に引く
+    - antithetic: 前半(size+1)//2個をuとし、後半を1-uにする(i番目とi+(size+1)//2番目が対)
+    - stratified: ライフをgroups個のグループに分け、各グループ内でm個を[j/m, (j+1)/m)から1つずつ引き
+      順番を並べ替える(ラテン超方格。年・銘柄ごとに独立に並べ替える)
+    """
+    if sampling == "antithetic":
+        u = rng.random((size + 1) // 2)
+        return np.concatenate([u, 1.0 - u])[:size]
+    elif sampling == "stratified":
+        return np.concatenate([(rng.permutation(m) + rng.random(m)) / m
+                               for m in get_group_sizes(size, groups)])
+    elif sampling != "random":
+        raise ValueError(
+            f"samplingが不正です: {sampling} (選択肢: {SAMPLING_METHODS})")
+    return rng.random(size)
+
+
+def sample_rates(stocks, samplers: dict, size=None, rng=np.random,
+                 joint_sampler: JointReturnSampler = None,
+                 sampling: str = "random", groups: int = 1):
+    """
+    各銘柄の利回り{銘柄: 利回り}をstocksの順に選ぶ
+    - joint_samplerに含まれる銘柄は同じ期間の利回りを一緒に選ぶ(相関を保つ)
+    - それ以外の銘柄はsamplersで銘柄ごとに独立に選ぶ
+    - sampling: "random"以外の場合はdraw_uniformsの一様乱数を累積分布の逆関数(ppf)で利回りにする
+      (sizeの指定が必要。groupsはstratifiedのグループ数)
+    joint_samplerがNoneでsampling="random"の場合の乱数の使い方は銘柄ごとにsampler.sampleを呼ぶ場合と同じ
+    """
+
+    def draw(sampler):
+        if sampling == "random":
+            return sampler.sample(size, rng)
+        return sampler.ppf(draw_uniforms(size, rng, sampling, groups))
+
+    rates = {}
+    if joint_sampler is not None and joint_sampler.stock_names:
+        rates.update(draw(joint_sampler))
+    for k in stocks:
+        if k not in rates:
+            rates[k] = draw(samplers[k])
+    return {k: rates[k] for k in stocks}
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def get_peak_rss_bytes():
+    """
+    このプロセスの最大常駐メモリ(RSS)。取得できない環境ではNone
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+class StageTimer:
+    """
+    処理の段階(read_plan, simulateなど)ごとに実時間・CPU時間・ピークメモリを記録する
+    - 同じ名前の段階を複数回計測した場合は時間を足し合わせ、ピークメモリは最大値にする
+    - cpu_secondsはこのプロセスのCPU時間、child_cpu_secondsは終了した子プロセス(並列計算・描画)のCPU時間
+    - peak_rss_bytesは段階の終了時点までのプロセスの最大常駐メモリ(段階ごとの増加が分かる)
+    - trace_memory: Trueの場合、peak_memory_bytesに段階の中で新たに確保したメモリ
+      (tracemalloc、numpyの配列を含む)のピークを記録する。Pythonのループが多い処理は数倍遅くなる
+    - 子プロセスのメモリは含まない
+    - 段階は入れ子にしない(ピークメモリ・プロファイルの区間が正しくなくなるため)
+    - profile: Trueの場合、全ての段階をcProfileでプロファイルする(save_profileで保存)
+    """
+
+    def __init__(self, trace_memory: bool = False, profile: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.profiler = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def stage(self, name: str):
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        times = os.times()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        child_cpu_start = times.children_user + times.children_system
+        if self.profiler is not None:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
+            times = os.times()
+            record = self.stages.setdefault(
+                name, {
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "child_cpu_seconds": 0.0,
+                    "peak_rss_bytes": None,
+                    "calls": 0
+                })
+            record["wall_seconds"] += time.perf_counter() - wall_start
+            record["cpu_seconds"] += time.process_time() - cpu_start
+            record["child_cpu_seconds"] += (times.children_user +
+                                            times.children_system -
+                                            child_cpu_start)
+            record["peak_rss_bytes"] = get_peak_rss_bytes()
+            record["calls"] += 1
+            if self.trace_memory:
+                record["peak_memory_bytes"] = max(
+                    record.get("peak_memory_bytes", 0),
+                    tracemalloc.get_traced_memory()[1])
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def to_dict(self) -> dict:
+        return {
+            "total_wall_seconds":
+            sum(record["wall_seconds"] for record in self.stages.values()),
+            "stages": [{
+                "name": name,
+                **record
+            } for name, record in self.stages.items()]
+        }
+
+    def save_profile(self, file_path_prefix, top: int = 50):
+        """
+        プロファイル結果を{file_path_prefix}.pstats(pstatsで読み込める形式)と
+        {file_path_prefix}.txt(累積時間の上位top件)に保存する
+        """
+        if self.profiler is None:
+            return
+        self.profiler.dump_stats(f"{file_path_prefix}.pstats")
+        with open(f"{file_path_prefix}.txt", "w", encoding="utf-8") as f:
+            stats = pstats.Stats(self.profiler, stream=f)
+            stats.sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,230 @@
+import numpy as np
+
+from histogram import get_histograms
+
+
+class StreamingAssetResult:
+    """
+    複数人生のシミュレーション結果を全ライフ分保持せずに集計する(ストリーミング集計)
+    ライフをブロックごとに add_block で畳み込み、メモリはnumber_of_lifeによらず一定になる。
+
+    集計内容(各年ごと)
+    - thresholds に指定した金額以上のライフ数(厳密なカウント)
+    - 最小値・最大値(厳密)
+    - 分位点・ヒストグラム用の対数バケットのスケッチ(DDSketch方式)
+
+    精度
+    - |資産額| >= min_value かつ <= max_value の範囲では、get_quantileの値は
+      順序統計量x_(floor(q*(n-1)))(numpy.quantileのmethod="lower")に対して
+      相対誤差relative_accuracy以内になる。
+      厳密計算(method="linear")との差は、これに隣接する順序統計量との差が加わる。
+    - |資産額| < min_value はすべて0として扱う(絶対誤差min_value未満)。
+    - |資産額| > max_value は最大のバケットに入る(最大値自体は厳密に保持)。
+    - thresholdsに指定していない閾値のget_achive_ratioはスケッチから推定するため、
+      閾値付近の値の分だけ誤差を持つ。
+    - スケッチはバケットの足し合わせなのでブロック・チャンクの結合順によらず同じ結果になる。
+    """
+
+    def __init__(self,
+                 years,
+                 thresholds=(0, ),
+                 relative_accuracy: float = 0.01,
+                 min_value: float = 1.0,
+                 max_value: float = 1e15):
+        """
+        years: 各行の年
+        thresholds: 厳密に達成ライフ数を数える金額のリスト
+        relative_accuracy: 分位点の相対誤差
+        min_value: これより絶対値が小さい資産額は0とみなす
+        max_value: これより絶対値が大きい資産額は最大のバケットに入れる
+        """
+        self.years = np.asarray(years)
+        self.thresholds = [float(x) for x in thresholds]
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.key_offset = int(np.ceil(np.log(min_value) / self.log_gamma))
+        # 正(負)の値のバケット数
+        self.n_keys = int(np.ceil(
+            np.log(max_value) / self.log_gamma)) - self.key_offset + 1
+        # [負のバケット(値の小さい順), 0のバケット, 正のバケット(値の小さい順)]
+        self.n_buckets = 2 * self.n_keys + 1
+
+        n_years = len(self.years)
+        self.number_of_life = 0
+        self.bucket_counts = np.zeros((n_years, self.n_buckets), dtype=np.int64)
+        self.threshold_counts = np.zeros((len(self.thresholds), n_years),
+                                         dtype=np.int64)
+        self.min_values = np.full(n_years, np.inf)
+        self.max_values = np.full(n_years, -np.inf)
+
+    def _get_keys(self, abs_values):
+        keys = np.ceil(np.log(abs_values) / self.log_gamma) - self.key_offset
+        return np.clip(keys, 0, self.n_keys - 1).astype(np.int64)
+
+    def _get_bucket_idx(self, values):
+        """
+        資産額を値の小さい順に並んだバケットのidxに変換する
+        """
+        abs_values = np.abs(values)
+        is_zero = abs_values < self.min_value
+        keys = self._get_keys(np.where(is_zero, self.min_value, abs_values))
+        return np.where(is_zero, self.n_keys,
+                        np.where(values > 0, self.n_keys + 1 + keys,
+                                 self.n_keys - 1 - keys))
+
+    def _get_bucket_values(self):
+        """
+        各バケットの代表値(バケット内の値に対して相対誤差relative_accuracy以内)
+        """
+        keys = np.arange(self.n_keys) + self.key_offset
+        pos_values = 2 * self.gamma**keys / (self.gamma + 1)
+        return np.concatenate([-pos_values[::-1], [0.0], pos_values])
+
+    def add_block(self, total_assets):
+        """
+        (年数, ブロック内ライフ数)の総資産配列を集計に加える
+        """
+        total_assets = np.asarray(total_assets, dtype=np.float64)
+        n_years, n_lives = total_assets.shape
+        self.number_of_life += n_lives
+
+        for i, threshold in enumerate(self.thresholds):
+            self.threshold_counts[i] += (total_assets >= threshold).sum(axis=1)
+        self.min_values = np.minimum(self.min_values, total_assets.min(axis=1))
+        self.max_values = np.maximum(self.max_values, total_assets.max(axis=1))
+
+        # 年ごとのバケットを一次元にして一度に数える
+        bucket_idx = self._get_bucket_idx(total_assets)
+        flat_idx = bucket_idx + (np.arange(n_years) *
+                                 self.n_buckets)[:, np.newaxis]
+        self.bucket_counts += np.bincount(
+            flat_idx.ravel(), minlength=n_years * self.n_buckets).reshape(
+                n_years, self.n_buckets)
+
+    def merge(self, other):
+        """
+        同じ設定で集計した別の結果を足し合わせる(並列計算のチャンク結合用)
+        """
+        if (other.thresholds != self.thresholds
+                or other.n_buckets != self.n_buckets):
+            raise ValueError("集計設定が異なる結果は結合できません")
+        self.number_of_life += other.number_of_life
+        self.bucket_counts += other.bucket_counts
+        self.threshold_counts += other.threshold_counts
+        self.min_values = np.minimum(self.min_values, other.min_values)
+        self.max_values = np.maximum(self.max_values, other.max_values)
+        return self
+
+    @classmethod
+    def merge_all(cls, results):
+        merged = results[0]
+        for result in results[1:]:
+            merged = merged.merge(result)
+        return merged
+
+    def save(self, file_path):
+        """
+        集計結果を.npzで保存する
+        """
+        np.savez(file_path,
+                 years=self.years,
+                 thresholds=np.asarray(self.thresholds),
+                 relative_accuracy=self.relative_accuracy,
+                 min_value=self.min_value,
+                 max_value=self.max_value,
+                 number_of_life=self.number_of_life,
+                 bucket_counts=self.bucket_counts,
+                 threshold_counts=self.threshold_counts,
+                 min_values=self.min_values,
+                 max_values=self.max_values)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        saveで保存した集計結果を読み込む
+        """
+        with np.load(file_path) as data:
+            stream = cls(data["years"],
+                         thresholds=data["thresholds"].tolist(),
+                         relative_accuracy=float(data["relative_accuracy"]),
+                         min_value=float(data["min_value"]),
+                         max_value=float(data["max_value"]))
+            stream.number_of_life = int(data["number_of_life"])
+            stream.bucket_counts = data["bucket_counts"]
+            stream.threshold_counts = data["threshold_counts"]
+            stream.min_values = data["min_values"]
+            stream.max_values = data["max_values"]
+        return stream
+
+    def has_year(self, year) -> bool:
+        return year in self.years
+
+    def _year_idx(self, year) -> int:
+        return int(np.flatnonzero(self.years == year)[0])
+
+    def get_achive_ratio(self, asset_threshold, field: str = "total"):
+        """
+        各年でasset_thresholdを超えるライフの割合を返す
+        (thresholdsに指定した金額は厳密、それ以外はスケッチからの推定)
+        """
+        if field != "total":
+            raise ValueError("ストリーミング集計はtotalのみ保持しています")
+        if float(asset_threshold) in self.thresholds:
+            i = self.thresholds.index(float(asset_threshold))
+            achievement_counts = self.threshold_counts[i]
+        else:
+            is_over = self._get_bucket_values() >= asset_threshold
+            achievement_counts = self.bucket_counts[:, is_over].sum(axis=1)
+        return achievement_counts / self.number_of_life
+
+    def get_quantile(self, q, field: str = "total"):
+        """
+        各年のq分位点(numpyのlinear補間の順位に対応するバケットの代表値)を返す
+        """
+        if field != "total":
+            raise ValueError("ストリーミング集計はtotalのみ保持しています")
+        rank = q * (self.number_of_life - 1)
+        cumsum = np.cumsum(self.bucket_counts, axis=1)
+        bucket_idx = (cumsum <= np.floor(rank)).sum(axis=1)
+        quantile = self._get_bucket_values()[bucket_idx]
+        # 最小値・最大値は厳密に保持しているので範囲内に収める
+        return np.clip(quantile, self.min_values, self.max_values)
+
+    def get_histogram(self, year, bins: int = 20):
+        """
+        指定した年の資産額のヒストグラム(counts, bin_edges)をスケッチから作成する
+        """
+        year_idx = self._year_idx(year)
+        bucket_values = np.clip(self._get_bucket_values(),
+                                self.min_values[year_idx],
+                                self.max_values[year_idx])
+        return np.histogram(bucket_values,
+                            bins=bins,
+                            range=(self.min_values[year_idx],
+                                   self.max_values[year_idx]),
+                            weights=self.bucket_counts[year_idx])
+
+    def get_histograms(self,
+                       years,
+                       bins: int = 20,
+                       log_bins: bool = False,
+                       kde: bool = False,
+                       field: str = "total"):
+        """
+        指定した全ての年のヒストグラム{年: histogram.get_histogramsの結果}をスケッチから作成する
+        """
+        if field != "total":
+            raise ValueError("ストリーミング集計はtotalのみ保持しています")
+        year_idx = [self._year_idx(year) for year in years]
+        bucket_values = np.clip(self._get_bucket_values()[None, :],
+                                self.min_values[year_idx][:, None],
+                                self.max_values[year_idx][:, None])
+        histograms = get_histograms(bucket_values,
+                                    bins=bins,
+                                    log_bins=log_bins,
+                                    kde=kde,
+                                    weights=self.bucket_counts[year_idx])
+        return dict(zip(years, histograms))
@@ -1,4 +1,5 @@
 import json
+import hashlib
 from pathlib import Path
 
 
@@ -35,6 +36,34 @@ def read_json_as_dict(file_path: str) -> dict:
         return json.load(f)
 
 
+def update_file_hash(h, file_path: str):
+    """
+    ファイルの中身をハッシュに追加する(大きなファイルも一定のメモリで読むよう1MBずつ読む)。
+
+    Args:
+        h: hashlibのハッシュオブジェクト
+        file_path (str): ファイルのパス
+    Returns:
+        h: 中身を追加したハッシュオブジェクト
+    """
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h
+
+
+def get_file_hash(file_path: str) -> str:
+    """
+    ファイルの中身のsha256を返す。
+
+    Args:
+        file_path (str): ファイルのパス
+    Returns:
+        str: sha256(16進数の文字列)
+    """
+    return update_file_hash(hashlib.sha256(), file_path).hexdigest()
+
+
 class Base_class:
 
     def __init__(self, js_in):
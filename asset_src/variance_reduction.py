@@ -0,0 +1,92 @@
+from statistics import NormalDist
+import numpy as np
+
+from return_sampler import get_group_sizes
+
+
+def get_sampling_units(sampling: str, chunk_sizes, groups: int = 1):
+    """
+    各ライフが属する独立な単位のid(推定値の分散は単位ごとの平均から計算する)
+    - random: 1ライフ
+    - antithetic: 対になる2ライフ(ライフ数が奇数の場合、最後の1ライフは単独)
+    - stratified: ラテン超方格を作ったグループ
+    chunk_sizes: 乱数を引いた単位(並列計算のチャンクなど)のライフ数のリスト
+        (draw_uniformsはチャンクごとに呼ばれるため、単位はチャンクをまたがない)
+    """
+    units = []
+    offset = 0
+    for size in chunk_sizes:
+        if size == 0:
+            continue
+        if sampling == "antithetic":
+            half = (size + 1) // 2
+            local = np.concatenate([np.arange(half), np.arange(size - half)])
+        elif sampling == "stratified":
+            group_sizes = get_group_sizes(size, groups)
+            local = np.repeat(np.arange(len(group_sizes)), group_sizes)
+        else:
+            local = np.arange(size)
+        units.append(local + offset)
+        offset += int(local.max()) + 1
+    return np.concatenate(units)
+
+
+def get_expected_rate_path(plan, samplers: dict, joint_sampler=None):
+    """
+    各年の投資比率で重み付けした利回りの期待値(利回り分布から解析的に計算する)
+    - plan: CompiledPlan
+    """
+    means = {k: float(s.rate @ s.share) for k, s in samplers.items()}
+    if joint_sampler is not None:
+        share = joint_sampler.row_sampler.share
+        for j, k in enumerate(joint_sampler.stock_names):
+            means[k] = float(share @ joint_sampler.rate_table[:, j])
+    return plan.weights @ np.array([means[k] for k in plan.stocks])
+
+
+def estimate_mean(values, units, control=None, control_mean: float = None):
+    """
+    ライフごとの値valuesの平均の(推定値, 標準誤差, 有効サンプルサイズ)を返す
+    - units: 各ライフの独立な単位のid(get_sampling_units)。分散は単位ごとの平均から推定する
+    - control, control_mean: 制御変量(ライフごとの値と、その解析的な期待値)。
+      指定した場合は 平均 - beta * (controlの平均 - control_mean) を推定値にする
+      (betaは単位ごとの平均の回帰係数)
+    - 有効サンプルサイズ: 独立に引いた場合に同じ標準誤差になるライフ数
+      (1ライフの分散 / 推定値の分散)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    counts = np.bincount(units).astype(np.float64)
+    n_units = len(counts)
+    y = np.bincount(units, weights=values) / counts
+    estimate = values.mean()
+    z = y
+    if control is not None:
+        control = np.asarray(control, dtype=np.float64)
+        x = np.bincount(units, weights=control) / counts
+        x_centered = x - control.mean()
+        var_x = np.sum(counts**2 * x_centered**2)
+        beta = np.sum(counts**2 * x_centered *
+                      (y - estimate)) / var_x if var_x > 0 else 0.0
+        estimate = estimate - beta * (control.mean() - control_mean)
+        z = y - beta * x
+    z_centered = z - np.sum(counts * z) / n
+    variance = np.sum(counts**2 * z_centered**2) / n**2 * n_units / max(
+        n_units - 1, 1)
+    life_variance = values.var(ddof=1) if n > 1 else 0.0
+    effective_sample_size = life_variance / variance if variance > 0 else float(
+        n)
+    return float(estimate), float(np.sqrt(variance)), float(
+        effective_sample_size)
+
+
+def get_wilson_interval(count, n, confidence: float = 0.95):
+    """
+    二項分布の割合count / nのWilsonスコア信頼区間(下限, 上限)を返す(countは配列でもよい)
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = np.asarray(count, dtype=np.float64) / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half_width = z / (1 + z**2 / n) * np.sqrt(p * (1 - p) / n + z**2 /
+                                              (4 * n**2))
+    return center - half_width, center + half_width
@@ -0,0 +1,292 @@
+import types
+import numpy as np
+
+from return_sampler import draw_uniforms
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# numbaがインストールされている場合はライフ×年のループをコンパイルして実行する
+HAS_NUMBA = numba is not None
+# 年の計算に使うカーネル(get_year_kernelを参照)
+YEAR_KERNELS = ("auto", "numba", "numpy", "python")
+
+
+def _jit(**options):
+    """
+    numbaがあればnumba.njitでコンパイルし、なければPythonの関数のまま返すデコレータ
+    """
+
+    def decorator(func):
+        if numba is None:
+            return func
+        return numba.njit(cache=True, **options)(func)
+
+    return decorator
+
+
+prange = numba.prange if numba is not None else range
+
+
+def update_assets_one_year_vector(cash, invest, cost, income, saving_per_year,
+                                  invest_per_year, rate):
+    """
+    AssetSim.update_assets_one_yearの配列版。
+    全人生分のcash, investを一年進め、(cash, invest, total, profit)を返す。
+    - cost: インフレ補正済みの支出
+    - rate: 各人生のその年の利益率
+    """
+    # cashが尽きたらinvestを取り崩し(不足分はcashのマイナスとして残す)
+    invest_asset_tmp = invest + cash
+    crash_mask = cash <= 0
+    cash = np.where(crash_mask, np.minimum(invest_asset_tmp, 0), cash)
+    invest = np.where(crash_mask, np.maximum(invest_asset_tmp, 0), invest)
+
+    # 投資の年利を反映
+    profit = invest * rate
+    invest = invest + profit
+
+    # 収入と支出の差分
+    raw_profit = income - cost
+
+    # 運用・貯金
+    # 残金の貯金(赤字も貯金方式) / 満額貯金・余剰投資 / 満額貯金・満額投資・余剰金の貯金
+    over_saving = raw_profit > saving_per_year
+    over_invest = raw_profit > invest_per_year + saving_per_year
+    cash_add = np.where(
+        over_invest, raw_profit - invest_per_year,
+        np.where(over_saving, saving_per_year, raw_profit))
+    invest_add = np.where(
+        over_invest, invest_per_year,
+        np.where(over_saving, raw_profit - saving_per_year, 0))
+    cash = cash + cash_add
+    invest = invest + invest_add
+
+    # その年の資産額を返す
+    total = cash + invest
+    return cash, invest, total, profit
+
+
+class RateTables:
+    """
+    一年の利回りを一様乱数から選ぶための表(sample_ratesと同じ選び方をカーネルで行う)
+    - 一様乱数を1つずつ使う「引き元」をsample_ratesと同じ順に並べる
+      (joint_samplerがあれば最初に1つ、残りの銘柄は銘柄ごとに1つ)
+    - 各引き元の行数n_rows、エイリアステーブル(alias_prob, alias_idx)、
+      累積分布(cdf_order, cdf)、利回りの表rate_table(引き元, 行, 銘柄)を行数を揃えて持つ
+    - source_of_stock: 各銘柄(stocksの順)の利回りを選ぶ引き元のidx
+    """
+
+    def __init__(self, stocks, samplers: dict, joint_sampler=None):
+        self.stocks = list(stocks)
+        sources = []
+        if joint_sampler is not None and joint_sampler.stock_names:
+            sources.append((joint_sampler.row_sampler, joint_sampler.get_cdf(),
+                            joint_sampler.rate_table,
+                            joint_sampler.stock_names))
+        for k in self.stocks:
+            if not any(k in names for *_, names in sources):
+                sampler = samplers[k]
+                sources.append((sampler, sampler.get_cdf(),
+                                sampler.rate[:, None], [k]))
+
+        n_sources = len(sources)
+        max_rows = max(len(sampler) for sampler, *_ in sources)
+        self.n_rows = np.array([len(sampler) for sampler, *_ in sources],
+                               dtype=np.int64)
+        self.alias_prob = np.ones((n_sources, max_rows))
+        self.alias_idx = np.zeros((n_sources, max_rows), dtype=np.int64)
+        self.cdf_order = np.zeros((n_sources, max_rows), dtype=np.int64)
+        self.cdf = np.full((n_sources, max_rows), np.inf)
+        self.rate_table = np.zeros((n_sources, max_rows, len(self.stocks)))
+        self.source_of_stock = np.zeros(len(self.stocks), dtype=np.int64)
+        for s, (sampler, (order, cdf), rate_table,
+                names) in enumerate(sources):
+            n_rows = len(sampler)
+            self.alias_prob[s, :n_rows] = sampler.alias_prob
+            self.alias_idx[s, :n_rows] = sampler.alias_idx
+            self.cdf_order[s, :n_rows] = order
+            self.cdf[s, :n_rows] = cdf
+            for j, k in enumerate(names):
+                if k in self.stocks:
+                    self.rate_table[s, :n_rows,
+                                    self.stocks.index(k)] = rate_table[:, j]
+                    self.source_of_stock[self.stocks.index(k)] = s
+
+    @property
+    def n_sources(self):
+        return len(self.n_rows)
+
+    def get_rows_vector(self, uniforms, use_cdf: bool):
+        """
+        (引き元, ライフ数)の一様乱数を各引き元の行idxに変換する(ReturnSamplerと同じ計算)
+        """
+        rows = np.empty(uniforms.shape, dtype=np.int64)
+        for s, n_rows in enumerate(self.n_rows):
+            u = uniforms[s]
+            if use_cdf:
+                cdf = self.cdf[s, :n_rows]
+                idx = np.searchsorted(cdf, u * cdf[-1], side="right")
+                rows[s] = self.cdf_order[s][np.minimum(idx, n_rows - 1)]
+            else:
+                u = u * n_rows
+                column = np.minimum(np.asarray(u, dtype=np.int64), n_rows - 1)
+                accept = (u - column) < self.alias_prob[s][column]
+                rows[s] = np.where(accept, column, self.alias_idx[s][column])
+        return rows
+
+
+def draw_year_uniforms(n_sources: int, n: int, rng=np.random,
+                       sampling: str = "random", groups: int = 1):
+    """
+    一年分の(引き元の数, n)の一様乱数を引く(sample_ratesが引き元ごとに引くのと同じ順・同じ値)
+    """
+    return np.stack([
+        draw_uniforms(n, rng, sampling, groups) for _ in range(n_sources)
+    ])
+
+
+@_jit()
+def _draw_row(s, u, use_cdf, n_rows, alias_prob, alias_idx, cdf_order, cdf):
+    """
+    一様乱数uを引き元sの行idxに変換する(ReturnSampler.sample_indices, ppf_indicesと同じ計算)
+    """
+    n = n_rows[s]
+    if use_cdf:
+        # np.searchsorted(side="right")と同じ二分探索
+        x = u * cdf[s, n - 1]
+        lo = 0
+        hi = n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cdf[s, mid] <= x:
+                lo = mid + 1
+            else:
+                hi = mid
+        return cdf_order[s, min(lo, n - 1)]
+    x = u * n
+    column = min(int(x), n - 1)
+    if x - column < alias_prob[s, column]:
+        return column
+    return alias_idx[s, column]
+
+
+@_jit(parallel=True)
+def _run_years_compiled(cash, invest, uniforms, use_cdf, n_rows, alias_prob,
+                        alias_idx, cdf_order, cdf, rate_table, source_of_stock,
+                        weights, cost, income, saving_per_year, invest_per_year,
+                        out_cash, out_invest, out_total, out_profit, out_rate):
+    """
+    ライフ×年のループを1ライフ・1年ずつ計算する(numbaがあればコンパイルする)
+    利回りの選択とupdate_assets_one_year_vectorと同じ計算を行い、cash, investを更新する
+    """
+    n_years = uniforms.shape[0]
+    n = uniforms.shape[2]
+    n_stocks = weights.shape[1]
+    for t in range(n_years):
+        raw_profit = income[t] - cost[t]
+        for i in prange(n):
+            c = cash[i]
+            v = invest[i]
+            # cashが尽きたらinvestを取り崩し(不足分はcashのマイナスとして残す)
+            if c <= 0:
+                tmp = v + c
+                c = min(tmp, 0.0)
+                v = max(tmp, 0.0)
+
+            # 銘柄の利回りを選び、投資比率で重み付けした利回り
+            rate = 0.0
+            for k in range(n_stocks):
+                s = source_of_stock[k]
+                row = _draw_row(s, uniforms[t, s, i], use_cdf, n_rows,
+                                alias_prob, alias_idx, cdf_order, cdf)
+                rate += rate_table[s, row, k] * weights[t, k]
+
+            # 投資の年利を反映
+            profit = v * rate
+            v = v + profit
+
+            # 運用・貯金
+            if raw_profit > invest_per_year[t] + saving_per_year[t]:
+                c = c + (raw_profit - invest_per_year[t])
+                v = v + invest_per_year[t]
+            elif raw_profit > saving_per_year[t]:
+                c = c + saving_per_year[t]
+                v = v + (raw_profit - saving_per_year[t])
+            else:
+                c = c + raw_profit
+
+            cash[i] = c
+            invest[i] = v
+            out_cash[t, i] = c
+            out_invest[t, i] = v
+            out_total[t, i] = c + v
+            out_profit[t, i] = profit
+            out_rate[t, i] = rate
+
+
+def _run_years_numpy(cash, invest, uniforms, use_cdf, tables: RateTables,
+                     weights, cost, income, saving_per_year, invest_per_year,
+                     out_cash, out_invest, out_total, out_profit, out_rate):
+    """
+    _run_years_compiledと同じ計算を年ごとに全ライフの配列で行う(numbaがない場合)
+    """
+    for t in range(uniforms.shape[0]):
+        rows = tables.get_rows_vector(uniforms[t], use_cdf)
+        rate = np.zeros(uniforms.shape[2])
+        for k in range(len(tables.stocks)):
+            s = tables.source_of_stock[k]
+            rate += tables.rate_table[s, rows[s], k] * weights[t, k]
+        cash[:], invest[:], out_total[t], out_profit[t] = \
+            update_assets_one_year_vector(cash, invest, cost[t], income[t],
+                                          saving_per_year[t],
+                                          invest_per_year[t], rate)
+        out_cash[t] = cash
+        out_invest[t] = invest
+        out_rate[t] = rate
+
+
+def get_year_kernel(kernel: str = "auto"):
+    """
+    run_years(cash, invest, uniforms, use_cdf, tables, weights, cost, income,
+    saving_per_year, invest_per_year, out_cash, out_invest, out_total, out_profit, out_rate)を返す
+    - uniforms: (年数, 引き元の数, ライフ数)の一様乱数(RateTablesの引き元の順)
+    - use_cdf: 一様乱数を累積分布の逆関数で変換する(Falseの場合はエイリアス法)
+    - weights: (年数, 銘柄数)の投資比率、cost〜invest_per_year: (年数, )の配列(costはインフレ補正済み)
+    - cash, investは最後の年の値に更新し、各年の値をout_*((年数, ライフ数)のfloat64)に書き込む
+    kernel:
+    - auto: numbaがあればnumba、なければnumpy
+    - numba: numbaでコンパイルしたカーネル(numbaがない場合はImportError)
+    - numpy: 年ごとに全ライフを配列で計算する
+    - python: numbaでコンパイルするカーネルをPythonのまま実行する(確認用・低速)
+    """
+    if kernel not in YEAR_KERNELS:
+        raise ValueError(f"kernelが不正です: {kernel} (選択肢: {YEAR_KERNELS})")
+    if kernel == "numba" and not HAS_NUMBA:
+        raise ImportError("kernel=numbaにはnumbaのインストールが必要です")
+    if kernel == "numpy" or (kernel == "auto" and not HAS_NUMBA):
+        return _run_years_numpy
+    func = _run_years_compiled
+    if kernel == "python" and HAS_NUMBA:
+        func = _run_years_compiled.py_func
+        draw_row = _draw_row.py_func
+        func = _with_globals(func, _draw_row=draw_row, prange=range)
+
+    def run_years(cash, invest, uniforms, use_cdf, tables: RateTables, *args):
+        func(cash, invest, uniforms, use_cdf, tables.n_rows, tables.alias_prob,
+             tables.alias_idx, tables.cdf_order, tables.cdf,
+             tables.rate_table, tables.source_of_stock, *args)
+
+    return run_years
+
+
+def _with_globals(func, **replace):
+    """
+    funcのグローバル変数の一部を置き換えた関数を返す
+    """
+    return types.FunctionType(func.__code__, {
+        **func.__globals__,
+        **replace
+    }, func.__name__, func.__defaults__, func.__closure__)
@@ -1,12 +1,7 @@
-import os, sys, glob
+import os, sys, argparse
 
 sys.path.append(f"{os.path.dirname(__file__)}/asset_src")
 
-import numpy as np
-import pandas as pd
-from IPython.display import display
-import plotly.graph_objects as go
-
 from asset_src.asset_simulator import AssetSimulator
 from asset_src.tbase_for_asset import save_dict_as_json, read_json_as_dict
 
@@ -36,6 +31,7 @@ def make_js_in():
         "inflation_rate": 1.02,
         "multi_life_mode": True,
         "number_of_life": 1000,
+        "engine": "vector",
         "check_years": [2026, 2030, 2040, 2050, 2060, 2070, 2080, 2090],
         "asset_threshold": 50000000,
         "achieve_percents": [70, 80, 90, 95, 99]
@@ -44,22 +40,35 @@ def make_js_in():
     save_dict_as_json(cond, js_in)
 
 
-def main():
+def main(no_plots: bool = False):
+    """
+    no_plots: Trueの場合は描画せず(plotly/matplotlibを読み込まない)、数値(csv/json)だけを出力する
+    (condition.jsonのplotをfalseにした場合と同じ)
+    """
     maindir = get_exe_dir()
     js_in = f"{maindir}/condition.json"
     cond = read_json_as_dict(js_in)
     os.makedirs(cond["output_dir"], exist_ok=True)
     AS = AssetSimulator(js_in)
-    AS.check_plan()
+    if no_plots:
+        AS.plot = False
+    # condition.jsonのplotがfalseの場合もcheck_planを描画しない
+    if AS.plot:
+        AS.check_plan()
     AS.cal_asset()
+    return AS
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-plots",
+                        action="store_true",
+                        help="描画せず数値(summary.jsonなど)だけを出力する")
+    args = parser.parse_args()
+
     maindir = get_exe_dir()
     print(f"{maindir=}")
     js_in = f"{maindir}/condition.json"
-    if os.path.exists(js_in):
-        main()
-    else:
+    if not os.path.exists(js_in):
         make_js_in()
-        main()
+    main(args.no_plots)
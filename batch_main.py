@@ -0,0 +1,34 @@
+import os, sys, argparse
+
+sys.path.append(f"{os.path.dirname(__file__)}/asset_src")
+
+from asset_src.batch_runner import BatchRunner
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="複数シナリオ(condition.json/asset_plan.csv)をまとめて計算する")
+    parser.add_argument("scenarios_in",
+                        help="シナリオのサブディレクトリを含むディレクトリ、またはマニフェスト(json)")
+    parser.add_argument("--output_dir",
+                        default=None,
+                        help="出力先(省略時はscenarios_inと同じ場所のbatch_result)")
+    parser.add_argument("--workers",
+                        type=int,
+                        default=1,
+                        help="シナリオを並列に計算するプロセス数")
+    parser.add_argument("--no-plots",
+                        action="store_true",
+                        help="描画せず数値(summary.csvなど)だけを出力する")
+    args = parser.parse_args()
+
+    BR = BatchRunner(args.scenarios_in,
+                     output_dir=args.output_dir,
+                     workers=args.workers,
+                     plot=not args.no_plots)
+    summary_df = BR.run()
+    print(summary_df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+性能計測用のスクリプト(python benchmarks/run_benchmarks.pyなど)
+"""
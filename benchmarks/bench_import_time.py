@@ -0,0 +1,78 @@
+"""
+モジュールのimport時間(コールドスタート)のベンチマーク
+
+新しいPythonプロセスでモジュールをimportする時間を計測し、
+描画ライブラリ(plotly/matplotlib)やIPythonがimport時に読み込まれていないか確認する。
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --repeat 10 --max-seconds 1.0
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ASSET_SRC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "asset_src")
+MODULES = ["asset_simulator", "assetsim", "batch_runner", "return_database"]
+# import時に読み込まれてはいけないモジュール
+LAZY_MODULES = ["plotly", "matplotlib", "IPython", "tqdm"]
+
+_MEASURE_CODE = """
+import sys, time, json
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(json.dumps({{"seconds": elapsed,
+                   "loaded": [m for m in {lazy_modules!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import_time(module: str, repeat: int = 5):
+    """
+    新しいプロセスでmoduleをrepeat回importし、(最小の秒数, 読み込まれた遅延対象モジュール)を返す
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ASSET_SRC_DIR, env.get("PYTHONPATH", "")])
+    seconds = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [
+                sys.executable, "-c",
+                _MEASURE_CODE.format(module=module, lazy_modules=LAZY_MODULES)
+            ],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        loaded = result["loaded"]
+    return min(seconds), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モジュールのimport時間を計測する")
+    parser.add_argument("--repeat", type=int, default=5, help="各モジュールの計測回数")
+    parser.add_argument("--max-seconds",
+                        type=float,
+                        default=None,
+                        help="これを超えるモジュールがあれば終了コード1にする")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<20}{'seconds':>10}  lazy modules loaded")
+    for module in MODULES:
+        seconds, loaded = measure_import_time(module, args.repeat)
+        print(f"{module:<20}{seconds:>10.3f}  {loaded or '-'}")
+        if loaded or (args.max_seconds is not None
+                      and seconds > args.max_seconds):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+分散低減(sampling, control_variate)のベンチマーク
+
+各方法で同じライフ数の計算をreplicates回繰り返し、指定した年の破産率(get_crash_ratio)の
+標準誤差(繰り返しの間のばらつき)から、目標の標準誤差に必要なライフ数を推定する。
+
+    python benchmarks/bench_variance_reduction.py
+    python benchmarks/bench_variance_reduction.py --lives 4000 --replicates 50 --target-se 0.001
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "asset_src"))
+
+from asset_simulator import read_database_csv
+from assetsim import AssetSim
+from input_generator import InputGenerator
+from random_generator import make_rng
+
+# (sampling, control_variate)
+MODES = [("random", False), ("random", True), ("antithetic", False),
+         ("antithetic", True), ("stratified", False), ("stratified", True)]
+
+
+def get_as_cond(asset_plan_in, database_dir, initial_year, initial_cash,
+                inflation_rate):
+    _, asset_plan, _, invest_plan = InputGenerator().get_asset_plan(
+        asset_plan_in)
+    stock_list = list(next(iter(invest_plan.values())))
+    return {
+        "return_distribution_dict": {
+            k: read_database_csv(f"{database_dir}/{k}.csv")
+            for k in stock_list
+        },
+        "invest_plan": invest_plan,
+        "asset_plan": asset_plan,
+        "initial_year": initial_year,
+        "initial_cash": initial_cash,
+        "initial_invest_asset": 0,
+        "inflation_rate": inflation_rate
+    }
+
+
+def run_replicates(AS_cond, sampling, control_variate, lives, replicates,
+                   year, seed):
+    """
+    replicates回計算し、yearの(破産率の推定値, 推定した標準誤差, 有効サンプルサイズ)の配列を返す
+    """
+    estimates = []
+    for seed_sequence in np.random.SeedSequence(seed).spawn(replicates):
+        AS = AssetSim(**AS_cond, rng=make_rng(seed_sequence),
+                      sampling=sampling)
+        AS.get_multi_role_play_assets(lives, engine="vector")
+        estimate_df = AS.get_crash_ratio_estimate(
+            control_variate=control_variate).set_index("year")
+        estimates.append(estimate_df.loc[year].to_numpy())
+    return np.array(estimates)
+
+
+def find_year(AS_cond, target_ratio, lives, seed):
+    """
+    破産率がtarget_ratioに最も近い年
+    """
+    AS = AssetSim(**AS_cond, rng=make_rng(seed))
+    AS.get_multi_role_play_assets(lives, engine="vector")
+    crash_ratio_df = AS.get_crash_ratio()
+    i = int(np.argmin(np.abs(crash_ratio_df["crash_ratio"] - target_ratio)))
+    return int(crash_ratio_df["year"].iloc[i])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分散低減の効果を計測する")
+    parser.add_argument("--asset-plan",
+                        default=os.path.join(ROOT_DIR, "asset_plan.csv"))
+    parser.add_argument("--database",
+                        default=os.path.join(ROOT_DIR, "database"))
+    parser.add_argument("--initial-year", type=int, default=2025)
+    parser.add_argument("--initial-cash", type=float, default=2500000)
+    parser.add_argument("--inflation-rate", type=float, default=1.02)
+    parser.add_argument("--lives", type=int, default=2000, help="1回の計算のライフ数")
+    parser.add_argument("--replicates", type=int, default=30, help="繰り返し回数")
+    parser.add_argument("--year",
+                        type=int,
+                        default=None,
+                        help="破産率を評価する年(省略時は破産率がtarget-ratioに最も近い年)")
+    parser.add_argument("--target-ratio", type=float, default=0.01)
+    parser.add_argument("--target-se",
+                        type=float,
+                        default=0.001,
+                        help="必要なライフ数を求める破産率の標準誤差")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    AS_cond = get_as_cond(args.asset_plan, args.database, args.initial_year,
+                          args.initial_cash, args.inflation_rate)
+    year = args.year or find_year(AS_cond, args.target_ratio, 20000,
+                                  args.seed)
+    print(f"year: {year}, lives: {args.lives}, replicates: {args.replicates}")
+    print(f"{'sampling':<12}{'cv':<7}{'crash_ratio':>12}{'se':>10}"
+          f"{'est. se':>10}{'ESS':>10}{'lives for se':>14}")
+    for sampling, control_variate in MODES:
+        estimates = run_replicates(AS_cond, sampling, control_variate,
+                                   args.lives, args.replicates, year,
+                                   args.seed + 1)
+        crash_ratio = estimates[:, 0].mean()
+        standard_error = estimates[:, 0].std(ddof=1)
+        lives_needed = args.lives * (standard_error / args.target_se)**2
+        print(f"{sampling:<12}{str(control_variate):<7}{crash_ratio:>12.4f}"
+              f"{standard_error:>10.5f}{estimates[:, 1].mean():>10.5f}"
+              f"{estimates[:, 2].mean():>10.0f}{lives_needed:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+histogram.get_histogramsのビンの数え方がnp.histogramと一致するか確認する
+
+乱数で作った資産額の行(ビンの境界ちょうどの値や全て同じ値の行を含む)について、
+- bin_edges, countsがnp.histogram(各行の最小値〜最大値)と完全に一致するか
+- log_binsの場合は0より大きい値のlog10のnp.histogramと一致し、non_positiveが0以下の値の数と一致するか
+- weightsを指定した場合はnp.histogram(weights=...)と一致するか
+をビン数ごとに確認し、一致しない場合は終了コード1にする。
+
+    python benchmarks/check_histogram.py
+    python benchmarks/check_histogram.py --trials 1000
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "asset_src"))
+
+from histogram import get_histograms
+
+BINS = (7, 20, 50, 256)
+
+
+def make_rows(rng, n_rows: int, n_values: int):
+    """
+    (n_rows, n_values)の資産額の行
+    (正規分布・対数正規分布・ビンの境界ちょうどの値・全て同じ値の行を混ぜる)
+    """
+    rows = []
+    for i in range(n_rows):
+        kind = i % 4
+        if kind == 0:
+            row = rng.normal(rng.normal(0, 1e7), 10**rng.uniform(3, 8),
+                             n_values)
+        elif kind == 1:
+            row = rng.lognormal(rng.uniform(10, 18), rng.uniform(0.1, 2),
+                                n_values)
+        elif kind == 2:
+            # 範囲をきりの悪い数で等分した境界の値(丸め誤差で隣のビンに入りやすい)
+            lo, width = rng.uniform(-1e7, 1e7), rng.uniform(0.1, 1e8)
+            row = lo + width * rng.integers(0, 101, n_values) / 100
+        else:
+            row = np.full(n_values, rng.normal(0, 1e7))
+        rows.append(row)
+    return np.array(rows)
+
+
+def is_same_histogram(histogram, values, weights, log_bins, bins):
+    if log_bins:
+        is_positive = values > 0
+        if not np.any(is_positive):
+            return True
+        counts, edges = np.histogram(
+            np.log10(values[is_positive]),
+            bins=bins,
+            weights=None if weights is None else weights[is_positive])
+        non_positive = (np.count_nonzero(~is_positive) if weights is None
+                        else weights[~is_positive].sum())
+        return (np.array_equal(counts, histogram["counts"])
+                and np.array_equal(10**edges, histogram["bin_edges"])
+                and non_positive == histogram["non_positive"])
+    counts, edges = np.histogram(values, bins=bins, weights=weights)
+    return (np.array_equal(counts, histogram["counts"])
+            and np.array_equal(edges, histogram["bin_edges"]))
+
+
+def check(rows, bins, log_bins, weights):
+    """
+    一致しなかった行数を返す
+    """
+    histograms = get_histograms(rows,
+                                bins,
+                                log_bins=log_bins,
+                                weights=weights)
+    return sum(not is_same_histogram(
+        histogram, row, None if weights is None else weights[i], log_bins,
+        bins) for i, (histogram, row) in enumerate(zip(histograms, rows)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ヒストグラムのビンの数え方を確認する")
+    parser.add_argument("--trials", type=int, default=300)
+    parser.add_argument("--values", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rows = make_rows(rng, args.trials, args.values)
+    weights = rng.integers(1, 5, rows.shape).astype(np.float64)
+    ok = True
+    print(f"{'bins':<6}{'log_bins':<10}{'weights':<9}{'mismatch':>10}")
+    for bins in BINS:
+        for log_bins in (False, True):
+            for row_weights in (None, weights):
+                mismatch = check(rows, bins, log_bins, row_weights)
+                ok &= mismatch == 0
+                print(f"{bins:<6}{str(log_bins):<10}"
+                      f"{str(row_weights is not None):<9}"
+                      f"{f'{mismatch}/{len(rows)}':>10}")
+    print("一致しました" if ok else "一致しない結果があります")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
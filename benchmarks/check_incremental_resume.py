@@ -0,0 +1,130 @@
+"""
+途中の年からの再計算(incremental_mode)の結果が最初から計算した結果と一致するか確認する
+
+合成した計画で結果とチェックポイントをResultCacheに保存し、計画を
+- append: 後ろに年を追加
+- change: 途中の年から支出を変更
+- truncate: 後ろの年を削除
+した場合にfind_checkpointで見つけた年から再計算した結果が、同じシードで最初から計算した結果と
+完全に一致するかをengine(vector, jit)ごとに確認し、一致しない場合は終了コード1にする。
+
+    python benchmarks/check_incremental_resume.py
+"""
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "asset_src"))
+sys.path.append(BENCHMARK_DIR)
+
+from assetsim import AssetSim
+from input_generator import InputGenerator
+from random_generator import make_rng
+from result_cache import ResultCache
+import synthetic
+
+ENGINES = ("vector", "jit")
+
+
+def get_plan_cases(n_years: int):
+    """
+    {名前: (キャッシュする計画, 再計算する計画, 再開するはずの年のidx)}
+    """
+    base_df = synthetic.make_asset_plan_df(n_years, 2)
+    long_df = synthetic.make_asset_plan_df(n_years + 20, 2)
+    changed_df = base_df.copy()
+    changed_df.loc[n_years // 2:, "outcome_2"] = 300000
+    return {
+        "append": (base_df, long_df, n_years),
+        "change": (base_df, changed_df, n_years // 2),
+        "truncate": (long_df, base_df, n_years),
+    }
+
+
+def read_plan(plan_df, csv_out):
+    """
+    (AssetSimの引数, find_checkpointに渡す(年数, 列数)の計画の配列)を返す
+    (AssetSimulatorと同じく投資比率とasset_planの列を並べる)
+    """
+    plan_df.to_csv(csv_out, index=False)
+    asset_plan_df, asset_plan, invest_plan_df, invest_plan = InputGenerator(
+    ).get_asset_plan(csv_out)
+    AS_cond = {
+        "return_distribution_dict": {
+            k: synthetic.make_return_distribution(mean=5.0 + i,
+                                                  std=15.0 + 2 * i)
+            for i, k in enumerate(invest_plan_df.columns)
+        },
+        "invest_plan": invest_plan,
+        "asset_plan": asset_plan,
+        "initial_year": 2025,
+        "initial_cash": 2500000,
+        "initial_invest_asset": 0,
+        "inflation_rate": 1.02
+    }
+    plan_array = np.hstack([
+        invest_plan_df.to_numpy(dtype=np.float64),
+        asset_plan_df.to_numpy(dtype=np.float64)
+    ])
+    return AS_cond, plan_array
+
+
+def check(tmp_dir, name, base_df, new_df, expected_idx, engine, lives, seed):
+    """
+    (再開した年のidx, 最初から計算した結果と完全に一致するか)を返す
+    """
+    cache = ResultCache(f"{tmp_dir}/cache_{name}_{engine}")
+    base_cond, base_plan = read_plan(base_df, f"{tmp_dir}/base_{name}.csv")
+    AS = AssetSim(**base_cond, rng=make_rng(seed))
+    AS.get_multi_role_play_assets(lives, engine=engine)
+    cache.save("base", AS.result, {
+        "prefix_key": "prefix",
+        "plan": base_plan,
+        "rng_states": AS.rng_states
+    })
+
+    new_cond, new_plan = read_plan(new_df, f"{tmp_dir}/new_{name}.csv")
+    resume_from = cache.find_checkpoint("prefix", new_plan)
+    AS = AssetSim(**new_cond, rng=make_rng(seed))
+    AS.get_multi_role_play_assets(lives, engine=engine, resume_from=resume_from)
+    resumed = AS.result
+
+    AS = AssetSim(**new_cond, rng=make_rng(seed))
+    AS.get_multi_role_play_assets(lives, engine=engine)
+    expected = AS.result
+    is_equal = all(
+        np.array_equal(expected.planes[field], resumed.planes[field])
+        for field in expected.planes)
+    start_year_idx = None if resume_from is None else resume_from[1]
+    return start_year_idx, is_equal and start_year_idx == expected_idx
+
+
+def main():
+    parser = argparse.ArgumentParser(description="途中の年からの再計算の結果を確認する")
+    parser.add_argument("--lives", type=int, default=500)
+    parser.add_argument("--years", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'case':<10}{'engine':<8}{'resume idx':>12}{'equal':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, (base_df, new_df,
+                   expected_idx) in get_plan_cases(args.years).items():
+            for engine in ENGINES:
+                start_year_idx, is_equal = check(tmp_dir, name, base_df,
+                                                 new_df, expected_idx, engine,
+                                                 args.lives, args.seed)
+                ok &= is_equal
+                print(f"{name:<10}{engine:<8}{str(start_year_idx):>12}"
+                      f"{str(is_equal):>8}")
+    print("一致しました" if ok else "一致しない結果があります")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
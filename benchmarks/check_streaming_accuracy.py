@@ -0,0 +1,139 @@
+"""
+ストリーミング集計(stream_mode, StreamingAssetResult)の精度が説明どおりか確認する
+
+合成した計画で、同じシードの同じライフをストリーミング集計と全ライフの保持(AssetResult)の両方で計算し、
+- get_quantile: 順序統計量x_(floor(q*(n-1)))に対する相対誤差がrelative_accuracy以内
+  (|資産額| < min_valueの場合は絶対誤差min_value未満)
+- get_achive_ratio: thresholdsの金額(破産率の0を含む)は厳密に一致し、
+  それ以外の金額Tは全ライフでの T/(1-relative_accuracy) 以上の割合と T/(1+relative_accuracy) 以上の割合の間
+- get_crash_ratio: 厳密に一致
+をrelative_accuracyごとに確認し、満たさない場合は終了コード1にする。
+
+    python benchmarks/check_streaming_accuracy.py
+    python benchmarks/check_streaming_accuracy.py --lives 50000 --block-size 5000
+"""
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "asset_src"))
+sys.path.append(BENCHMARK_DIR)
+
+from asset_result import AssetResult
+from assetsim import AssetSim
+from random_generator import make_rng
+import synthetic
+
+QUANTILES = (0.01, 0.1, 0.3, 0.5, 0.7, 0.9, 0.99)
+# thresholdsに指定する金額と、スケッチから推定する金額
+THRESHOLDS = (0, 50000000)
+ESTIMATED_THRESHOLDS = (10000000, 30000000, 100000000)
+# 浮動小数点の丸めの許容誤差
+EPS = 1e-9
+
+
+def get_results(AS_cond, lives, block_size, relative_accuracy, seed):
+    """
+    同じライフの(ストリーミング集計, 全ライフの結果)を返す
+    (ストリーミング集計はblock_sizeずつ計算するため、全ライフの結果も同じ順にブロックで計算して結合する)
+    """
+    AS = AssetSim(**AS_cond, rng=make_rng(seed))
+    AS.get_multi_role_play_assets_stream(lives,
+                                         block_size=block_size,
+                                         thresholds=THRESHOLDS,
+                                         relative_accuracy=relative_accuracy)
+    stream = AS.result
+    AS = AssetSim(**AS_cond, rng=make_rng(seed))
+    results = []
+    for start in range(0, lives, block_size):
+        AS.get_multi_role_play_assets_vector(min(block_size, lives - start))
+        results.append(AS.result)
+    return stream, AssetResult.concatenate(results)
+
+
+def get_crash_ratio(AS_cond, result):
+    AS = AssetSim(**AS_cond)
+    AS.set_result(result)
+    return AS.get_crash_ratio()["crash_ratio"].to_numpy()
+
+
+def check(AS_cond, lives, block_size, relative_accuracy, seed):
+    """
+    {項目: (最大の誤差, 満たしているか)}を返す
+    """
+    stream, exact = get_results(AS_cond, lives, block_size, relative_accuracy,
+                                seed)
+    checks = {}
+
+    quantile_errors = []
+    for q in QUANTILES:
+        estimate = stream.get_quantile(q)
+        order_stat = np.array([
+            np.quantile(row, q, method="lower") for row in exact.total
+        ])
+        is_small = np.abs(order_stat) < stream.min_value
+        error = np.abs(estimate - order_stat)
+        relative_error = np.where(is_small, 0.0,
+                                  error / np.maximum(np.abs(order_stat), 1))
+        quantile_errors.append(
+            (relative_error.max(),
+             np.all(np.where(is_small, error < stream.min_value,
+                             relative_error <= relative_accuracy + EPS))))
+    checks["quantile"] = (max(e for e, _ in quantile_errors),
+                          all(ok for _, ok in quantile_errors))
+
+    threshold_error = max(
+        np.abs(stream.get_achive_ratio(threshold) -
+               exact.get_achive_ratio(threshold)).max()
+        for threshold in THRESHOLDS)
+    checks["achive_ratio(thresholds)"] = (threshold_error,
+                                          threshold_error == 0)
+
+    estimated_errors = []
+    for threshold in ESTIMATED_THRESHOLDS:
+        estimate = stream.get_achive_ratio(threshold)
+        lower = exact.get_achive_ratio(threshold / (1 - relative_accuracy))
+        upper = exact.get_achive_ratio(threshold / (1 + relative_accuracy))
+        estimated_errors.append(
+            (np.abs(estimate - exact.get_achive_ratio(threshold)).max(),
+             np.all((lower - EPS <= estimate) & (estimate <= upper + EPS))))
+    checks["achive_ratio(estimated)"] = (max(e for e, _ in estimated_errors),
+                                         all(ok
+                                             for _, ok in estimated_errors))
+
+    crash_error = np.abs(
+        get_crash_ratio(AS_cond, stream) -
+        get_crash_ratio(AS_cond, exact)).max()
+    checks["crash_ratio"] = (crash_error, crash_error == 0)
+    return checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストリーミング集計の精度を確認する")
+    parser.add_argument("--lives", type=int, default=20000)
+    parser.add_argument("--block-size", type=int, default=3000)
+    parser.add_argument("--years", type=int, default=70)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'accuracy':<10}{'check':<26}{'max error':>12}{'ok':>6}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        AS_cond = synthetic.make_as_cond(f"{tmp_dir}/plan.csv", args.years, 2)
+        for relative_accuracy in (0.01, 0.05):
+            checks = check(AS_cond, args.lives, args.block_size,
+                           relative_accuracy, args.seed)
+            for name, (error, is_ok) in checks.items():
+                ok &= bool(is_ok)
+                print(f"{relative_accuracy:<10}{name:<26}{error:>12.5f}"
+                      f"{str(bool(is_ok)):>6}")
+    print("精度の範囲内です" if ok else "精度の範囲外の結果があります")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+engine=jitのカーネル(year_kernel)の結果がAssetSimの計算と一致するか確認する
+
+合成した計画・利回り分布で、同じシードの一様乱数から
+- engine=vector(get_multi_role_play_assets_vector)の結果と完全に一致するか
+- 各ライフ・各年の利回りを固定してAssetSim.update_assets_one_yearで一人生ずつ計算した結果と一致するか
+をカーネル(numba(インストールされている場合), numpy, python)・sampling・銘柄数ごとに確認し、
+一致しない場合は終了コード1にする。
+
+    python benchmarks/check_year_kernel.py
+    python benchmarks/check_year_kernel.py --lives 500 --years 40
+"""
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "asset_src"))
+sys.path.append(BENCHMARK_DIR)
+
+from assetsim import AssetSim
+from random_generator import make_rng
+from return_sampler import SAMPLING_METHODS, JointReturnSampler
+from year_kernel import HAS_NUMBA
+import synthetic
+
+
+def make_joint_sampler(stock_names, n_periods: int = 50, seed: int = 0):
+    """
+    合成した複数銘柄の利回りの表(最初の2銘柄)のJointReturnSampler
+    """
+    rng = np.random.default_rng(seed)
+    names = stock_names[:2]
+    return JointReturnSampler(rng.normal(0.05, 0.15, (n_periods, len(names))),
+                              rng.random(n_periods) + 0.1, names)
+
+
+def get_reference_result(AS: AssetSim, rate):
+    """
+    各ライフ・各年の利回りをrate((年数, ライフ数))に固定し、
+    AssetSim.update_assets_one_yearで一人生ずつ計算した各年の総資産((年数, ライフ数))
+    """
+    total = np.empty_like(rate)
+    plan = AS.plan
+    for i in range(rate.shape[1]):
+        AS.initialize()
+        for t in range(len(plan)):
+            # 利回りの選択だけを固定した利回りに置き換える
+            AS._get_profit_a_year = lambda _, r=rate[t, i]: (
+                AS.invest_asset * r, r)
+            *_, total[t, i] = AS.update_assets_one_year(
+                plan.inflated_cost[t], plan.income[t],
+                plan.saving_per_year[t], plan.invest_per_year[t],
+                plan.weights[t])
+    return total
+
+
+def check(AS_cond, kernel, sampling, lives, seed):
+    """
+    (vectorと完全に一致するか, 一人生ずつの計算との最大相対誤差)を返す
+    """
+    AS = AssetSim(**AS_cond, rng=make_rng(seed), sampling=sampling)
+    AS.get_multi_role_play_assets_vector(lives)
+    expected = AS.result
+    AS = AssetSim(**AS_cond, rng=make_rng(seed), sampling=sampling)
+    # 年を分けてカーネルを呼ぶ場合も確認するため、一様乱数を小さいブロックで引く
+    AS.get_multi_role_play_assets_jit(lives,
+                                      kernel=kernel,
+                                      max_uniforms=lives * 7)
+    result = AS.result
+    is_equal = all(
+        np.array_equal(expected.planes[field], result.planes[field])
+        for field in expected.planes)
+    reference = get_reference_result(AS, result.rate)
+    error = np.max(
+        np.abs(reference - result.total) / np.maximum(np.abs(reference), 1))
+    return is_equal, float(error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engine=jitのカーネルの結果を確認する")
+    parser.add_argument("--lives", type=int, default=300)
+    parser.add_argument("--years", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    kernels = ["numba", "numpy", "python"] if HAS_NUMBA else ["numpy", "python"]
+    if not HAS_NUMBA:
+        print("numbaがインストールされていないため、numbaのカーネルは確認しません")
+    ok = True
+    print(f"{'kernel':<8}{'stocks':<8}{'joint':<7}{'sampling':<12}"
+          f"{'vector':>8}{'max rel. error':>16}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_stocks in (1, 3):
+            AS_cond = synthetic.make_as_cond(
+                f"{tmp_dir}/plan_{n_stocks}s.csv", args.years, n_stocks)
+            for joint in (False, True):
+                if joint and n_stocks == 1:
+                    continue
+                AS_cond["joint_return_distribution"] = make_joint_sampler(
+                    list(AS_cond["return_distribution_dict"])) if joint else None
+                for kernel in kernels:
+                    for sampling in SAMPLING_METHODS:
+                        is_equal, error = check(AS_cond, kernel, sampling,
+                                                args.lives, args.seed)
+                        ok &= is_equal and error < 1e-12
+                        print(f"{kernel:<8}{n_stocks:<8}{str(joint):<7}"
+                              f"{sampling:<12}{str(is_equal):>8}"
+                              f"{error:>16.2e}")
+    print("一致しました" if ok else "一致しない結果があります")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
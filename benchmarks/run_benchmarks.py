@@ -0,0 +1,293 @@
+"""
+シミュレーション・databaseの作成・描画の主要な処理の時間を計測するベンチマーク
+
+合成した計画(年数・銘柄数を変える)で各処理を計測し、結果をhistory.jsonに追記する。
+前回の結果より遅くなった処理があれば表示する(--fail-on-regressionで終了コード1)。
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --quick --filter multi_role_play
+    python benchmarks/run_benchmarks.py --repeat 5 --threshold 1.2 --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "asset_src"))
+sys.path.append(BENCHMARK_DIR)
+
+from assetsim import AssetSim
+from input_generator import InputGenerator
+from random_generator import make_rng
+import synthetic
+
+DEFAULT_HISTORY = os.path.join(BENCHMARK_DIR, "history.json")
+PLOT_METHODS = ("plot_role_play_assets", "plot_asset_distribution",
+                "plot_achive_ratio", "plot_asset_transition",
+                "plot_crash_ratio")
+
+
+class Case:
+    """
+    計測する処理
+    - setup: 計測しない準備を行い、計測する引数なしの関数を返す
+    - quick: --quickでも計測するか
+    """
+
+    def __init__(self, name: str, setup, quick: bool = True):
+        self.name = name
+        self.setup = setup
+        self.quick = quick
+
+
+def _make_as(tmp_dir, n_years: int, n_stocks: int, seed: int = 0):
+    AS_cond = synthetic.make_as_cond(
+        f"{tmp_dir}/plan_{n_years}y_{n_stocks}s.csv", n_years, n_stocks)
+    return AssetSim(**AS_cond, rng=make_rng(seed))
+
+
+def get_cases(tmp_dir):
+    cases = []
+    for n_years, n_stocks in ((30, 1), (70, 2), (70, 8)):
+        plan = f"years={n_years},stocks={n_stocks}"
+
+        def setup(n_years=n_years, n_stocks=n_stocks):
+            return _make_as(tmp_dir, n_years, n_stocks).get_role_play_assets
+
+        cases.append(Case(f"get_role_play_assets[{plan}]", setup))
+
+        def setup(n_years=n_years, n_stocks=n_stocks):
+            AS = _make_as(tmp_dir, n_years, n_stocks)
+            weights = AS.plan.weights[0].tolist()
+            # 1000回分の年の利回りの選択
+            return lambda: [AS._get_profit_a_year(weights) for _ in range(1000)]
+
+        cases.append(Case(f"_get_profit_a_year_x1000[{plan}]", setup))
+
+        def setup(n_years=n_years, n_stocks=n_stocks):
+            csv_in = synthetic.write_asset_plan(
+                f"{tmp_dir}/parse_{n_years}y_{n_stocks}s.csv", n_years,
+                n_stocks)
+            return lambda: InputGenerator().get_asset_plan(csv_in)
+
+        cases.append(Case(f"InputGenerator.get_asset_plan[{plan}]", setup))
+
+    for n in (1000, 10000, 100000):
+
+        def setup(n=n):
+            AS = _make_as(tmp_dir, 70, 2)
+            return lambda: AS.get_multi_role_play_assets(n, engine="vector")
+
+        cases.append(
+            Case(f"get_multi_role_play_assets[vector,n={n}]", setup,
+                 quick=n <= 10000))
+
+    for n in (10000, 100000):
+
+        def setup(n=n):
+            AS = _make_as(tmp_dir, 70, 2)
+            # numbaのコンパイル時間を含めないため一度実行しておく
+            AS.get_multi_role_play_assets(10, engine="jit")
+            return lambda: AS.get_multi_role_play_assets(n, engine="jit")
+
+        cases.append(
+            Case(f"get_multi_role_play_assets[jit,n={n}]", setup,
+                 quick=n <= 10000))
+
+    def setup():
+        AS = _make_as(tmp_dir, 70, 2)
+        return lambda: AS.get_multi_role_play_assets(1000, engine="python")
+
+    cases.append(
+        Case("get_multi_role_play_assets[python,n=1000]", setup, quick=False))
+
+    for n in (10000, 100000):
+
+        def setup(n=n):
+            AS = _make_as(tmp_dir, 70, 2)
+            AS.get_multi_role_play_assets(n, engine="vector")
+            return lambda: AS.get_asset_transition([10, 50, 90, 99])
+
+        cases.append(
+            Case(f"get_asset_transition[n={n}]", setup, quick=n <= 10000))
+
+    for num_trials in (10000, 100000):
+
+        def setup(num_trials=num_trials):
+            from create_database import monthly_to_annual_returns
+
+            monthly_return_rates = synthetic.make_monthly_returns()
+            return lambda: monthly_to_annual_returns(
+                monthly_return_rates, bins=50, rng=make_rng(0),
+                num_trials=num_trials)
+
+        cases.append(
+            Case(f"monthly_to_annual_returns[num_trials={num_trials}]",
+                 setup,
+                 quick=num_trials <= 10000))
+
+    for mode in ("matplotlib", "plotly"):
+        for method in PLOT_METHODS:
+
+            def setup(mode=mode, method=method):
+                AS = _make_as(tmp_dir, 70, 2)
+                AS.get_role_play_assets()
+                AS.get_multi_role_play_assets(10000, engine="vector")
+                args = {
+                    "plot_asset_distribution": (AS.get_years()[30], ),
+                    "plot_achive_ratio": (50000000, ),
+                    "plot_asset_transition": ([50, 90, 99], ),
+                }.get(method, ())
+                save_name = f"{tmp_dir}/{mode}_{method}"
+                return lambda: getattr(AS, method)(
+                    *args, save_name=save_name, is_show=False, mode=mode)
+
+            cases.append(Case(f"{method}[{mode},n=10000]", setup))
+    return cases
+
+
+def measure(func, repeat: int):
+    """
+    funcをrepeat回実行した時間(秒)の{min, median, mean}を返す
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return {
+        "min": min(seconds),
+        "median": float(np.median(seconds)),
+        "mean": float(np.mean(seconds)),
+        "repeat": repeat
+    }
+
+
+def get_commit():
+    """
+    現在のcommit(作業ツリーに変更がある場合は末尾に+dirty)
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                cwd=ROOT_DIR,
+                                check=True,
+                                capture_output=True,
+                                text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."],
+                               cwd=ROOT_DIR,
+                               check=True,
+                               capture_output=True,
+                               text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+dirty" if dirty else "")
+
+
+def load_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_history(history, history_path):
+    with open(history_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=1, ensure_ascii=False)
+
+
+def get_previous_results(history):
+    """
+    各処理の最新の結果(--filterなどで一部だけ計測した回も含めて、処理ごとに最後に計測した結果)
+    """
+    previous_results = {}
+    for entry in history:
+        previous_results.update(entry["results"])
+    return previous_results
+
+
+def find_regressions(results, previous_results, threshold: float):
+    """
+    前回よりminの時間がthreshold倍以上になった処理{名前: 倍率}
+    """
+    regressions = {}
+    for name, result in results.items():
+        if name in previous_results:
+            ratio = result["min"] / previous_results[name]["min"]
+            if ratio >= threshold:
+                regressions[name] = ratio
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主要な処理の時間を計測する")
+    parser.add_argument("--repeat", type=int, default=3, help="各処理の計測回数")
+    parser.add_argument("--quick",
+                        action="store_true",
+                        help="時間のかかる処理(10万ライフなど)を計測しない")
+    parser.add_argument("--filter",
+                        default=None,
+                        help="名前にこの文字列を含む処理だけを計測する")
+    parser.add_argument("--history",
+                        default=DEFAULT_HISTORY,
+                        help="結果を追記するjson")
+    parser.add_argument("--no-save",
+                        action="store_true",
+                        help="結果をhistoryに追記しない")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=1.2,
+                        help="前回の何倍以上の時間を遅くなったとみなすか")
+    parser.add_argument("--fail-on-regression",
+                        action="store_true",
+                        help="遅くなった処理があれば終了コード1にする")
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    previous_results = get_previous_results(history)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = [
+            case for case in get_cases(tmp_dir)
+            if (case.quick or not args.quick) and (
+                args.filter is None or args.filter in case.name)
+        ]
+        print(f"{'benchmark':<55}{'min [s]':>10}{'median [s]':>12}"
+              f"{'previous':>10}")
+        for case in cases:
+            result = measure(case.setup(), args.repeat)
+            results[case.name] = result
+            previous = previous_results.get(case.name, {}).get("min")
+            previous = f"{result['min'] / previous:>9.2f}x" if previous else ""
+            print(f"{case.name:<55}{result['min']:>10.4f}"
+                  f"{result['median']:>12.4f}{previous:>10}")
+
+    regressions = find_regressions(results, previous_results, args.threshold)
+    for name, ratio in regressions.items():
+        print(f"遅くなりました: {name} ({ratio:.2f}x)")
+
+    if not args.no_save:
+        history.append({
+            "commit": get_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "quick": args.quick,
+            "results": results
+        })
+        save_history(history, args.history)
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+
+if __name__ == "__main__":
+    main()
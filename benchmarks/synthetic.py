@@ -0,0 +1,77 @@
+"""
+ベンチマーク用の合成データ(asset_plan.csv・利回り分布)
+"""
+import numpy as np
+import pandas as pd
+
+from input_generator import InputGenerator
+
+
+def get_stock_names(n_stocks: int):
+    return [f"STOCK{i}" for i in range(n_stocks)]
+
+
+def make_return_distribution(mean: float = 7.0,
+                             std: float = 18.0,
+                             bins: int = 50):
+    """
+    database/*.csvと同じ形式(rate[%], Share)の正規分布に近い利回り分布
+    """
+    rate = np.linspace(mean - 3 * std, mean + 3 * std, bins)
+    share = np.exp(-0.5 * ((rate - mean) / std)**2)
+    return pd.DataFrame({"rate": rate, "Share": share / share.sum()})
+
+
+def make_asset_plan_df(n_years: int,
+                       n_stocks: int,
+                       initial_year: int = 2025,
+                       retire_after: int = 35):
+    """
+    asset_plan.csvと同じ列の計画(投資比率は均等、retire_after年後から収入0)
+    """
+    years = np.arange(n_years)
+    is_working = years < retire_after
+    plan_df = pd.DataFrame({
+        k: np.full(n_years, 1 / n_stocks)
+        for k in get_stock_names(n_stocks)
+    })
+    plan_df["age"] = 30 + years
+    plan_df["year"] = initial_year + years
+    plan_df["income"] = np.where(is_working, 5000000 + 50000 * years, 0)
+    plan_df["saving_per_year"] = np.where(is_working, 200000, 0)
+    plan_df["invest_per_year"] = np.where(is_working, 600000, 0)
+    plan_df["outcome_1"] = np.where(is_working, 3500000, 2500000)
+    plan_df["outcome_2"] = 0
+    return plan_df
+
+
+def write_asset_plan(csv_out, n_years: int, n_stocks: int):
+    make_asset_plan_df(n_years, n_stocks).to_csv(csv_out, index=False)
+    return csv_out
+
+
+def make_as_cond(csv_out, n_years: int, n_stocks: int):
+    """
+    合成した計画をcsv_outに書き出し、InputGeneratorで読み込んだAssetSimの引数を返す
+    """
+    write_asset_plan(csv_out, n_years, n_stocks)
+    _, asset_plan, _, invest_plan = InputGenerator().get_asset_plan(csv_out)
+    return {
+        "return_distribution_dict": {
+            k: make_return_distribution(mean=5.0 + i, std=15.0 + 2 * i)
+            for i, k in enumerate(get_stock_names(n_stocks))
+        },
+        "invest_plan": invest_plan,
+        "asset_plan": asset_plan,
+        "initial_year": 2025,
+        "initial_cash": 2500000,
+        "initial_invest_asset": 0,
+        "inflation_rate": 1.02
+    }
+
+
+def make_monthly_returns(n_months: int = 600, seed: int = 0):
+    """
+    月次利回り[%]の合成データ
+    """
+    return np.random.default_rng(seed).normal(0.7, 4.5, n_months)
@@ -1,35 +1,47 @@
-import os, glob, sys
+import os, glob, sys, zlib
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(f"{os.path.dirname(os.path.abspath(__file__))}/asset_src")
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from tqdm import tqdm
 
+from asset_src.random_generator import make_rng
+from asset_src.tbase_for_asset import save_dict_as_json, read_json_as_dict, get_file_hash
+
+# 利回り分布の作成方法を変えたときに上げる(manifestが古いものは作り直す)
+DATABASE_BUILDER_VERSION = 1
 
-def monthly_to_annual_returns(monthly_return_rates, bins=100):
+
+def monthly_to_annual_returns(monthly_return_rates,
+                              bins=100,
+                              rng=None,
+                              num_trials=10000):
     """
     return_ratesからhistの頻度に従った確率である月リターン率を計算する。
     それを12回繰り返して年次の利益率を計算
-    それを10000回行って年間のreturnsの頻度と利益率の分布データを得る
+    それをnum_trials回行って年間のreturnsの頻度と利益率の分布データを得る
     ヒストグラムの頻度から確率分布を作成
     ヒストグラム（bin=20）で分布データを作成
+    rng: 乱数生成器(numpy.random.Generator)。Noneの場合はシードなしで作成する
     """
+    if rng is None:
+        rng = make_rng()
     monthly_return_rates = monthly_return_rates / 100  # パーセントから小数に変換
     hist, bin_edges = np.histogram(monthly_return_rates, bins)
     monthly_prob = hist / np.sum(hist)
     monthly_return_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
-    annual_return_rates = []
-    num_trials = 10000
     months_per_year = 12
 
-    for _ in tqdm(range(num_trials)):
-        # 12ヶ月分の月次リターンをヒストグラムの確率分布からサンプリング
-        sampled_monthly_return_rates = np.random.choice(monthly_return_centers,
-                                                        size=months_per_year,
-                                                        p=monthly_prob)
-        # 年次リターンを計算（複利計算）
-        annual_return_rate = (np.prod(1 + sampled_monthly_return_rates) -
-                              1) * 100  # 年率に変換
-        annual_return_rates.append(annual_return_rate)
+    # 全試行の12ヶ月分の月次リターンをヒストグラムの確率分布から一度にサンプリング
+    sampled_monthly_return_rates = rng.choice(monthly_return_centers,
+                                              size=(num_trials,
+                                                    months_per_year),
+                                              p=monthly_prob)
+    # 年次リターンを計算（複利計算）
+    annual_return_rates = (np.prod(1 + sampled_monthly_return_rates, axis=1) -
+                           1) * 100  # 年率に変換
     return annual_return_rates
 
 
@@ -38,7 +50,9 @@ def get_annual_return_distribution(macrotrends_dir,
                                    name,
                                    bins=100,
                                    monthly_histogram=True,
-                                   annual_histogram=True):
+                                   annual_histogram=True,
+                                   rng=None,
+                                   num_trials=10000):
     """
     macrotrends_dir: Macrotrendsのデータが保存されているディレクトリ
     database_dir: 結果を保存するディレクトリ
@@ -46,6 +60,8 @@ def get_annual_return_distribution(macrotrends_dir,
     bins: ヒストグラムのビン数
     monthly_histogram: 月次リターンのヒストグラムを表示するかどうか
     annual_histogram: 年次リターンのヒストグラムを表示するかどうか
+    rng: 乱数生成器(numpy.random.Generator)
+    num_trials: 年次リターンを作成する試行回数
     """
     df = pd.read_csv(f"{macrotrends_dir}/{name}.csv")
     monthly_data = df["Value"].to_list()
@@ -54,7 +70,8 @@ def get_annual_return_distribution(macrotrends_dir,
     monthly_returns_rate = 100 * (monthly_data[1:] -
                                   monthly_data[:-1]) / monthly_data[:-1]
 
-    annual_return_rates = monthly_to_annual_returns(monthly_returns_rate, bins)
+    annual_return_rates = monthly_to_annual_returns(monthly_returns_rate, bins,
+                                                    rng, num_trials)
 
     annual_hist, bin_edges = np.histogram(annual_return_rates, bins)
     annual_return_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
@@ -88,6 +105,137 @@ def get_annual_return_distribution(macrotrends_dir,
         plt.close()
 
 
+def _build_one(macrotrends_dir, database_dir, name, bins, num_trials, seed):
+    """
+    1銘柄の利回り分布を作成する(ProcessPoolExecutorから呼ぶ)
+    seedが同じなら、一緒に作成する銘柄や順番によらず同じ分布になるよう銘柄名から乱数を作る
+    """
+    seed_sequence = None if seed is None else np.random.SeedSequence(
+        seed, spawn_key=(zlib.crc32(name.encode("utf-8")), ))
+    get_annual_return_distribution(macrotrends_dir,
+                                   database_dir,
+                                   name,
+                                   bins,
+                                   monthly_histogram=False,
+                                   annual_histogram=False,
+                                   rng=make_rng(seed_sequence),
+                                   num_trials=num_trials)
+    return name
+
+
+def build_database(macrotrends_dir,
+                   database_dir,
+                   names=None,
+                   bins=50,
+                   num_trials=10000,
+                   seed=0,
+                   workers=None,
+                   force=False):
+    """
+    macrotrends_dirの月足データから全銘柄の利回り分布をdatabase_dirに並列で作成する
+    - 前回の作成時から月足データの中身(sha256)・bins・num_trials・seedが変わっていない銘柄は作成しない
+    - 作成条件は{database_dir}/manifest.jsonに記録する
+    names: 作成する銘柄の名前のリスト(Noneの場合はmacrotrends_dirの全銘柄)
+    workers: 並列に作成するプロセス数(Noneの場合はCPU数)
+    force: Trueの場合は変更がなくても作成する
+    作成した銘柄の名前のリストを返す
+    """
+    if names is None:
+        names = sorted(
+            os.path.splitext(os.path.basename(csv_in))[0]
+            for csv_in in glob.glob(f"{macrotrends_dir}/*.csv"))
+    manifest_path = f"{database_dir}/manifest.json"
+    manifest = read_json_as_dict(manifest_path) if os.path.exists(
+        manifest_path) else {}
+    sources = manifest.get("sources", {})
+
+    build_cond = {
+        "version": DATABASE_BUILDER_VERSION,
+        "bins": bins,
+        "num_trials": num_trials,
+        "seed": seed
+    }
+    source_hashes = {
+        name: get_file_hash(f"{macrotrends_dir}/{name}.csv")
+        for name in names
+    }
+    build_names = [
+        name for name in names
+        if force or not os.path.exists(f"{database_dir}/{name}.csv")
+        or sources.get(name) != {
+            "sha256": source_hashes[name],
+            **build_cond
+        }
+    ]
+    for name in sorted(set(names) - set(build_names)):
+        print(f"Skip {name} (unchanged)")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_build_one, macrotrends_dir, database_dir, name,
+                            bins, num_trials, seed) for name in build_names
+        ]
+        for future in futures:
+            name = future.result()
+            print(f"Built {name}")
+            sources[name] = {"sha256": source_hashes[name], **build_cond}
+
+    manifest["sources"] = dict(sorted(sources.items()))
+    save_dict_as_json(manifest, manifest_path)
+    return build_names
+
+
+def get_monthly_return_series(macrotrends_dir, name):
+    """
+    月足データから月ごとの利益率(小数)のSeries(indexは月)を作成する
+    データが欠けている月の前後はNaNになる
+    """
+    df = pd.read_csv(f"{macrotrends_dir}/{name}.csv")
+    month = pd.to_datetime(df["Date"]).dt.to_period("M")
+    values = pd.Series(df["Value"].to_numpy(dtype=np.float64), index=month)
+    # 同じ月のデータはその月の最初のデータ行を採用する
+    values = values[~values.index.duplicated()]
+    values = values.reindex(
+        pd.period_range(values.index.min(), values.index.max(), freq="M"))
+    return values.pct_change(fill_method=None)
+
+
+def get_joint_return_table(macrotrends_dir,
+                           database_dir,
+                           names,
+                           file_name="joint_returns"):
+    """
+    複数銘柄の同じ12ヶ月間の年間利回り(%)の表を作成する(移動ブロック・ブートストラップ用)
+    - 全銘柄のデータがそろっている月について、連続する12ヶ月の月次リターンを複利で年率にする
+      (開始月を1ヶ月ずつずらした全期間を行とする)
+    - 同じ行の利回りを一緒に選ぶことで、銘柄間の相関・月の並びを保ったまま年次リターンを選べる
+    - 出力: {database_dir}/{file_name}.csv(列: start, 各銘柄, Share)
+    macrotrends_dir: Macrotrendsの月足データが保存されているディレクトリ
+    database_dir: 結果を保存するディレクトリ
+    names: 銘柄の名前のリスト(例: ["SP500", "NASDAQ"])
+    """
+    months_per_year = 12
+    monthly_returns = pd.concat(
+        {
+            name: get_monthly_return_series(macrotrends_dir, name)
+            for name in names
+        },
+        axis=1)
+    # 欠けている月を含む12ヶ月はNaNになる
+    annual_log_returns = np.log1p(monthly_returns).rolling(
+        months_per_year).sum()
+    annual_return_rates = 100 * np.expm1(annual_log_returns.dropna())
+
+    result_df = annual_return_rates.reset_index(drop=True)
+    result_df.insert(
+        0, "start",
+        (annual_return_rates.index - (months_per_year - 1)).astype(str))
+    # 各期間を同じ確率で選ぶ
+    result_df["Share"] = 1 / len(result_df)
+    result_df.to_csv(f"{database_dir}/{file_name}.csv", index=False)
+    return result_df
+
+
 def m2y_example():
     maindir = os.path.dirname(os.path.abspath(__file__))
     macrotrends_dir = glob.glob(f"{maindir}/macrotrends_m")[0]
@@ -96,6 +244,8 @@ def m2y_example():
     # names = ["SP500", "NASDAQ", "DowJones", "Nikkei225"]
     names = ["Nikkei225"]
     bins = 50
+    # seedを固定すると同じデータベースを再作成できる
+    rng = make_rng(seed=0, bit_generator="PCG64")
     for name in names:
         print(f"Processing {name}...")
         get_annual_return_distribution(macrotrends_dir,
@@ -103,7 +253,8 @@ def m2y_example():
                                        name,
                                        bins,
                                        monthly_histogram=False,
-                                       annual_histogram=True)
+                                       annual_histogram=True,
+                                       rng=rng)
 
 
 def d2m(input_path, output_path, name):
@@ -156,8 +307,26 @@ def detail2d_example():
         detail2d(input_path, output_path, name)
 
 
+def build_example():
+    maindir = os.path.dirname(os.path.abspath(__file__))
+    macrotrends_dir = f"{maindir}/macrotrends_m"
+    database_dir = f"{maindir}/database"
+    names = ["SP500", "NASDAQ", "DowJones", "Nikkei225"]
+    build_database(macrotrends_dir, database_dir, names, bins=50, seed=0)
+
+
+def joint_example():
+    maindir = os.path.dirname(os.path.abspath(__file__))
+    macrotrends_dir = f"{maindir}/macrotrends_m"
+    database_dir = f"{maindir}/database"
+    names = ["SP500", "NASDAQ", "DowJones", "Nikkei225"]
+    get_joint_return_table(macrotrends_dir, database_dir, names)
+
+
 if __name__ == "__main__":
     # m2y_example()
+    # build_example()
+    # joint_example()
     # d2m_example()
     # detail2d_example()
     pass